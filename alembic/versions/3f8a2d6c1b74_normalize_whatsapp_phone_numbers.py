@@ -0,0 +1,57 @@
+"""Normalize WhatsApp user phone numbers
+
+Numbers registered one at a time were stored as sent ("+44 7700 900123"),
+while the bulk import and the webhook use digits only ("447700900123"), so
+the webhook never found those users. This rewrites them the way
+normalize_phone_number does: formatting removed, then a leading "+" or
+"00". Rows are left as they are when the result is not a valid number or
+is already registered (to the same or another organization); those need
+merging by hand.
+
+Revision ID: 3f8a2d6c1b74
+Revises: 9c2e6f1a8d53
+Create Date: 2024-12-20 11:02:53.174620
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f8a2d6c1b74'
+down_revision: Union[str, None] = '9c2e6f1a8d53'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute(r"""
+        WITH candidates AS (
+            SELECT phone_number, normalized
+            FROM (
+                SELECT phone_number,
+                       regexp_replace(regexp_replace(phone_number, '[[:space:]().-]', '', 'g'), '^(\+|00)', '')
+                           AS normalized
+                FROM whatsapp_users
+            ) numbers
+            WHERE normalized <> phone_number AND normalized ~ '^[1-9][0-9]{7,14}$'
+        ),
+        -- Each normalized number may only be taken once, and not if it exists
+        renames AS (
+            SELECT DISTINCT ON (normalized) phone_number, normalized
+            FROM candidates c
+            WHERE NOT EXISTS (SELECT 1 FROM whatsapp_users u WHERE u.phone_number = c.normalized)
+            ORDER BY normalized, phone_number
+        )
+        UPDATE whatsapp_users u
+        SET phone_number = r.normalized
+        FROM renames r
+        WHERE u.phone_number = r.phone_number
+    """)
+
+
+def downgrade() -> None:
+    # The original formatting is not kept, so there is nothing to restore
+    pass
@@ -0,0 +1,48 @@
+"""Make created_at NOT NULL on paginated tables
+
+whatsapp_users and knowledge_bases are paged by (created_at, primary key)
+with a row comparison, which never matches a NULL, so rows without a
+created_at were skipped. The column always had a now() default; rows that
+still lack one get the migration time.
+
+Revision ID: 5d0b7e2a9c61
+Revises: 3f8a2d6c1b74
+Create Date: 2024-12-20 15:40:12.508311
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d0b7e2a9c61'
+down_revision: Union[str, None] = '3f8a2d6c1b74'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ("whatsapp_users", "knowledge_bases")
+
+
+def upgrade() -> None:
+    for table in TABLES:
+        op.execute(f"UPDATE {table} SET created_at = now() WHERE created_at IS NULL")
+        op.alter_column(
+            table,
+            "created_at",
+            existing_type=sa.DateTime(timezone=True),
+            existing_server_default=sa.text("now()"),
+            nullable=False
+        )
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        op.alter_column(
+            table,
+            "created_at",
+            existing_type=sa.DateTime(timezone=True),
+            existing_server_default=sa.text("now()"),
+            nullable=True
+        )
@@ -0,0 +1,37 @@
+"""Usage rollup tables
+
+Revision ID: 7b1d5c3e9a40
+Revises: e4c92217bd92
+Create Date: 2024-12-18 10:12:41.503217
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7b1d5c3e9a40'
+down_revision: Union[str, None] = 'e4c92217bd92'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+ROLLUP_TABLES = ('usage_rollups_hourly', 'usage_rollups_daily', 'usage_rollups_monthly')
+
+
+def upgrade() -> None:
+    for table in ROLLUP_TABLES:
+        op.create_table(table,
+        sa.Column('organization_id', sa.UUID(), nullable=False),
+        sa.Column('bucket', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('metric_type', sa.String(), nullable=False),
+        sa.Column('value', sa.BigInteger(), nullable=False),
+        sa.ForeignKeyConstraint(['organization_id'], ['organizations.id'], ),
+        sa.PrimaryKeyConstraint('organization_id', 'bucket', 'metric_type')
+        )
+
+
+def downgrade() -> None:
+    for table in reversed(ROLLUP_TABLES):
+        op.drop_table(table)
@@ -0,0 +1,55 @@
+"""Tenant list indexes
+
+Each index leads with organization_id and continues with the keyset sort
+columns of a list endpoint, so a page is one index range scan with no sort.
+usage_metrics is no longer written (usage goes to the rollup tables, which
+their primary keys serve), so it only gets the index its list endpoint
+pages through. The lookups in deps.py filter on is_active, but they already
+reach at most one row through the api_key unique constraint and the
+phone_number primary key, so partial is_active indexes would not help them.
+
+Indexes are built CONCURRENTLY so tenants' tables stay writable while the
+migration runs.
+
+Revision ID: 9c2e6f1a8d53
+Revises: 7b1d5c3e9a40
+Create Date: 2024-12-19 09:41:07.218344
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c2e6f1a8d53'
+down_revision: Union[str, None] = '7b1d5c3e9a40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (name, table, columns)
+INDEXES = [
+    ('ix_whatsapp_users_org_created', 'whatsapp_users', ['organization_id', 'created_at', 'phone_number']),
+    ('ix_whatsapp_users_org_phone', 'whatsapp_users', ['organization_id', 'phone_number']),
+    ('ix_knowledge_bases_org_created', 'knowledge_bases', ['organization_id', 'created_at', 'id']),
+    ('ix_knowledge_bases_org_name', 'knowledge_bases', ['organization_id', 'name', 'id']),
+    ('ix_usage_metrics_org_date', 'usage_metrics', ['organization_id', 'date', 'id']),
+]
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(
+                name, table, columns,
+                postgresql_concurrently=True,
+                if_not_exists=True
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
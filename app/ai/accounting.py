@@ -0,0 +1,170 @@
+"""
+Token accounting for LLM and embedding calls, flushed to the usage rollups in bulk
+"""
+import asyncio
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy.dialects.postgresql import insert
+from app.ai.context import MESSAGE_TOKEN_OVERHEAD, count_tokens
+from app.core.config import settings
+from app.db.postgresql.database import SessionLocal
+from app.db.postgresql.models import UsageRollupDaily, UsageRollupHourly, UsageRollupMonthly
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = "text-embedding-ada-002"
+
+# Metric types recorded by the accountant itself, which usage is billed on
+QUERIES = "queries"
+PROMPT_TOKENS = "prompt_tokens"
+COMPLETION_TOKENS = "completion_tokens"
+EMBEDDING_TOKENS = "embedding_tokens"
+EMBEDDING_REQUESTS = "embedding_requests"
+SERVER_METRIC_TYPES = frozenset({QUERIES, PROMPT_TOKENS, COMPLETION_TOKENS, EMBEDDING_TOKENS, EMBEDDING_REQUESTS})
+
+# Metrics posted by clients are stored under this prefix, apart from the server's
+CLIENT_METRIC_PREFIX = "client_"
+
+ROLLUP_MODELS = {
+    "hour": UsageRollupHourly,
+    "day": UsageRollupDaily,
+    "month": UsageRollupMonthly,
+}
+
+# (organization, hour, metric type)
+UsageKey = Tuple[str, datetime, str]
+
+def bucket_start(moment: datetime, granularity: str) -> datetime:
+    """Start of the UTC hour, day or month containing moment."""
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    moment = moment.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    if granularity in ("day", "month"):
+        moment = moment.replace(hour=0)
+    if granularity == "month":
+        moment = moment.replace(day=1)
+    return moment
+
+def client_metric_type(metric_type: str) -> str:
+    """
+    Rollup metric type for a metric posted by a client
+
+    Raises ValueError for the accountant's own metric types, which clients
+    may not add to.
+    """
+    if metric_type in SERVER_METRIC_TYPES:
+        raise ValueError(f"{metric_type} is recorded by the server and cannot be posted")
+    return metric_type if metric_type.startswith(CLIENT_METRIC_PREFIX) else CLIENT_METRIC_PREFIX + metric_type
+
+class UsageAccountant:
+    """
+    Accumulates usage per (organization, hour, metric type) in memory
+
+    Recording is a dict lookup and an integer addition; token counting
+    reuses the cached tiktoken encoders. On every flush the accumulated
+    counts are added to the hourly, daily and monthly rollup tables with one
+    INSERT ... ON CONFLICT DO UPDATE per table, so the tables grow with the
+    number of organizations and buckets rather than with traffic.
+    """
+
+    def __init__(self, flush_interval: float = settings.USAGE_FLUSH_INTERVAL_SECONDS):
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pending: Dict[UsageKey, int] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, organization_id: Optional[str], metric_type: str, value: int) -> None:
+        """Add value to the organization's metric_type for the current hour."""
+        if not organization_id or not value:
+            return
+        key = (str(organization_id), bucket_start(datetime.now(timezone.utc), "hour"), metric_type)
+        with self._lock:
+            self._pending[key] = self._pending.get(key, 0) + value
+
+    def record_completion(
+        self,
+        organization_id: Optional[str],
+        prompt_tokens: int,
+        completion_tokens: int
+    ) -> None:
+        """Record one chat completion and its prompt/completion tokens."""
+        self.record(organization_id, QUERIES, 1)
+        self.record(organization_id, PROMPT_TOKENS, prompt_tokens)
+        self.record(organization_id, COMPLETION_TOKENS, completion_tokens)
+
+    def record_embedding(self, organization_id: Optional[str], texts: List[str]) -> None:
+        """Record an embedding request for texts."""
+        self.record(organization_id, EMBEDDING_REQUESTS, 1)
+        self.record(
+            organization_id,
+            EMBEDDING_TOKENS,
+            sum(count_tokens(text, EMBEDDING_MODEL) for text in texts)
+        )
+
+    @staticmethod
+    def count_prompt_tokens(messages: List[Dict[str, str]], system_prompt: Optional[str], model: str) -> int:
+        """Count prompt tokens when the API does not report usage (streaming)."""
+        tokens = sum(count_tokens(m["content"], model) + MESSAGE_TOKEN_OVERHEAD for m in messages)
+        if system_prompt:
+            tokens += count_tokens(system_prompt, model) + MESSAGE_TOKEN_OVERHEAD
+        return tokens
+
+    def _take(self) -> Dict[UsageKey, int]:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return pending
+
+    def _restore(self, pending: Dict[UsageKey, int]) -> None:
+        with self._lock:
+            for key, value in pending.items():
+                self._pending[key] = self._pending.get(key, 0) + value
+
+    def _write(self, pending: Dict[UsageKey, int]) -> None:
+        with SessionLocal() as db:
+            for granularity, model in ROLLUP_MODELS.items():
+                totals: Dict[UsageKey, int] = {}
+                for (organization_id, hour, metric_type), value in pending.items():
+                    key = (organization_id, bucket_start(hour, granularity), metric_type)
+                    totals[key] = totals.get(key, 0) + value
+                # Sorted so concurrent flushes from other workers lock rows in the same order
+                rows = [
+                    {"organization_id": organization_id, "bucket": bucket, "metric_type": metric_type, "value": value}
+                    for (organization_id, bucket, metric_type), value in sorted(totals.items())
+                ]
+                statement = insert(model).values(rows)
+                db.execute(statement.on_conflict_do_update(
+                    index_elements=[model.organization_id, model.bucket, model.metric_type],
+                    set_={"value": model.value + statement.excluded.value}
+                ))
+            # All three granularities commit together, so they never disagree
+            db.commit()
+
+    async def flush(self) -> None:
+        """Add accumulated usage to the rollups; re-queue it if the write fails."""
+        pending = self._take()
+        if not pending:
+            return
+        try:
+            await asyncio.to_thread(self._write, pending)
+        except Exception as e:
+            logger.error(f"Failed to flush usage metrics: {e}")
+            self._restore(pending)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+usage_accountant = UsageAccountant()
@@ -0,0 +1,149 @@
+"""
+Exact-match cache for LLM responses
+"""
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+def make_cache_key(
+    model: str,
+    temperature: float,
+    system_prompt: Optional[str],
+    messages: List[Dict[str, str]]
+) -> str:
+    """
+    Build a stable key for a chat completion request
+
+    Messages are normalised to the fields the model actually sees (role and
+    stripped content) so that incidental metadata does not defeat the cache.
+    """
+    normalised = [
+        [message["role"].strip().lower(), message["content"].strip()]
+        for message in messages
+        if message.get("role") in ("user", "assistant")
+    ]
+    payload = json.dumps(
+        [model, round(float(temperature), 4), (system_prompt or "").strip(), normalised],
+        ensure_ascii=False,
+        separators=(",", ":")
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """
+    Two-tier response cache: an in-process LRU and an optional Redis tier
+
+    Entries are stored with the number of tokens the original completion
+    consumed so that hits can be reported as saved tokens.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_seconds: int = 3600,
+        redis_url: Optional[str] = None,
+        key_prefix: str = "llm-cache:"
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.key_prefix = key_prefix
+        self._entries: "OrderedDict[str, Tuple[float, str, int]]" = OrderedDict()
+        self._redis = None
+        self.hits = 0
+        self.misses = 0
+
+        if redis_url:
+            try:
+                import redis.asyncio as aioredis
+                self._redis = aioredis.from_url(redis_url)
+            except ImportError:
+                logger.warning("redis is not installed; LLM cache is memory-only")
+
+    def _record(self, hit: bool, tokens: int = 0) -> None:
+        if hit:
+            self.hits += 1
+            metrics.increment("llm_cache_hits")
+            metrics.increment("llm_cache_saved_tokens", tokens)
+        else:
+            self.misses += 1
+            metrics.increment("llm_cache_misses")
+        metrics.set_gauge("llm_cache_hit_ratio", self.hit_ratio)
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def _get_local(self, key: str) -> Optional[Tuple[str, int]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, text, tokens = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return text, tokens
+
+    def _set_local(self, key: str, text: str, tokens: int, ttl: int) -> None:
+        self._entries[key] = (time.monotonic() + ttl, text, tokens)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[str]:
+        """Return the cached response text for key, or None on a miss."""
+        entry = self._get_local(key)
+
+        if entry is None and self._redis is not None:
+            try:
+                raw = await self._redis.get(self.key_prefix + key)
+            except Exception as e:
+                logger.warning(f"LLM cache read from Redis failed: {e}")
+                raw = None
+            if raw:
+                data = json.loads(raw)
+                entry = (data["text"], data.get("tokens", 0))
+                self._set_local(key, entry[0], entry[1], self.ttl_seconds)
+
+        if entry is None:
+            self._record(hit=False)
+            return None
+        self._record(hit=True, tokens=entry[1])
+        return entry[0]
+
+    async def set(self, key: str, text: str, tokens: int = 0, ttl: Optional[int] = None) -> None:
+        """Store a response, along with the tokens it cost to produce."""
+        ttl = ttl or self.ttl_seconds
+        self._set_local(key, text, tokens, ttl)
+
+        if self._redis is not None:
+            try:
+                await self._redis.set(
+                    self.key_prefix + key,
+                    json.dumps({"text": text, "tokens": tokens}),
+                    ex=ttl
+                )
+            except Exception as e:
+                logger.warning(f"LLM cache write to Redis failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hit_ratio,
+        }
+
+response_cache = ResponseCache(
+    max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.LLM_CACHE_TTL_SECONDS,
+    redis_url=settings.LLM_CACHE_REDIS_URL
+)
@@ -0,0 +1,132 @@
+"""
+Token-budgeted conversation windowing with rolling summaries
+"""
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+import tiktoken
+from app.core.config import settings
+
+# Per-message overhead of the chat format (role markers and separators)
+MESSAGE_TOKEN_OVERHEAD = 4
+
+SUMMARY_PROMPT = """
+You maintain a running summary of a WhatsApp conversation between a resident
+and an assistant. Update the existing summary with the new messages. Keep names,
+unit numbers, dates, requests and any commitments made. Reply with the updated
+summary only, in at most {max_tokens} tokens.
+"""
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str) -> tiktoken.Encoding:
+    """Return the (cached) tokenizer for a model."""
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+@lru_cache(maxsize=8192)
+def count_tokens(text: str, model: str = "gpt-4") -> int:
+    """Count the tokens in text; repeated history turns hit the LRU."""
+    return len(get_encoding(model).encode(text))
+
+def count_message_tokens(messages: List[Dict[str, str]], model: str = "gpt-4") -> int:
+    return sum(count_tokens(m["content"], model) + MESSAGE_TOKEN_OVERHEAD for m in messages)
+
+class ConversationWindow:
+    """
+    Keeps the prompt for a conversation within a fixed token budget
+
+    The most recent turns are sent verbatim. When they exceed max_tokens the
+    window is trimmed to low_water_ratio of the budget and the evicted turns
+    are folded into a rolling summary, so the summary is refreshed once every
+    few turns rather than on every message, and only from the newly evicted
+    turns.
+
+    The summary state is a plain dict ({"summary", "summarized_count"}) that
+    callers persist alongside the conversation history it indexes into. When
+    messages carry a "timestamp" the state also records "summarized_until",
+    so callers may pass only a recent slice of the history.
+    """
+
+    def __init__(
+        self,
+        llm_service: Any,
+        max_tokens: int = settings.LLM_CONTEXT_MAX_TOKENS,
+        summary_max_tokens: int = settings.LLM_SUMMARY_MAX_TOKENS,
+        low_water_ratio: float = 0.75,
+        model: str = "gpt-4"
+    ):
+        self.llm_service = llm_service
+        self.max_tokens = max_tokens
+        self.summary_max_tokens = summary_max_tokens
+        self.low_water_ratio = low_water_ratio
+        self.model = model
+
+    def _window_start(self, messages: List[Dict[str, str]], start: int) -> int:
+        """Index of the first message to send verbatim."""
+        costs = [count_tokens(m["content"], self.model) + MESSAGE_TOKEN_OVERHEAD for m in messages[start:]]
+        if sum(costs) <= self.max_tokens:
+            return start
+
+        # Over budget: keep the newest turns that fit under the low-water mark
+        budget = int(self.max_tokens * self.low_water_ratio)
+        used = 0
+        index = len(messages)
+        for cost in reversed(costs):
+            if used + cost > budget and index < len(messages):
+                break
+            used += cost
+            index -= 1
+        return index
+
+    async def _summarize(
+        self,
+        summary: str,
+        evicted: List[Dict[str, str]],
+        organization_id: Optional[str] = None
+    ) -> str:
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in evicted)
+        prompt = f"Existing summary:\n{summary or '(none)'}\n\nNew messages:\n{transcript}"
+        return await self.llm_service.generate_response(
+            [{"role": "user", "content": prompt}],
+            system_prompt=SUMMARY_PROMPT.format(max_tokens=self.summary_max_tokens),
+            organization_id=organization_id,
+            use_cache=False
+        )
+
+    @staticmethod
+    def _summarized_count(messages: List[Dict[str, str]], state: Dict[str, Any]) -> int:
+        until = state.get("summarized_until")
+        if until and messages and messages[0].get("timestamp"):
+            return sum(1 for m in messages if m.get("timestamp") and m["timestamp"] <= until)
+        return min(state.get("summarized_count", 0), len(messages))
+
+    async def build(
+        self,
+        messages: List[Dict[str, str]],
+        state: Dict[str, Any],
+        organization_id: Optional[str] = None
+    ) -> Tuple[List[Dict[str, str]], Optional[str]]:
+        """
+        Select the messages to send and refresh the rolling summary
+
+        Args:
+            messages: Full conversation history, oldest first
+            state: Summary state for this conversation, updated in place
+            organization_id: Tenant the summary's token usage is recorded against
+
+        Returns:
+            The recent messages to send verbatim and the current summary
+        """
+        summarized = self._summarized_count(messages, state)
+        start = self._window_start(messages, summarized)
+
+        if start > summarized:
+            state["summary"] = await self._summarize(
+                state.get("summary", ""), messages[summarized:start], organization_id
+            )
+            state["summarized_count"] = start
+            if messages[start - 1].get("timestamp"):
+                state["summarized_until"] = messages[start - 1]["timestamp"]
+
+        return messages[start:], state.get("summary")
@@ -1,19 +1,27 @@
 """
 Vector embeddings and Pinecone service for knowledge base management
 """
+import asyncio
 from typing import List, Dict, Any, Optional
 from pinecone.grpc import PineconeGRPC as Pinecone
 from langchain.embeddings.openai import OpenAIEmbeddings
+from app.ai.accounting import usage_accountant
+from app.ai.guard import openai_guard
 from app.core.config import settings
+from app.core.prometheus import EMBEDDED_TEXTS, EMBEDDING, VECTOR_QUERY, count, track_stage
 import logging
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def organization_id_for_namespace(namespace: str) -> Optional[str]:
+    """Tenant namespaces are named tenant_<organization id>."""
+    return namespace[len("tenant_"):] if namespace.startswith("tenant_") else None
+
 class PineconeService:
     def __init__(self, namespace: str = "default"):
         self.index_name = "whatsapp-ai-kb"
         self.namespace = namespace
+        self.organization_id = organization_id_for_namespace(namespace)
         
         # Debug logging
         logger.info(f"Using index name: {self.index_name}")
@@ -40,7 +48,15 @@ class PineconeService:
             metadatas = [{} for _ in texts]
 
         # Generate embeddings using OpenAI
-        embeddings = await self.embeddings.aembed_documents(texts)
+        organization_id = organization_id_for_namespace(namespace)
+        with track_stage(EMBEDDING, organization_id):
+            embeddings = await openai_guard.call(
+                "embeddings",
+                lambda: self.embeddings.aembed_documents(texts),
+                organization_id=organization_id
+            )
+        usage_accountant.record_embedding(organization_id, texts)
+        count(EMBEDDED_TEXTS, len(texts), organization_id)
 
         # Prepare records for upsert
         records = [{
@@ -55,7 +71,8 @@ class PineconeService:
         for i in range(0, len(records), batch_size):
             batch = records[i:i+batch_size]
             try:
-                response = self.index.upsert(
+                response = await asyncio.to_thread(
+                    self.index.upsert,
                     vectors=batch,
                     namespace=namespace
                 )
@@ -71,15 +88,24 @@ class PineconeService:
     ) -> List[Dict[str, Any]]:
         """Search for similar texts using a query string."""
         # Get the embedding for the query
-        query_embedding = await self.embeddings.aembed_query(query)
+        with track_stage(EMBEDDING, self.organization_id):
+            query_embedding = await openai_guard.call(
+                "embeddings",
+                lambda: self.embeddings.aembed_query(query),
+                organization_id=self.organization_id
+            )
+        usage_accountant.record_embedding(self.organization_id, [query])
+        count(EMBEDDED_TEXTS, 1, self.organization_id)
         
-        # Query the index with namespace
-        results = self.index.query(
-            vector=query_embedding,
-            top_k=k,
-            namespace=self.namespace,
-            include_metadata=True
-        )
+        # Query the index with namespace; the gRPC client blocks, so it runs on a thread
+        with track_stage(VECTOR_QUERY, self.organization_id):
+            results = await asyncio.to_thread(
+                self.index.query,
+                vector=query_embedding,
+                top_k=k,
+                namespace=self.namespace,
+                include_metadata=True
+            )
         
         return results.matches
         
@@ -91,7 +117,7 @@ class PineconeService:
             ids: List of vector IDs to delete
         """
         try:
-            self.index.delete(ids=ids, namespace=self.namespace)
+            await asyncio.to_thread(self.index.delete, ids=ids, namespace=self.namespace)
         except pinecone.errors.NotFoundError:
             print(f"Vector IDs {ids} not found in the index.")
         except pinecone.errors.PineconeError as e:
@@ -0,0 +1,210 @@
+"""
+Concurrency limits, hedged requests and circuit breaking for OpenAI calls
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, TypeVar
+from app.core.config import settings
+from app.core.metrics import metrics
+
+T = TypeVar("T")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+class CircuitOpenError(Exception):
+    """Raised when an upstream's circuit is open and the call is not attempted."""
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker
+
+    After failure_threshold consecutive failures the circuit opens and calls
+    fail fast. Once reset_timeout has elapsed a single trial call is let
+    through (half-open) while other callers keep failing fast; its outcome
+    closes or re-opens the circuit. A trial that never reports back (for
+    example because it was cancelled) is replaced after another
+    reset_timeout.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_started_at = 0.0
+
+    def _set_state(self, state: str) -> None:
+        self.state = state
+        metrics.set_gauge("openai_circuit_state", STATE_VALUES[state], upstream=self.name)
+
+    def allow(self) -> bool:
+        if self.state == CLOSED:
+            return True
+        now = time.monotonic()
+        if self.state == OPEN:
+            if now - self.opened_at < self.reset_timeout:
+                return False
+            self._set_state(HALF_OPEN)
+        elif now - self.trial_started_at < self.reset_timeout:
+            # Half-open with a trial call still in flight
+            return False
+        self.trial_started_at = now
+        return True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        if self.state != CLOSED:
+            self._set_state(CLOSED)
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._set_state(OPEN)
+
+class OpenAIGuard:
+    """
+    Shared guard for every call to OpenAI
+
+    Caps in-flight calls per process and per tenant, optionally hedges a
+    slow call with a second attempt once the upstream's recent p95 latency
+    has passed, and trips a per-upstream circuit breaker so that callers
+    fail fast (and can degrade) while OpenAI is unhealthy.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = settings.OPENAI_MAX_IN_FLIGHT,
+        tenant_max_in_flight: int = settings.OPENAI_TENANT_MAX_IN_FLIGHT,
+        hedge_enabled: bool = settings.OPENAI_HEDGE_ENABLED,
+        hedge_min_delay: float = settings.OPENAI_HEDGE_MIN_DELAY_SECONDS,
+        failure_threshold: int = settings.OPENAI_BREAKER_FAILURE_THRESHOLD,
+        reset_timeout: float = settings.OPENAI_BREAKER_RESET_SECONDS
+    ):
+        self.max_in_flight = max_in_flight
+        self.tenant_max_in_flight = tenant_max_in_flight
+        self.hedge_enabled = hedge_enabled
+        self.hedge_min_delay = hedge_min_delay
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._process_limit = asyncio.Semaphore(max_in_flight)
+        # Only tenants with calls in flight or waiting have a semaphore
+        self._tenant_limits: Dict[str, asyncio.Semaphore] = {}
+        self._tenant_users: Dict[str, int] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self.in_flight = 0
+
+    def breaker(self, upstream: str) -> CircuitBreaker:
+        breaker = self._breakers.get(upstream)
+        if breaker is None:
+            breaker = self._breakers[upstream] = CircuitBreaker(
+                upstream, self.failure_threshold, self.reset_timeout
+            )
+        return breaker
+
+    @asynccontextmanager
+    async def _tenant_slot(self, tenant: str) -> AsyncIterator[None]:
+        limit = self._tenant_limits.get(tenant)
+        if limit is None:
+            limit = self._tenant_limits[tenant] = asyncio.Semaphore(self.tenant_max_in_flight)
+        self._tenant_users[tenant] = self._tenant_users.get(tenant, 0) + 1
+        try:
+            async with limit:
+                yield
+        finally:
+            self._tenant_users[tenant] -= 1
+            if not self._tenant_users[tenant]:
+                # Idle: drop it so every tenant ever seen is not kept for the process's life
+                del self._tenant_users[tenant]
+                del self._tenant_limits[tenant]
+
+    @asynccontextmanager
+    async def slot(self, upstream: str, organization_id: Optional[str] = None) -> AsyncIterator[None]:
+        """
+        Hold an in-flight slot for one call to upstream
+
+        Raises CircuitOpenError without waiting if the circuit is open.
+        Exceptions raised inside the block count as upstream failures.
+        """
+        breaker = self.breaker(upstream)
+        if not breaker.allow():
+            metrics.increment("openai_short_circuits", upstream=upstream)
+            raise CircuitOpenError(f"OpenAI {upstream} circuit is open")
+
+        async with self._tenant_slot(organization_id or "_"), self._process_limit:
+            self.in_flight += 1
+            metrics.set_gauge("openai_in_flight", self.in_flight)
+            start = time.perf_counter()
+            try:
+                yield
+            except Exception:
+                breaker.record_failure()
+                metrics.increment("openai_call_failures", upstream=upstream)
+                raise
+            else:
+                breaker.record_success()
+                metrics.observe("openai_call_seconds", time.perf_counter() - start, upstream=upstream)
+            finally:
+                self.in_flight -= 1
+                metrics.set_gauge("openai_in_flight", self.in_flight)
+
+    async def call(
+        self,
+        upstream: str,
+        fn: Callable[[], Awaitable[T]],
+        organization_id: Optional[str] = None,
+        hedge: Optional[bool] = None
+    ) -> T:
+        """
+        Run fn() under the guard
+
+        Args:
+            upstream: Name of the upstream ("chat", "embeddings"), one breaker each
+            fn: Zero-argument coroutine factory; called again for a hedge
+            organization_id: Tenant the in-flight limit applies to
+            hedge: Override the default hedging behaviour for this call
+
+        Returns:
+            The result of the first attempt to succeed
+        """
+        hedge = self.hedge_enabled if hedge is None else hedge
+        async with self.slot(upstream, organization_id):
+            if hedge:
+                return await self._hedged(upstream, fn)
+            return await fn()
+
+    async def _hedged(self, upstream: str, fn: Callable[[], Awaitable[T]]) -> T:
+        p95 = metrics.percentile("openai_call_seconds", 0.95, upstream=upstream)
+        delay = max(self.hedge_min_delay, p95 or 0.0)
+
+        primary = asyncio.ensure_future(fn())
+        pending = {primary}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if done or self._process_limit.locked():
+                return await primary
+
+            # Primary is past the deadline and there is spare capacity: hedge
+            metrics.increment("openai_hedged_requests", upstream=upstream)
+            async with self._process_limit:
+                pending.add(asyncio.ensure_future(fn()))
+                error: Optional[BaseException] = None
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        if task.exception() is None:
+                            return task.result()
+                        error = task.exception()
+                raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+openai_guard = OpenAIGuard()
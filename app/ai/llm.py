@@ -1,7 +1,10 @@
 """
 LLM service for handling OpenAI interactions
 """
-from typing import List, Optional, Dict, Any
+import asyncio
+import json
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
 from langchain.chat_models import ChatOpenAI
 from langchain.schema import (
     AIMessage,
@@ -9,31 +12,125 @@ from langchain.schema import (
     SystemMessage,
     BaseMessage
 )
+from app.ai.accounting import usage_accountant
+from app.ai.cache import make_cache_key, response_cache
+from app.ai.context import ConversationWindow, count_tokens
+from app.ai.guard import CircuitOpenError, openai_guard
+from app.ai.router import STRONG_TIER, RouteDecision, RoutingRules, model_router
 from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.prometheus import LLM_GENERATION, LLM_TOKENS, count, observe_stage, track_stage
+
+BATCH_ANALYSIS_PROMPT = """
+You will receive a JSON array of messages, each with an "index" and "text".
+For every message return one object with:
+- index: (the index of the message)
+- sentiment: (positive, negative, or neutral)
+- confidence: (float between 0 and 1)
+- key_emotions: (list of primary emotions detected)
+- entities: (list of objects with type and value, as in named entity extraction)
+Reply with a JSON array only, one object per input message.
+"""
+
+def parse_analysis(item: Any) -> Dict[str, Any]:
+    """
+    One message's batch analysis in the shape the API returns
+
+    Raises ValueError or TypeError when the model's object has the wrong
+    shape, so the message is retried like any other malformed output.
+    """
+    if not isinstance(item, dict):
+        raise TypeError("analysis is not an object")
+    sentiment = item.get("sentiment")
+    confidence = item.get("confidence")
+    key_emotions = item.get("key_emotions") or []
+    entities = item.get("entities") or []
+    if sentiment is not None and not isinstance(sentiment, str):
+        raise TypeError("sentiment is not a string")
+    if confidence is not None and (isinstance(confidence, bool) or not isinstance(confidence, (int, float))):
+        raise TypeError("confidence is not a number")
+    if not isinstance(key_emotions, list) or not all(isinstance(emotion, str) for emotion in key_emotions):
+        raise TypeError("key_emotions is not a list of strings")
+    if not isinstance(entities, list) or not all(
+        isinstance(entity, dict) and isinstance(entity.get("type"), str) and isinstance(entity.get("value"), str)
+        for entity in entities
+    ):
+        raise TypeError("entities are not objects with a type and value")
+    return {
+        "index": item["index"],
+        "sentiment": sentiment,
+        "confidence": None if confidence is None else float(confidence),
+        "key_emotions": key_emotions,
+        "entities": [{"type": entity["type"], "value": entity["value"]} for entity in entities]
+    }
+
+DEGRADED_RESPONSE = (
+    "Sorry, I'm having trouble answering right now. "
+    "Please try again in a few minutes."
+)
 
 class LLMService:
     def __init__(self):
-        self.llm = ChatOpenAI(
-            model_name="gpt-4",
-            temperature=0.1,
-            openai_api_key=settings.OPENAI_API_KEY
+        self.model_name = settings.LLM_STRONG_MODEL
+        self.temperature = 0.1
+        self.llm = self._create_llm(self.model_name)
+        self._llms: Dict[str, ChatOpenAI] = {self.model_name: self.llm}
+        self.router = model_router
+        self.guard = openai_guard
+        self.accountant = usage_accountant
+        self.cache = response_cache
+        self.context_window = ConversationWindow(self, model=self.model_name)
+        
+    def _create_llm(self, model_name: str) -> ChatOpenAI:
+        # Retries are kept low so that the circuit breaker sees failures quickly
+        return ChatOpenAI(
+            model_name=model_name,
+            temperature=self.temperature,
+            openai_api_key=settings.OPENAI_API_KEY,
+            max_retries=settings.OPENAI_MAX_RETRIES,
+            request_timeout=settings.OPENAI_REQUEST_TIMEOUT
         )
         
-    async def generate_response(
+    def _get_llm(self, model_name: str) -> ChatOpenAI:
+        """Return the chat model client for a model name, creating it once."""
+        llm = self._llms.get(model_name)
+        if llm is None:
+            llm = self._llms[model_name] = self._create_llm(model_name)
+        return llm
+        
+    def route(
         self,
-        messages: List[Dict[str, str]],
-        system_prompt: Optional[str] = None
-    ) -> str:
+        query: str,
+        retrieval_score: Optional[float] = None,
+        organization_settings: Optional[Dict[str, Any]] = None
+    ) -> RouteDecision:
         """
-        Generate a response using the chat model
+        Pick the model tier for a query using the tenant's routing rules
         
         Args:
-            messages: List of message dictionaries with 'role' and 'content'
-            system_prompt: Optional system prompt to set context
+            query: The user's query string
+            retrieval_score: Score of the best retrieved knowledge base chunk
+            organization_settings: Organization settings holding "model_routing"
             
         Returns:
-            Generated response text
+            The routing decision (tier, model and reason)
         """
+        decision = self.router.route(
+            query,
+            retrieval_score,
+            RoutingRules.for_organization(organization_settings)
+        )
+        metrics.increment("llm_route_decisions", tier=decision.tier, reason=decision.reason)
+        return decision
+        
+    def _default_route(self) -> RouteDecision:
+        return RouteDecision(STRONG_TIER, self.model_name, "default")
+        
+    def _format_messages(
+        self,
+        messages: List[Dict[str, str]],
+        system_prompt: Optional[str] = None
+    ) -> List[BaseMessage]:
         formatted_messages: List[BaseMessage] = []
         
         # Add system prompt if provided
@@ -46,17 +143,160 @@ class LLMService:
                 formatted_messages.append(AIMessage(content=message["content"]))
             elif message["role"] == "user":
                 formatted_messages.append(HumanMessage(content=message["content"]))
+        
+        return formatted_messages
+        
+    async def generate_response(
+        self,
+        messages: List[Dict[str, str]],
+        system_prompt: Optional[str] = None,
+        organization_id: Optional[str] = None,
+        use_cache: bool = True,
+        cache_ttl: Optional[int] = None,
+        route: Optional[RouteDecision] = None,
+        validate: Optional[Callable[[str], Any]] = None
+    ) -> str:
+        """
+        Generate a response using the chat model
+        
+        Args:
+            messages: List of message dictionaries with 'role' and 'content'
+            system_prompt: Optional system prompt to set context
+            organization_id: Tenant the generation time is recorded against
+            use_cache: Serve identical requests from the response cache
+            cache_ttl: Optional TTL in seconds for the cached response
+            route: Model routing decision; defaults to the strong model
+            validate: Called on the generated text before it is cached; if it
+                raises, nothing is cached and the error propagates
+            
+        Returns:
+            Generated response text
+        """
+        route = route or self._default_route()
+        use_cache = use_cache and settings.LLM_CACHE_ENABLED
+        if use_cache:
+            cache_key = make_cache_key(route.model, self.temperature, system_prompt, messages)
+            cached = await self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
+        formatted_messages = self._format_messages(messages, system_prompt)
                 
         # Generate response
-        response = await self.llm.agenerate([formatted_messages])
-        return response.generations[0][0].text
+        with metrics.timer("llm_generation_seconds", organization_id=organization_id, tier=route.tier), \
+                track_stage(LLM_GENERATION, organization_id):
+            llm = self._get_llm(route.model)
+            response = await self.guard.call(
+                "chat",
+                lambda: llm.agenerate([formatted_messages]),
+                organization_id=organization_id
+            )
+        text = response.generations[0][0].text
+        
+        token_usage = (response.llm_output or {}).get("token_usage", {})
+        metrics.increment("llm_tokens", token_usage.get("total_tokens", 0), tier=route.tier)
+        count(LLM_TOKENS, token_usage.get("total_tokens", 0), organization_id, tier=route.tier)
+        self.accountant.record_completion(
+            organization_id,
+            token_usage.get("prompt_tokens", 0),
+            token_usage.get("completion_tokens", 0)
+        )
+        if validate is not None:
+            validate(text)
+        if use_cache:
+            await self.cache.set(cache_key, text, token_usage.get("total_tokens", 0), cache_ttl)
+        return text
         
-    async def analyze_sentiment(self, text: str) -> Dict[str, Any]:
+    async def stream_response(
+        self,
+        messages: List[Dict[str, str]],
+        system_prompt: Optional[str] = None,
+        organization_id: Optional[str] = None,
+        route: Optional[RouteDecision] = None
+    ) -> AsyncIterator[str]:
+        """
+        Stream a response from the chat model as it is generated
+        
+        Time-to-first-token and total generation time are recorded per
+        organization. If the OpenAI circuit is open a degraded reply is
+        yielded instead. The OpenAI stream is read into a buffer by a
+        separate task, so the guard's slot is released as soon as OpenAI
+        finishes, however long the caller takes to deliver each delta.
+        
+        Args:
+            messages: List of message dictionaries with 'role' and 'content'
+            system_prompt: Optional system prompt to set context
+            organization_id: Tenant the timings are recorded against
+            route: Model routing decision; defaults to the strong model
+            
+        Yields:
+            Text deltas in generation order
+        """
+        route = route or self._default_route()
+        formatted_messages = self._format_messages(messages, system_prompt)
+        
+        start = time.perf_counter()
+        first_token = True
+        completion: List[str] = []
+        outcome = "ok"
+        deltas: "asyncio.Queue[Optional[str]]" = asyncio.Queue()
+
+        async def read() -> None:
+            try:
+                async with self.guard.slot("chat", organization_id):
+                    async for chunk in self._get_llm(route.model).astream(formatted_messages):
+                        if chunk.content:
+                            deltas.put_nowait(chunk.content)
+            finally:
+                deltas.put_nowait(None)
+
+        reader = asyncio.create_task(read())
+        try:
+            while (delta := await deltas.get()) is not None:
+                if first_token:
+                    metrics.observe(
+                        "llm_time_to_first_token_seconds",
+                        time.perf_counter() - start,
+                        organization_id=organization_id,
+                        tier=route.tier
+                    )
+                    first_token = False
+                completion.append(delta)
+                yield delta
+            # Raises what the OpenAI stream raised, once its deltas are delivered
+            await reader
+        except CircuitOpenError:
+            outcome = "circuit_open"
+            yield DEGRADED_RESPONSE
+        except BaseException:
+            outcome = "error"
+            raise
+        finally:
+            # Only has an effect when the caller stopped iterating early
+            reader.cancel()
+            elapsed = time.perf_counter() - start
+            metrics.observe("llm_generation_seconds", elapsed, organization_id=organization_id, tier=route.tier)
+            observe_stage(LLM_GENERATION, elapsed, organization_id, outcome)
+            if completion:
+                # Streaming responses carry no usage, so count with tiktoken
+                prompt_tokens = self.accountant.count_prompt_tokens(messages, system_prompt, route.model)
+                completion_tokens = count_tokens("".join(completion), route.model)
+                self.accountant.record_completion(organization_id, prompt_tokens, completion_tokens)
+                count(LLM_TOKENS, prompt_tokens + completion_tokens, organization_id, tier=route.tier)
+        
+    async def analyze_sentiment(
+        self,
+        text: str,
+        use_cache: bool = True,
+        organization_id: Optional[str] = None
+    ) -> Dict[str, Any]:
         """
         Analyze the sentiment of a message
         
         Args:
             text: Input text to analyze
+            use_cache: Serve repeated texts from the response cache
+            organization_id: Tenant the token usage is recorded against
             
         Returns:
             Dictionary containing sentiment analysis
@@ -69,19 +309,29 @@ class LLMService:
         """
         
         messages = [{"role": "user", "content": text}]
-        response = await self.generate_response(messages, system_prompt)
-        
-        # Parse response into structured format
-        # Note: In production, add proper error handling
-        import json
+        # Malformed output is not cached, so a retry asks the model again
+        response = await self.generate_response(
+            messages,
+            system_prompt,
+            organization_id=organization_id,
+            use_cache=use_cache,
+            validate=json.loads
+        )
         return json.loads(response)
         
-    async def extract_entities(self, text: str) -> List[Dict[str, str]]:
+    async def extract_entities(
+        self,
+        text: str,
+        use_cache: bool = True,
+        organization_id: Optional[str] = None
+    ) -> List[Dict[str, str]]:
         """
         Extract named entities from text
         
         Args:
             text: Input text to analyze
+            use_cache: Serve repeated texts from the response cache
+            organization_id: Tenant the token usage is recorded against
             
         Returns:
             List of entities with type and value
@@ -93,19 +343,131 @@ class LLMService:
         """
         
         messages = [{"role": "user", "content": text}]
-        response = await self.generate_response(messages, system_prompt)
-        
-        # Parse response into structured format
-        import json
+        response = await self.generate_response(
+            messages,
+            system_prompt,
+            organization_id=organization_id,
+            use_cache=use_cache,
+            validate=json.loads
+        )
         return json.loads(response)
 
-    async def handle_user_query(self, query: str, context: List[Dict[str, str]]) -> str:
+    def _pack_batches(self, texts: List[str], max_tokens: int, max_items: int) -> List[List[int]]:
+        """Group text indexes into batches that fit the per-call token budget."""
+        batches: List[List[int]] = []
+        current: List[int] = []
+        used = 0
+        for index, text in enumerate(texts):
+            cost = count_tokens(text, self.model_name) + 10
+            if current and (used + cost > max_tokens or len(current) >= max_items):
+                batches.append(current)
+                current, used = [], 0
+            current.append(index)
+            used += cost
+        if current:
+            batches.append(current)
+        return batches
+        
+    async def _analyze_packed(
+        self,
+        texts: List[str],
+        indexes: List[int],
+        semaphore: asyncio.Semaphore,
+        organization_id: Optional[str] = None
+    ) -> Dict[int, Dict[str, Any]]:
+        payload = json.dumps(
+            [{"index": i, "text": texts[i]} for i in indexes],
+            ensure_ascii=False
+        )
+        try:
+            # The slot is held for the call only, so split retries stay within the limit
+            async with semaphore:
+                response = await self.generate_response(
+                    [{"role": "user", "content": payload}],
+                    BATCH_ANALYSIS_PROMPT,
+                    organization_id=organization_id,
+                    validate=json.loads
+                )
+            # Every item is checked here, so one malformed object is split out
+            # and retried instead of failing the whole response
+            results = {item["index"]: item for item in map(parse_analysis, json.loads(response))}
+            if set(results) != set(indexes):
+                raise ValueError("batch analysis response does not cover every message")
+            return results
+        except CircuitOpenError:
+            return {i: {"index": i, "error": "analysis unavailable"} for i in indexes}
+        except (ValueError, KeyError, TypeError):
+            # Malformed or incomplete output: split the batch and retry the halves
+            if len(indexes) == 1:
+                return {indexes[0]: {"index": indexes[0], "error": "analysis failed"}}
+            middle = len(indexes) // 2
+            left, right = await asyncio.gather(
+                self._analyze_packed(texts, indexes[:middle], semaphore, organization_id),
+                self._analyze_packed(texts, indexes[middle:], semaphore, organization_id)
+            )
+            return {**left, **right}
+        
+    async def analyze_batch(
+        self,
+        texts: List[str],
+        max_concurrency: int = settings.LLM_BATCH_CONCURRENCY,
+        organization_id: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Analyze sentiment and extract entities for many messages at once
+        
+        Messages are packed into as few calls as the per-call token budget
+        allows and the packed calls run with bounded concurrency. Messages
+        that cannot be analyzed, including while the OpenAI circuit is open,
+        get a result with an "error" key instead.
+        
+        Args:
+            texts: Messages to analyze
+            max_concurrency: Maximum number of packed calls in flight
+            organization_id: Tenant the generation is recorded against
+            
+        Returns:
+            One result per input text, in input order, with sentiment,
+            confidence, key_emotions and entities
+        """
+        batches = self._pack_batches(
+            texts,
+            settings.LLM_BATCH_MAX_TOKENS,
+            settings.LLM_BATCH_MAX_ITEMS
+        )
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        results: Dict[int, Dict[str, Any]] = {}
+        for batch_result in await asyncio.gather(
+            *(self._analyze_packed(texts, batch, semaphore, organization_id) for batch in batches)
+        ):
+            results.update(batch_result)
+        return [results[i] for i in range(len(texts))]
+
+    async def handle_user_query(
+        self,
+        query: str,
+        context: List[Dict[str, str]],
+        summary_state: Dict[str, Any],
+        organization_id: Optional[str] = None,
+        retrieval_score: Optional[float] = None,
+        organization_settings: Optional[Dict[str, Any]] = None
+    ) -> str:
         """
         Handle a user query by generating a response using OpenAI's GPT model.
         
+        Only the most recent turns that fit the context token budget are sent;
+        older turns are folded into a rolling summary kept in summary_state.
+        
         Args:
             query: The user's query string.
             context: List of previous messages to maintain conversation flow.
+            summary_state: Rolling summary state for this conversation, updated
+                in place. Load it from and save it with the conversation; a
+                fresh dict re-summarises the whole evicted history.
+            organization_id: Tenant the generation is recorded against.
+            retrieval_score: Score of the best retrieved chunk, used for routing.
+            organization_settings: Tenant settings holding the routing rules.
             
         Returns:
             Generated response text.
@@ -113,8 +475,20 @@ class LLMService:
         # Add user query to the context
         context.append({"role": "user", "content": query})
         
-        # Generate response
-        response = await self.generate_response(context)
+        try:
+            # Keep the prompt within the token budget
+            window, summary = await self.context_window.build(context, summary_state, organization_id)
+            system_prompt = f"Summary of the earlier conversation:\n{summary}" if summary else None
+            
+            # Generate response
+            response = await self.generate_response(
+                window,
+                system_prompt,
+                organization_id=organization_id,
+                route=self.route(query, retrieval_score, organization_settings)
+            )
+        except CircuitOpenError:
+            response = DEGRADED_RESPONSE
         
         # Add response to the context
         context.append({"role": "assistant", "content": response})
@@ -0,0 +1,83 @@
+"""
+Latency-aware routing of chat requests between a fast and a strong model
+"""
+import re
+from typing import Any, Dict, List, NamedTuple, Optional
+from app.ai.context import count_tokens
+from app.core.config import settings
+
+FAST_TIER = "fast"
+STRONG_TIER = "strong"
+
+SMALL_TALK = re.compile(
+    r"^\s*(hi|hello|hey|hiya|good (morning|afternoon|evening)|thanks?( you)?|thank you( so much)?|"
+    r"ok(ay)?|cool|great|bye|goodbye|see you|cheers)[\s!.?]*$",
+    re.IGNORECASE
+)
+
+DEFAULT_STRONG_KEYWORDS = [
+    "why", "explain", "compare", "difference", "complaint", "dispute",
+    "legal", "lawyer", "refund", "urgent", "emergency", "calculate",
+]
+
+class RouteDecision(NamedTuple):
+    tier: str
+    model: str
+    reason: str
+
+class RoutingRules:
+    """Routing thresholds, with per-tenant overrides from organization settings."""
+
+    def __init__(self, overrides: Optional[Dict[str, Any]] = None):
+        overrides = overrides or {}
+        self.enabled: bool = overrides.get("enabled", settings.LLM_ROUTING_ENABLED)
+        self.fast_model: str = overrides.get("fast_model", settings.LLM_FAST_MODEL)
+        self.strong_model: str = overrides.get("strong_model", settings.LLM_STRONG_MODEL)
+        self.min_retrieval_score: float = overrides.get(
+            "min_retrieval_score", settings.LLM_ROUTING_MIN_RETRIEVAL_SCORE
+        )
+        self.max_fast_query_tokens: int = overrides.get(
+            "max_fast_query_tokens", settings.LLM_ROUTING_MAX_FAST_QUERY_TOKENS
+        )
+        self.strong_keywords: List[str] = overrides.get("strong_keywords", DEFAULT_STRONG_KEYWORDS)
+
+    @classmethod
+    def for_organization(cls, organization_settings: Optional[Dict[str, Any]]) -> "RoutingRules":
+        return cls((organization_settings or {}).get("model_routing"))
+
+class ModelRouter:
+    """
+    Classifies a request with cheap heuristics and picks a model tier
+
+    Small talk and short questions whose answer is already in a highly
+    scored retrieved chunk go to the fast tier; everything else, including
+    long or reasoning-heavy questions, goes to the strong tier.
+    """
+
+    def route(
+        self,
+        query: str,
+        retrieval_score: Optional[float] = None,
+        rules: Optional[RoutingRules] = None
+    ) -> RouteDecision:
+        rules = rules or RoutingRules()
+
+        if not rules.enabled:
+            return RouteDecision(STRONG_TIER, rules.strong_model, "routing disabled")
+
+        if SMALL_TALK.match(query):
+            return RouteDecision(FAST_TIER, rules.fast_model, "small talk")
+
+        if count_tokens(query, rules.strong_model) > rules.max_fast_query_tokens:
+            return RouteDecision(STRONG_TIER, rules.strong_model, "long query")
+
+        words = set(re.findall(r"[a-z']+", query.lower()))
+        if words.intersection(rules.strong_keywords):
+            return RouteDecision(STRONG_TIER, rules.strong_model, "reasoning keyword")
+
+        if retrieval_score is not None and retrieval_score >= rules.min_retrieval_score:
+            return RouteDecision(FAST_TIER, rules.fast_model, "answer in retrieved context")
+
+        return RouteDecision(STRONG_TIER, rules.strong_model, "default")
+
+model_router = ModelRouter()
@@ -1,40 +1,63 @@
-from typing import Generator, Optional
-from fastapi import Depends, HTTPException, Security, status
+import math
+import time
+from typing import AsyncGenerator, Optional
+from fastapi import Depends, HTTPException, Request, Security, status
 from fastapi.security import APIKeyHeader, OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from app.db.postgresql.database import SessionLocal
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.postgresql.database import AsyncSessionLocal
 from app.core.security import verify_token, verify_whatsapp_number
 from app.db.postgresql.models import Organization, WhatsAppUser
 from app.db.dynamodb.service import DynamoDBService
 from app.ai.llm import LLMService
+from app.core.auth_cache import OrganizationSnapshot, auth_cache
+from app.core.config import settings
+from app.core.prometheus import AUTH_LOOKUP, current_tenant, observe_stage
+from app.core.rate_limit import RateLimitDecision
+from app.core.resources import Resources
 
 api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
 
-def get_db() -> Generator:
-    try:
-        db = SessionLocal()
+async def get_db() -> AsyncGenerator[AsyncSession, None]:
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
-def get_dynamodb() -> DynamoDBService:
-    return DynamoDBService()
+def get_resources(request: Request) -> Resources:
+    return request.app.state.resources
+
+def get_dynamodb(resources: Resources = Depends(get_resources)) -> DynamoDBService:
+    return resources.dynamodb
+
+async def load_organization(api_key: str) -> Optional[OrganizationSnapshot]:
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(Organization).where(
+                Organization.api_key == api_key,
+                Organization.is_active == True
+            )
+        )
+        organization = result.scalars().first()
+    return OrganizationSnapshot.from_model(organization) if organization else None
 
 async def get_current_organization(
-    db: Session = Depends(get_db),
     api_key: Optional[str] = Security(api_key_header)
-) -> Organization:
+) -> OrganizationSnapshot:
     if not api_key:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Not authenticated"
         )
     
-    organization = db.query(Organization).filter(
-        Organization.api_key == api_key,
-        Organization.is_active == True
-    ).first()
+    # Served from the auth cache; the database is only read on a miss
+    start = time.perf_counter()
+    organization = await auth_cache.get(api_key, load_organization)
+    observe_stage(
+        AUTH_LOOKUP,
+        time.perf_counter() - start,
+        organization.id if organization else None,
+        "valid" if organization else "invalid"
+    )
     
     if not organization:
         raise HTTPException(
@@ -42,18 +65,23 @@ async def get_current_organization(
             detail="Invalid API key"
         )
     
+    # Labels metrics recorded further down the request with this tenant
+    current_tenant.set(str(organization.id))
     return organization
 
 async def verify_whatsapp_request(
     phone_number: str,
-    db: Session = Depends(get_db),
-    organization: Organization = Depends(get_current_organization)
+    db: AsyncSession = Depends(get_db),
+    organization: OrganizationSnapshot = Depends(get_current_organization)
 ) -> WhatsAppUser:
-    whatsapp_user = db.query(WhatsAppUser).filter(
-        WhatsAppUser.phone_number == phone_number,
-        WhatsAppUser.organization_id == organization.id,
-        WhatsAppUser.is_active == True
-    ).first()
+    result = await db.execute(
+        select(WhatsAppUser).where(
+            WhatsAppUser.phone_number == phone_number,
+            WhatsAppUser.organization_id == organization.id,
+            WhatsAppUser.is_active == True
+        )
+    )
+    whatsapp_user = result.scalars().first()
     
     if not whatsapp_user:
         raise HTTPException(
@@ -63,12 +91,28 @@ async def verify_whatsapp_request(
     
     return whatsapp_user
 
-async def get_llm_service() -> LLMService:
-    return LLMService()
+async def get_llm_service(resources: Resources = Depends(get_resources)) -> LLMService:
+    return resources.llm_service
+
+def raise_rate_limited(decision: RateLimitDecision) -> None:
+    raise HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Rate limit exceeded",
+        headers={"Retry-After": str(math.ceil(decision.retry_after))}
+    )
 
-async def rate_limit():
+async def rate_limit(
+    organization: OrganizationSnapshot = Depends(get_current_organization),
+    resources: Resources = Depends(get_resources)
+) -> None:
     """
     Rate limiting dependency
+    
+    Applies the organization's request rate limit; senders are limited
+    per phone number where the message is parsed (see RateLimiter.check_phone).
     """
-    # TODO: Implement rate limiting using a different mechanism if needed
-    pass
+    if not settings.RATE_LIMIT_ENABLED:
+        return
+    decision = await resources.rate_limiter.check_organization(organization)
+    if not decision.allowed:
+        raise_rate_limited(decision)
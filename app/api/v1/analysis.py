@@ -0,0 +1,72 @@
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, status
+from pydantic import BaseModel
+from app.api.deps import get_current_organization, get_llm_service, rate_limit
+from app.core.auth_cache import OrganizationSnapshot
+from app.core.logging import get_logger, log_api_call, log_error
+from app.ai.llm import LLMService
+
+router = APIRouter()
+logger = get_logger(__name__)
+
+MAX_BATCH_MESSAGES = 5000
+
+class AnalysisMessage(BaseModel):
+    id: Optional[str] = None
+    text: str
+
+class BatchAnalysisRequest(BaseModel):
+    messages: List[AnalysisMessage]
+
+class Entity(BaseModel):
+    type: str
+    value: str
+
+class MessageAnalysis(BaseModel):
+    id: Optional[str] = None
+    sentiment: Optional[str] = None
+    confidence: Optional[float] = None
+    key_emotions: List[str] = []
+    entities: List[Entity] = []
+    error: Optional[str] = None
+
+class BatchAnalysisResponse(BaseModel):
+    results: List[MessageAnalysis]
+
+@router.post("/batch", response_model=BatchAnalysisResponse, dependencies=[Depends(rate_limit)])
+async def analyze_messages(
+    data: BatchAnalysisRequest,
+    organization: OrganizationSnapshot = Depends(get_current_organization),
+    llm_service: LLMService = Depends(get_llm_service)
+):
+    """Analyze sentiment and extract entities for a batch of messages."""
+    try:
+        log_api_call(logger, "/analysis/batch", "POST", org_id=organization.id, count=len(data.messages))
+        
+        if len(data.messages) > MAX_BATCH_MESSAGES:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"At most {MAX_BATCH_MESSAGES} messages can be analyzed per request"
+            )
+        
+        analyses = await llm_service.analyze_batch(
+            [message.text for message in data.messages],
+            organization_id=str(organization.id)
+        )
+        results = [
+            MessageAnalysis(
+                id=message.id,
+                sentiment=analysis.get("sentiment"),
+                confidence=analysis.get("confidence"),
+                key_emotions=analysis.get("key_emotions") or [],
+                entities=analysis.get("entities") or [],
+                error=analysis.get("error")
+            )
+            for message, analysis in zip(data.messages, analyses)
+        ]
+        
+        log_api_call(logger, "/analysis/batch", "POST", org_id=organization.id, response_status=200)
+        return BatchAnalysisResponse(results=results)
+    except Exception as e:
+        log_error(logger, e, "analyze_messages")
+        raise
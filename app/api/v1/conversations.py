@@ -1,13 +1,16 @@
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, status, Request
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from datetime import datetime
-from app.api.deps import get_dynamodb, get_current_organization, get_llm_service
+from app.api.deps import get_dynamodb, get_current_organization, get_resources, rate_limit, raise_rate_limited
+from app.core.config import settings
+from app.db.dynamodb.retention import MessageArchiver, retention_days
 from app.db.dynamodb.service import DynamoDBService
-from app.db.postgresql.models import Organization
+from app.core.auth_cache import OrganizationSnapshot
 from app.core.logging import get_logger, log_api_call, log_error
-from app.ai.llm import LLMService
+from app.core.resources import Resources
+from app.services.reply_pipeline import ReplyPipeline, whatsapp_conversation_id
 
 router = APIRouter()
 logger = get_logger(__name__)
@@ -24,18 +27,46 @@ class MessageResponse(BaseModel):
     role: str
     metadata: dict
 
+class MessagePageResponse(BaseModel):
+    messages: List[MessageResponse]
+    older_cursor: Optional[str] = None
+    newer_cursor: Optional[str] = None
+
+class RehydrateResponse(BaseModel):
+    conversation_id: str
+    restored: int
+
 class ConversationCreate(BaseModel):
     metadata: dict = {}
 
 class ConversationResponse(BaseModel):
     phone_number: str
     timestamp: str
+    conversation_id: Optional[str] = None
     metadata: dict
 
+def _check_access(conversation: Optional[dict], organization: OrganizationSnapshot, operation: str) -> None:
+    """Raise 404/403 unless the conversation exists and belongs to the organization."""
+    if not conversation:
+        log_error(logger, Exception("Conversation not found"), operation)
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Conversation not found"
+        )
+    
+    # Older conversations only carry the organization in their metadata
+    owner = conversation.get("organization_id") or conversation.get("metadata", {}).get("organization_id")
+    if owner != str(organization.id):
+        log_error(logger, Exception("Not authorized to access this conversation"), operation)
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to access this conversation"
+        )
+
 @router.post("/", response_model=ConversationResponse)
 async def create_conversation(
     data: ConversationCreate,
-    organization: Organization = Depends(get_current_organization),
+    organization: OrganizationSnapshot = Depends(get_current_organization),
     dynamodb: DynamoDBService = Depends(get_dynamodb)
 ):
     """Create a new conversation for a WhatsApp user."""
@@ -55,7 +86,8 @@ async def create_conversation(
             metadata={
                 **data.metadata,
                 "organization_id": str(organization.id)
-            }
+            },
+            organization_id=str(organization.id)
         )
         log_api_call(logger, "/conversations", "POST", org_id=organization.id, response_status=201)
         return conversation
@@ -67,39 +99,31 @@ async def create_conversation(
 async def get_conversation(
     phone_number: str,
     timestamp: str,
-    organization: Organization = Depends(get_current_organization),
+    organization: OrganizationSnapshot = Depends(get_current_organization),
     dynamodb: DynamoDBService = Depends(get_dynamodb)
 ):
     """Get a specific conversation by phone number and timestamp."""
     try:
         log_api_call(
             logger,
-            f"/conversations/{phone_number}/{timestamp}",
+            "/conversations/{phone_number}/{timestamp}",
             "GET",
-            org_id=organization.id
+            org_id=organization.id,
+            phone_number=phone_number,
+            timestamp=timestamp
         )
         
         conversation = await dynamodb.get_conversation(phone_number, timestamp)
-        if not conversation:
-            log_error(logger, Exception("Conversation not found"), "get_conversation")
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Conversation not found"
-            )
-        
-        if conversation.get("metadata", {}).get("organization_id") != str(organization.id):
-            log_error(logger, Exception("Not authorized to access this conversation"), "get_conversation")
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Not authorized to access this conversation"
-            )
+        _check_access(conversation, organization, "get_conversation")
         
         log_api_call(
             logger,
-            f"/conversations/{phone_number}/{timestamp}",
+            "/conversations/{phone_number}/{timestamp}",
             "GET",
             org_id=organization.id,
-            response_status=200
+            response_status=200,
+            phone_number=phone_number,
+            timestamp=timestamp
         )
         return conversation
     except Exception as e:
@@ -110,35 +134,21 @@ async def get_conversation(
 async def create_message(
     conversation_id: str,
     message: MessageCreate,
-    organization: Organization = Depends(get_current_organization),
+    organization: OrganizationSnapshot = Depends(get_current_organization),
     dynamodb: DynamoDBService = Depends(get_dynamodb)
 ):
     """Add a message to an existing conversation."""
     try:
         log_api_call(
             logger,
-            f"/conversations/{conversation_id}/messages",
+            "/conversations/{conversation_id}/messages",
             "POST",
-            org_id=organization.id
-        )
-        
-        conversation = await dynamodb.get_conversation(
-            conversation_id.split(":")[0],
-            conversation_id.split(":")[1]
+            org_id=organization.id,
+            conversation_id=conversation_id
         )
-        if not conversation:
-            log_error(logger, Exception("Conversation not found"), "create_message")
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Conversation not found"
-            )
         
-        if conversation.get("metadata", {}).get("organization_id") != str(organization.id):
-            log_error(logger, Exception("Not authorized to access this conversation"), "create_message")
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Not authorized to access this conversation"
-            )
+        conversation = await dynamodb.get_conversation_by_id(conversation_id)
+        _check_access(conversation, organization, "create_message")
         
         message_data = await dynamodb.create_message(
             conversation_id=conversation_id,
@@ -147,71 +157,122 @@ async def create_message(
             metadata={
                 **message.metadata,
                 "organization_id": str(organization.id)
-            }
+            },
+            ttl_days=retention_days(organization.settings)
         )
         log_api_call(
             logger,
-            f"/conversations/{conversation_id}/messages",
+            "/conversations/{conversation_id}/messages",
             "POST",
             org_id=organization.id,
-            response_status=201
+            response_status=201,
+            conversation_id=conversation_id
         )
         return message_data
     except Exception as e:
         log_error(logger, e, "create_message")
         raise
 
-@router.get("/{conversation_id}/messages", response_model=List[MessageResponse])
+@router.get("/{conversation_id}/messages", response_model=MessagePageResponse)
 async def get_conversation_messages(
     conversation_id: str,
-    organization: Organization = Depends(get_current_organization),
+    limit: int = Query(50, ge=1, le=200),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    organization: OrganizationSnapshot = Depends(get_current_organization),
     dynamodb: DynamoDBService = Depends(get_dynamodb)
 ):
-    """Get all messages in a conversation."""
+    """
+    Get a page of messages in a conversation, newest first.
+    
+    Pass `older_cursor` from a page as `before` to read further back, or
+    `newer_cursor` as `after` to read forwards.
+    """
     try:
         log_api_call(
             logger,
-            f"/conversations/{conversation_id}/messages",
+            "/conversations/{conversation_id}/messages",
             "GET",
-            org_id=organization.id
+            org_id=organization.id,
+            conversation_id=conversation_id
         )
         
-        conversation = await dynamodb.get_conversation(
-            conversation_id.split(":")[0],
-            conversation_id.split(":")[1]
+        if before or after:
+            conversation = await dynamodb.get_conversation_by_id(conversation_id)
+            _check_access(conversation, organization, "get_conversation_messages")
+            try:
+                page = await dynamodb.list_messages(conversation_id, limit=limit, before=before, after=after)
+            except ValueError as e:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        else:
+            # First page: header and messages in one round trip with the single-table layout
+            conversation, page = await dynamodb.get_conversation_page(conversation_id, limit=limit)
+            _check_access(conversation, organization, "get_conversation_messages")
+        log_api_call(
+            logger,
+            "/conversations/{conversation_id}/messages",
+            "GET",
+            org_id=organization.id,
+            response_status=200,
+            conversation_id=conversation_id
+        )
+        return MessagePageResponse(
+            messages=page.items,
+            older_cursor=page.older_cursor,
+            newer_cursor=page.newer_cursor
+        )
+    except Exception as e:
+        log_error(logger, e, "get_conversation_messages")
+        raise
+
+@router.post("/{conversation_id}/rehydrate", response_model=RehydrateResponse)
+async def rehydrate_conversation(
+    conversation_id: str,
+    organization: OrganizationSnapshot = Depends(get_current_organization),
+    dynamodb: DynamoDBService = Depends(get_dynamodb)
+):
+    """
+    Restore a conversation's archived messages into the hot store.
+    
+    Restored messages expire again after MESSAGE_REHYDRATE_TTL_DAYS.
+    """
+    try:
+        log_api_call(
+            logger,
+            "/conversations/{conversation_id}/rehydrate",
+            "POST",
+            org_id=organization.id,
+            conversation_id=conversation_id
         )
-        if not conversation:
-            log_error(logger, Exception("Conversation not found"), "get_conversation_messages")
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Conversation not found"
-            )
         
-        if conversation.get("metadata", {}).get("organization_id") != str(organization.id):
-            log_error(logger, Exception("Not authorized to access this conversation"), "get_conversation_messages")
+        # Archives are laid out per organization, so this only finds our own
+        restored = await MessageArchiver(dynamodb).rehydrate(str(organization.id), conversation_id)
+        if not restored:
             raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Not authorized to access this conversation"
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="No archived messages for this conversation"
             )
+        if dynamodb.message_cache is not None:
+            await dynamodb.message_cache.invalidate(conversation_id)
         
-        messages = await dynamodb.get_conversation_messages(conversation_id)
         log_api_call(
             logger,
-            f"/conversations/{conversation_id}/messages",
-            "GET",
+            "/conversations/{conversation_id}/rehydrate",
+            "POST",
             org_id=organization.id,
-            response_status=200
+            response_status=200,
+            conversation_id=conversation_id
         )
-        return messages
+        return RehydrateResponse(conversation_id=conversation_id, restored=restored)
     except Exception as e:
-        log_error(logger, e, "get_conversation_messages")
+        log_error(logger, e, "rehydrate_conversation")
         raise
 
-@router.post("/webhook")
+@router.post("/webhook", dependencies=[Depends(rate_limit)])
 async def whatsapp_webhook(
     request: Request,
-    dynamodb: DynamoDBService = Depends(get_dynamodb),
-    llm_service: LLMService = Depends(get_llm_service)
+    organization: OrganizationSnapshot = Depends(get_current_organization),
+    resources: Resources = Depends(get_resources)
 ):
     """
     Webhook endpoint to receive messages from WhatsApp and send responses back.
@@ -225,28 +286,29 @@ async def whatsapp_webhook(
     if not sender or not content:
         raise HTTPException(status_code=400, detail="Invalid message format.")
     
-    # Retrieve conversation context from DynamoDB
-    conversation_id = f"{sender}_conversation"
-    conversation = await dynamodb.get_conversation(conversation_id)
-    context = conversation.get("messages", []) if conversation else []
-    
-    # Generate response using AI
-    response_text = await llm_service.handle_user_query(content, context)
+    if settings.RATE_LIMIT_ENABLED:
+        decision = await resources.rate_limiter.check_phone(organization, sender)
+        if not decision.allowed:
+            raise_rate_limited(decision)
     
-    # Update conversation context
-    context.append({"role": "user", "content": content})
-    context.append({"role": "assistant", "content": response_text})
-    await dynamodb.update_conversation(conversation_id, {"messages": context})
+    # Generate the reply from conversation history and the knowledge base
+    pipeline = ReplyPipeline(
+        organization=organization,
+        llm_service=resources.llm_service,
+        dynamodb=resources.dynamodb,
+        pinecone_service=resources.get_pinecone_service(f"tenant_{organization.id}")
+    )
+    result = await pipeline.reply(whatsapp_conversation_id(sender), content)
     
     # Send response back to WhatsApp
     response_data = {
         "to": sender,
         "text": {
-            "body": response_text
+            "body": result.text
         }
     }
     
     # Placeholder for sending response back to WhatsApp API
     # send_to_whatsapp_api(response_data)
     
-    return JSONResponse(content={"status": "success", "response": response_data})
+    return JSONResponse(content={"status": "success", "response": response_data, "timings": result.timings})
@@ -1,8 +1,13 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+import uuid
+from datetime import datetime
+from typing import List, Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.api.deps import get_db, get_current_organization
-from app.db.postgresql.models import KnowledgeBase, Organization
+from app.core.auth_cache import OrganizationSnapshot
+from app.db.postgresql.models import KnowledgeBase
+from app.db.postgresql.pagination import keyset_page, sort_key
 from pydantic import BaseModel
 
 router = APIRouter()
@@ -22,11 +27,28 @@ class KnowledgeBaseResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class KnowledgeBaseListItem(BaseModel):
+    id: uuid.UUID
+    name: str
+    description: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+class KnowledgeBasePage(BaseModel):
+    items: List[KnowledgeBaseListItem]
+    next_cursor: Optional[str] = None
+
+# Sort keys end with the primary key so every page boundary is unique
+SORT_COLUMNS = {
+    "created_at": sort_key(KnowledgeBase.created_at, KnowledgeBase.id),
+    "name": sort_key(KnowledgeBase.name, KnowledgeBase.id),
+}
+
 @router.post("/", response_model=KnowledgeBaseResponse)
 async def create_knowledge_base(
     kb_data: KnowledgeBaseCreate,
-    db: Session = Depends(get_db),
-    organization: Organization = Depends(get_current_organization)
+    db: AsyncSession = Depends(get_db),
+    organization: OrganizationSnapshot = Depends(get_current_organization)
 ):
     knowledge_base = KnowledgeBase(
         name=kb_data.name,
@@ -36,30 +58,46 @@ async def create_knowledge_base(
     )
     
     db.add(knowledge_base)
-    db.commit()
-    db.refresh(knowledge_base)
+    await db.commit()
+    await db.refresh(knowledge_base)
     
     return knowledge_base
 
-@router.get("/", response_model=List[KnowledgeBaseResponse])
+@router.get("/", response_model=KnowledgeBasePage)
 async def get_knowledge_bases(
-    db: Session = Depends(get_db),
-    organization: Organization = Depends(get_current_organization)
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    sort: Literal["created_at", "name"] = "created_at",
+    order: Literal["asc", "desc"] = "desc",
+    db: AsyncSession = Depends(get_db),
+    organization: OrganizationSnapshot = Depends(get_current_organization)
 ):
-    return db.query(KnowledgeBase).filter(
-        KnowledgeBase.organization_id == organization.id
-    ).all()
+    query = select(
+        KnowledgeBase.id,
+        KnowledgeBase.name,
+        KnowledgeBase.description,
+        KnowledgeBase.created_at,
+        KnowledgeBase.updated_at
+    ).where(KnowledgeBase.organization_id == organization.id)
+    try:
+        page = await keyset_page(db, query, SORT_COLUMNS[sort], limit, cursor, descending=order == "desc")
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return KnowledgeBasePage(items=page.items, next_cursor=page.next_cursor)
 
 @router.get("/{knowledge_base_id}", response_model=KnowledgeBaseResponse)
 async def get_knowledge_base(
     knowledge_base_id: str,
-    db: Session = Depends(get_db),
-    organization: Organization = Depends(get_current_organization)
+    db: AsyncSession = Depends(get_db),
+    organization: OrganizationSnapshot = Depends(get_current_organization)
 ):
-    knowledge_base = db.query(KnowledgeBase).filter(
-        KnowledgeBase.id == knowledge_base_id,
-        KnowledgeBase.organization_id == organization.id
-    ).first()
+    result = await db.execute(
+        select(KnowledgeBase).where(
+            KnowledgeBase.id == knowledge_base_id,
+            KnowledgeBase.organization_id == organization.id
+        )
+    )
+    knowledge_base = result.scalars().first()
     
     if not knowledge_base:
         raise HTTPException(
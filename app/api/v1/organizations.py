@@ -1,9 +1,13 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.api.deps import get_db, get_current_organization
+from app.api.v1.whatsapp_users import WhatsAppUserPage, list_whatsapp_users
 from app.core.security import SecurityUtils
+from app.core.auth_cache import OrganizationSnapshot, auth_cache
 from app.db.postgresql.models import Organization, WhatsAppUser
+from app.db.postgresql.whatsapp_import import normalize_phone_number
 from pydantic import BaseModel, EmailStr
 
 router = APIRouter()
@@ -22,6 +26,10 @@ class OrganizationResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class OrganizationUpdate(BaseModel):
+    name: Optional[str] = None
+    settings: Optional[dict] = None
+
 class WhatsAppUserCreate(BaseModel):
     phone_number: str
     settings: dict = {}
@@ -38,7 +46,7 @@ class WhatsAppUserResponse(BaseModel):
 @router.post("/", response_model=OrganizationResponse)
 async def create_organization(
     org_data: OrganizationCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     api_key = SecurityUtils.generate_api_key()
     
@@ -49,21 +57,69 @@ async def create_organization(
     )
     
     db.add(organization)
-    db.commit()
-    db.refresh(organization)
+    await db.commit()
+    await db.refresh(organization)
     
     return organization
 
+async def _get_organization(db: AsyncSession, organization_id) -> Organization:
+    result = await db.execute(select(Organization).where(Organization.id == organization_id))
+    organization = result.scalars().first()
+    if not organization:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Organization not found"
+        )
+    return organization
+
+@router.patch("/me", response_model=OrganizationResponse)
+async def update_organization(
+    org_data: OrganizationUpdate,
+    db: AsyncSession = Depends(get_db),
+    current: OrganizationSnapshot = Depends(get_current_organization)
+):
+    organization = await _get_organization(db, current.id)
+    if org_data.name is not None:
+        organization.name = org_data.name
+    if org_data.settings is not None:
+        organization.settings = org_data.settings
+    
+    await db.commit()
+    await db.refresh(organization)
+    # Cached snapshots carry the old name and settings
+    await auth_cache.invalidate_organization(organization.id)
+    
+    return organization
+
+@router.delete("/me", status_code=status.HTTP_204_NO_CONTENT)
+async def deactivate_organization(
+    db: AsyncSession = Depends(get_db),
+    current: OrganizationSnapshot = Depends(get_current_organization)
+):
+    organization = await _get_organization(db, current.id)
+    organization.is_active = False
+    
+    await db.commit()
+    # Without AUTH_CACHE_REDIS_URL, other workers honour the key until their entry expires
+    await auth_cache.invalidate_organization(organization.id)
+
 @router.post("/whatsapp-users", response_model=WhatsAppUserResponse)
 async def add_whatsapp_user(
     user_data: WhatsAppUserCreate,
-    db: Session = Depends(get_db),
-    organization: Organization = Depends(get_current_organization)
+    db: AsyncSession = Depends(get_db),
+    organization: OrganizationSnapshot = Depends(get_current_organization)
 ):
+    # Stored in the form the webhook sees senders in, as the import does
+    try:
+        phone_number = normalize_phone_number(user_data.phone_number)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
     # Check if phone number is already registered
-    existing_user = db.query(WhatsAppUser).filter(
-        WhatsAppUser.phone_number == user_data.phone_number
-    ).first()
+    result = await db.execute(
+        select(WhatsAppUser).where(WhatsAppUser.phone_number == phone_number)
+    )
+    existing_user = result.scalars().first()
     
     if existing_user:
         raise HTTPException(
@@ -72,22 +128,24 @@ async def add_whatsapp_user(
         )
     
     whatsapp_user = WhatsAppUser(
-        phone_number=user_data.phone_number,
+        phone_number=phone_number,
         organization_id=organization.id,
         settings=user_data.settings
     )
     
     db.add(whatsapp_user)
-    db.commit()
-    db.refresh(whatsapp_user)
+    await db.commit()
+    await db.refresh(whatsapp_user)
     
     return whatsapp_user
 
-@router.get("/whatsapp-users", response_model=List[WhatsAppUserResponse])
+@router.get("/whatsapp-users", response_model=WhatsAppUserPage)
 async def get_organization_whatsapp_users(
-    db: Session = Depends(get_db),
-    organization: Organization = Depends(get_current_organization)
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    sort: Literal["created_at", "phone_number"] = "created_at",
+    order: Literal["asc", "desc"] = "desc",
+    db: AsyncSession = Depends(get_db),
+    organization: OrganizationSnapshot = Depends(get_current_organization)
 ):
-    return db.query(WhatsAppUser).filter(
-        WhatsAppUser.organization_id == organization.id
-    ).all()
+    return await list_whatsapp_users(db, organization.id, limit, cursor, sort, order)
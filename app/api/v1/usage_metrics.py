@@ -1,84 +1,180 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+import uuid
+from typing import List, Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.ai.accounting import ROLLUP_MODELS, bucket_start, client_metric_type, usage_accountant
 from app.api.deps import get_db, get_current_organization
-from app.db.postgresql.models import UsageMetrics, Organization
-from pydantic import BaseModel
-from datetime import datetime
+from app.core.auth_cache import OrganizationSnapshot
+from app.db.postgresql.models import UsageMetrics
+from app.db.postgresql.pagination import keyset_page, sort_key
+from pydantic import BaseModel, Field
+from datetime import datetime, timedelta, timezone
 
 router = APIRouter()
 
 class UsageMetricCreate(BaseModel):
-    metric_type: str
-    value: float
+    metric_type: str = Field(..., min_length=1, max_length=64, pattern=r"^[a-z0-9_]+$")
+    # Rollups hold whole counts; fractional values are rejected with a 422, not truncated
+    value: int = Field(..., ge=0)
     metadata: dict = {}
 
-class UsageMetricResponse(BaseModel):
-    id: str
-    query_count: int
-    token_count: int
-    embedding_count: int
-    extra_metadata: dict
-    organization_id: str
+class UsageMetricAccepted(BaseModel):
+    # As stored, with the client_ prefix
+    metric_type: str
+    value: int
+    # Hour the value was counted in; visible in /series after the next flush
+    bucket: datetime
+
+class UsageSeriesPoint(BaseModel):
+    bucket: datetime
+    metric_type: str
+    value: int
+
+class UsageSeries(BaseModel):
+    granularity: str
+    start: datetime
+    end: datetime
+    points: List[UsageSeriesPoint]
+
+class UsageMetricListItem(BaseModel):
+    id: uuid.UUID
     date: datetime
-    
-    class Config:
-        from_attributes = True
+    query_count: Optional[int] = None
+    token_count: Optional[int] = None
+    embedding_count: Optional[int] = None
+
+class UsageMetricPage(BaseModel):
+    items: List[UsageMetricListItem]
+    next_cursor: Optional[str] = None
+
+# Widest range /series returns per granularity
+SERIES_MAX_SPAN = {
+    "hour": timedelta(days=31),
+    "day": timedelta(days=731),
+    "month": timedelta(days=3660),
+}
+
+# date alone is not unique, so pages seek on (date, id)
+SORT_COLUMNS = sort_key(UsageMetrics.date, UsageMetrics.id)
+
+METRIC_TYPE_FILTERS = {
+    "query": UsageMetrics.query_count > 0,
+    "token": UsageMetrics.token_count > 0,
+    "embedding": UsageMetrics.embedding_count > 0,
+}
+
+async def list_usage_metrics(
+    db: AsyncSession,
+    organization_id: uuid.UUID,
+    limit: int,
+    cursor: Optional[str],
+    order: str,
+    metric_type: Optional[str] = None
+) -> UsageMetricPage:
+    """One keyset page of an organization's usage rows, counter columns only."""
+    query = select(
+        UsageMetrics.id,
+        UsageMetrics.date,
+        UsageMetrics.query_count,
+        UsageMetrics.token_count,
+        UsageMetrics.embedding_count
+    ).where(UsageMetrics.organization_id == organization_id)
+    # Filter based on non-zero values for the specific metric type
+    if metric_type in METRIC_TYPE_FILTERS:
+        query = query.where(METRIC_TYPE_FILTERS[metric_type])
+    try:
+        page = await keyset_page(db, query, SORT_COLUMNS, limit, cursor, descending=order == "desc")
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return UsageMetricPage(items=page.items, next_cursor=page.next_cursor)
 
-@router.post("/", response_model=UsageMetricResponse)
+@router.post("/", response_model=UsageMetricAccepted, status_code=status.HTTP_202_ACCEPTED)
 async def create_usage_metric(
     metric_data: UsageMetricCreate,
-    db: Session = Depends(get_db),
-    organization: Organization = Depends(get_current_organization)
+    organization: OrganizationSnapshot = Depends(get_current_organization)
 ):
-    usage_metric = UsageMetrics(
-        organization_id=organization.id,
-        date=datetime.utcnow(),
-        query_count=0,
-        token_count=0,
-        embedding_count=0,
-        extra_metadata=metric_data.metadata
+    """
+    Count a client-side usage event
+
+    The metric is stored as client_<metric_type>, apart from the usage the
+    server records itself (queries, prompt_tokens, ...), whose names are
+    rejected. The value is counted in memory and added to the rollups on the
+    next flush rather than inserted as a row per event, so a 202 is not
+    durable: events accepted since the last flush are lost if the process
+    crashes. Metadata is not kept.
+    """
+    try:
+        metric_type = client_metric_type(metric_data.metric_type)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    usage_accountant.record(organization.id, metric_type, metric_data.value)
+    return UsageMetricAccepted(
+        metric_type=metric_type,
+        value=metric_data.value,
+        bucket=bucket_start(datetime.now(timezone.utc), "hour")
     )
-    
-    # Update the specific counter based on metric_type
-    if metric_data.metric_type == "query":
-        usage_metric.query_count = int(metric_data.value)
-    elif metric_data.metric_type == "token":
-        usage_metric.token_count = int(metric_data.value)
-    elif metric_data.metric_type == "embedding":
-        usage_metric.embedding_count = int(metric_data.value)
-    
-    db.add(usage_metric)
-    db.commit()
-    db.refresh(usage_metric)
-    
-    return usage_metric
-
-@router.get("/", response_model=List[UsageMetricResponse])
+
+@router.get("/series", response_model=UsageSeries)
+async def get_usage_series(
+    start: datetime,
+    end: Optional[datetime] = None,
+    granularity: Literal["hour", "day", "month"] = "day",
+    metric_type: Optional[List[str]] = Query(None),
+    db: AsyncSession = Depends(get_db),
+    organization: OrganizationSnapshot = Depends(get_current_organization)
+):
+    """
+    Usage totals per bucket between start (inclusive) and end (exclusive)
+
+    Buckets are UTC; start is rounded down to its bucket. Buckets without
+    usage are omitted. Pass metric_type more than once to select several.
+    """
+    start = bucket_start(start, granularity)
+    end = end or datetime.now(timezone.utc)
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=timezone.utc)
+    if end <= start:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="end must be after start")
+    if end - start > SERIES_MAX_SPAN[granularity]:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Range too long for {granularity} granularity (max {SERIES_MAX_SPAN[granularity].days} days)"
+        )
+
+    model = ROLLUP_MODELS[granularity]
+    query = select(model.bucket, model.metric_type, model.value).where(
+        model.organization_id == organization.id,
+        model.bucket >= start,
+        model.bucket < end
+    )
+    if metric_type:
+        query = query.where(model.metric_type.in_(metric_type))
+    result = await db.execute(query.order_by(model.bucket, model.metric_type))
+    return UsageSeries(
+        granularity=granularity,
+        start=start,
+        end=end,
+        points=[dict(row) for row in result.mappings()]
+    )
+
+@router.get("/", response_model=UsageMetricPage)
 async def get_usage_metrics(
-    db: Session = Depends(get_db),
-    organization: Organization = Depends(get_current_organization)
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    order: Literal["asc", "desc"] = "desc",
+    db: AsyncSession = Depends(get_db),
+    organization: OrganizationSnapshot = Depends(get_current_organization)
 ):
-    return db.query(UsageMetrics).filter(
-        UsageMetrics.organization_id == organization.id
-    ).all()
+    return await list_usage_metrics(db, organization.id, limit, cursor, order)
 
-@router.get("/by-type/{metric_type}", response_model=List[UsageMetricResponse])
+@router.get("/by-type/{metric_type}", response_model=UsageMetricPage)
 async def get_usage_metrics_by_type(
     metric_type: str,
-    db: Session = Depends(get_db),
-    organization: Organization = Depends(get_current_organization)
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    order: Literal["asc", "desc"] = "desc",
+    db: AsyncSession = Depends(get_db),
+    organization: OrganizationSnapshot = Depends(get_current_organization)
 ):
-    metrics = db.query(UsageMetrics).filter(
-        UsageMetrics.organization_id == organization.id
-    )
-    
-    # Filter based on non-zero values for the specific metric type
-    if metric_type == "query":
-        metrics = metrics.filter(UsageMetrics.query_count > 0)
-    elif metric_type == "token":
-        metrics = metrics.filter(UsageMetrics.token_count > 0)
-    elif metric_type == "embedding":
-        metrics = metrics.filter(UsageMetrics.embedding_count > 0)
-    
-    return metrics.all()
+    return await list_usage_metrics(db, organization.id, limit, cursor, order, metric_type)
@@ -1,8 +1,14 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+import uuid
+from datetime import datetime
+from typing import List, Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.api.deps import get_db, get_current_organization
-from app.db.postgresql.models import WhatsAppUser, Organization
+from app.core.auth_cache import OrganizationSnapshot
+from app.db.postgresql.models import WhatsAppUser
+from app.db.postgresql.pagination import keyset_page, sort_key
+from app.db.postgresql.whatsapp_import import WhatsAppUserImporter, normalize_phone_number
 from pydantic import BaseModel
 
 router = APIRouter()
@@ -22,16 +28,84 @@ class WhatsAppUserResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class WhatsAppUserListItem(BaseModel):
+    phone_number: str
+    is_active: Optional[bool] = None
+    created_at: Optional[datetime] = None
+    last_active: Optional[datetime] = None
+
+class WhatsAppUserPage(BaseModel):
+    items: List[WhatsAppUserListItem]
+    next_cursor: Optional[str] = None
+
+class WhatsAppUserImportIssue(BaseModel):
+    line: int
+    phone_number: Optional[str] = None
+    reason: str
+
+class WhatsAppUserImportReport(BaseModel):
+    received: int
+    inserted: int
+    updated: int
+    existing: int
+    invalid: int
+    duplicates: int
+    conflicts: int
+    issues: List[WhatsAppUserImportIssue]
+    issues_truncated: bool
+
+IMPORT_CONTENT_TYPES = {
+    "text/csv": "csv",
+    "application/csv": "csv",
+    "application/x-ndjson": "jsonl",
+    "application/jsonl": "jsonl",
+    "application/json-lines": "jsonl",
+}
+
+# Sort keys end with the primary key so every page boundary is unique
+SORT_COLUMNS = {
+    "created_at": sort_key(WhatsAppUser.created_at, WhatsAppUser.phone_number),
+    "phone_number": sort_key(WhatsAppUser.phone_number),
+}
+
+async def list_whatsapp_users(
+    db: AsyncSession,
+    organization_id: uuid.UUID,
+    limit: int,
+    cursor: Optional[str],
+    sort: str,
+    order: str
+) -> WhatsAppUserPage:
+    """One keyset page of an organization's WhatsApp users, list columns only."""
+    query = select(
+        WhatsAppUser.phone_number,
+        WhatsAppUser.is_active,
+        WhatsAppUser.created_at,
+        WhatsAppUser.last_active
+    ).where(WhatsAppUser.organization_id == organization_id)
+    try:
+        page = await keyset_page(db, query, SORT_COLUMNS[sort], limit, cursor, descending=order == "desc")
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return WhatsAppUserPage(items=page.items, next_cursor=page.next_cursor)
+
 @router.post("/", response_model=WhatsAppUserResponse)
 async def create_whatsapp_user(
     user_data: WhatsAppUserCreate,
-    db: Session = Depends(get_db),
-    organization: Organization = Depends(get_current_organization)
+    db: AsyncSession = Depends(get_db),
+    organization: OrganizationSnapshot = Depends(get_current_organization)
 ):
+    # Stored in the form the webhook sees senders in, as the import does
+    try:
+        phone_number = normalize_phone_number(user_data.phone_number)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
     # Check if phone number is already registered
-    existing_user = db.query(WhatsAppUser).filter(
-        WhatsAppUser.phone_number == user_data.phone_number
-    ).first()
+    result = await db.execute(
+        select(WhatsAppUser).where(WhatsAppUser.phone_number == phone_number)
+    )
+    existing_user = result.scalars().first()
     
     if existing_user:
         raise HTTPException(
@@ -40,37 +114,77 @@ async def create_whatsapp_user(
         )
     
     whatsapp_user = WhatsAppUser(
-        phone_number=user_data.phone_number,
+        phone_number=phone_number,
         name=user_data.name,
         settings=user_data.settings,
         organization_id=organization.id
     )
     
     db.add(whatsapp_user)
-    db.commit()
-    db.refresh(whatsapp_user)
+    await db.commit()
+    await db.refresh(whatsapp_user)
     
     return whatsapp_user
 
-@router.get("/", response_model=List[WhatsAppUserResponse])
+@router.post("/import", response_model=WhatsAppUserImportReport)
+async def import_whatsapp_users(
+    request: Request,
+    format: Optional[Literal["csv", "jsonl"]] = None,
+    update_existing: bool = False,
+    db: AsyncSession = Depends(get_db),
+    organization: OrganizationSnapshot = Depends(get_current_organization)
+):
+    """
+    Register many WhatsApp users from a CSV or JSONL request body
+
+    Send the file as the raw body (not multipart) with Content-Type text/csv
+    or application/x-ndjson, or name the format with ?format=. Rows have
+    phone_number and optionally is_active and settings. The import is all or
+    nothing; rows that are invalid, repeated or registered to another
+    organization are skipped and listed in the report.
+    """
+    file_format = format or IMPORT_CONTENT_TYPES.get(
+        request.headers.get("content-type", "").split(";")[0].strip().lower()
+    )
+    if file_format is None:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Send text/csv or application/x-ndjson, or pass ?format=csv|jsonl"
+        )
+    
+    importer = WhatsAppUserImporter(db, organization.id, update_existing=update_existing)
+    try:
+        report = await importer.run(request.stream(), file_format)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return WhatsAppUserImportReport(
+        **{**report._asdict(), "issues": [issue._asdict() for issue in report.issues]}
+    )
+
+@router.get("/", response_model=WhatsAppUserPage)
 async def get_whatsapp_users(
-    db: Session = Depends(get_db),
-    organization: Organization = Depends(get_current_organization)
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    sort: Literal["created_at", "phone_number"] = "created_at",
+    order: Literal["asc", "desc"] = "desc",
+    db: AsyncSession = Depends(get_db),
+    organization: OrganizationSnapshot = Depends(get_current_organization)
 ):
-    return db.query(WhatsAppUser).filter(
-        WhatsAppUser.organization_id == organization.id
-    ).all()
+    return await list_whatsapp_users(db, organization.id, limit, cursor, sort, order)
 
 @router.get("/{user_id}", response_model=WhatsAppUserResponse)
 async def get_whatsapp_user(
     user_id: str,
-    db: Session = Depends(get_db),
-    organization: Organization = Depends(get_current_organization)
+    db: AsyncSession = Depends(get_db),
+    organization: OrganizationSnapshot = Depends(get_current_organization)
 ):
-    user = db.query(WhatsAppUser).filter(
-        WhatsAppUser.id == user_id,
-        WhatsAppUser.organization_id == organization.id
-    ).first()
+    result = await db.execute(
+        select(WhatsAppUser).where(
+            WhatsAppUser.id == user_id,
+            WhatsAppUser.organization_id == organization.id
+        )
+    )
+    user = result.scalars().first()
     
     if not user:
         raise HTTPException(
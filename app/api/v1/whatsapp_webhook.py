@@ -2,13 +2,19 @@
 WhatsApp webhook endpoint for handling incoming messages
 """
 from fastapi import APIRouter, Depends, Request, HTTPException, Response
-from sqlalchemy.orm import Session
-from app.api.deps import get_db, get_current_organization
-from app.db.postgresql.models import Organization, WhatsAppUser
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.api.deps import get_db, get_current_organization, get_resources, rate_limit
+from app.core.resources import Resources
+from app.core.auth_cache import OrganizationSnapshot
+from app.db.postgresql.models import WhatsAppUser
+from app.services.reply_pipeline import ReplyPipeline, whatsapp_conversation_id
 from app.services.whatsapp_service import WhatsAppService
 from app.core.config import settings
+from app.core.logging import get_logger, phone_number_hash
+from app.core.prometheus import WEBHOOK_MESSAGES, WEBHOOK_PARSE, count, track_stage
 
 router = APIRouter()
+logger = get_logger(__name__)
 
 @router.get("/webhook")
 async def verify_webhook(request: Request):
@@ -33,23 +39,37 @@ async def verify_webhook(request: Request):
         print(f"Error verifying webhook: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
-@router.post("/webhook")
+@router.post("/webhook", dependencies=[Depends(rate_limit)])
 async def whatsapp_webhook(
     request: Request,
-    db: Session = Depends(get_db),
-    organization: Organization = Depends(get_current_organization)
+    db: AsyncSession = Depends(get_db),
+    organization: OrganizationSnapshot = Depends(get_current_organization),
+    resources: Resources = Depends(get_resources)
 ):
     """
     Handle incoming WhatsApp webhook requests
     """
     try:
         # Parse the incoming webhook data
-        webhook_data = await request.json()
-        
-        # Verify this is a WhatsApp message webhook
-        if webhook_data.get("object") != "whatsapp_business_account":
-            raise HTTPException(status_code=400, detail="Invalid webhook data")
+        with track_stage(WEBHOOK_PARSE, organization.id):
+            webhook_data = await request.json()
+            
+            # Verify this is a WhatsApp message webhook
+            if webhook_data.get("object") != "whatsapp_business_account":
+                raise HTTPException(status_code=400, detail="Invalid webhook data")
             
+        # Initialize WhatsApp service and reply pipeline from the shared clients
+        whatsapp_service = WhatsAppService(
+            organization=organization,
+            http_client=resources.http_client
+        )
+        pipeline = ReplyPipeline(
+            organization=organization,
+            llm_service=resources.llm_service,
+            dynamodb=resources.dynamodb,
+            pinecone_service=resources.get_pinecone_service(f"tenant_{organization.id}")
+        )
+        
         # Process each entry
         for entry in webhook_data.get("entry", []):
             for change in entry.get("changes", []):
@@ -60,14 +80,34 @@ async def whatsapp_webhook(
                         message_text = message.get("text", {}).get("body", "")
                         
                         if phone_number and message_text:
-                            # Initialize WhatsApp service
-                            whatsapp_service = WhatsAppService(organization=organization)
+                            # Drop messages from senders over their limit before any LLM work
+                            if settings.RATE_LIMIT_ENABLED:
+                                decision = await resources.rate_limiter.check_phone(organization, phone_number)
+                                if not decision.allowed:
+                                    logger.warning(
+                                        "Rate limited WhatsApp sender",
+                                        extra={"sender": phone_number_hash(phone_number), "org_id": organization.id}
+                                    )
+                                    count(WEBHOOK_MESSAGES, 1, organization.id, outcome="rate_limited")
+                                    continue
+                            
+                            conversation_id = whatsapp_conversation_id(phone_number)
+                            
+                            # Stream the reply so the first sentence arrives early
+                            if whatsapp_service.stream_replies:
+                                await whatsapp_service.send_streamed_message(
+                                    phone_number,
+                                    pipeline.stream_reply(conversation_id, message_text)
+                                )
+                                count(WEBHOOK_MESSAGES, 1, organization.id, outcome="streamed")
+                                continue
                             
                             # Process the message
-                            response = await whatsapp_service.process_message(message_text)
+                            result = await pipeline.reply(conversation_id, message_text)
                             
                             # Send the response back to the user
-                            await whatsapp_service.send_message(phone_number, response)
+                            await whatsapp_service.send_message(phone_number, result.text)
+                            count(WEBHOOK_MESSAGES, 1, organization.id, outcome="replied")
         
         return {"status": "success"}
         
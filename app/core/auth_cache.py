@@ -0,0 +1,221 @@
+"""
+In-process cache of API key to organization lookups
+"""
+import asyncio
+import copy
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from types import MappingProxyType
+from typing import Any, Awaitable, Callable, Dict, Mapping, NamedTuple, Optional, Set, Tuple
+from app.core.config import settings
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait before resubscribing after the invalidation channel fails
+RESUBSCRIBE_DELAY = 1.0
+
+class OrganizationSnapshot(NamedTuple):
+    """Read-only copy of the Organization fields request handlers use."""
+    id: Any
+    name: str
+    is_active: bool
+    settings: Mapping[str, Any]
+
+    @classmethod
+    def from_model(cls, organization: Any) -> "OrganizationSnapshot":
+        return cls(
+            id=organization.id,
+            name=organization.name,
+            is_active=organization.is_active,
+            settings=MappingProxyType(copy.deepcopy(organization.settings or {}))
+        )
+
+def hash_api_key(api_key: str) -> str:
+    """Cache key for an API key, so raw keys are never held in memory."""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+class AuthCache:
+    """
+    Maps API key hashes to organization snapshots
+
+    Valid keys are cached for ttl_seconds and unknown or inactive keys for
+    negative_ttl_seconds, so repeated bad keys do not reach the database
+    either. Concurrent misses for the same key share one lookup; if that
+    lookup is cancelled, the callers waiting on it load the key themselves.
+
+    Updating or deactivating an organization must await
+    invalidate_organization(). With a Redis URL the invalidation is
+    published to every worker, which drop their entries too; a worker that
+    loses the channel clears its whole cache when it resubscribes. Without
+    Redis, other workers keep serving the old snapshot until it expires, so
+    ttl_seconds is how long a revoked key can keep working.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = settings.AUTH_CACHE_TTL_SECONDS,
+        negative_ttl_seconds: float = settings.AUTH_CACHE_NEGATIVE_TTL_SECONDS,
+        max_entries: int = settings.AUTH_CACHE_MAX_ENTRIES,
+        redis_url: Optional[str] = settings.AUTH_CACHE_REDIS_URL,
+        channel: str = "auth-cache-invalidations"
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Optional[OrganizationSnapshot]]]" = OrderedDict()
+        self._by_organization: Dict[str, Set[str]] = {}
+        self._loading: Dict[str, "asyncio.Future[Optional[OrganizationSnapshot]]"] = {}
+        # Bumped by invalidation so lookups that started earlier are not cached
+        self._generation = 0
+        self.channel = channel
+        self._task: Optional[asyncio.Task] = None
+        self._redis = None
+
+        if redis_url:
+            try:
+                import redis.asyncio as aioredis
+                self._redis = aioredis.from_url(redis_url)
+            except ImportError:
+                logger.warning("redis is not installed; auth cache invalidation is local to each worker")
+
+    async def get(
+        self,
+        api_key: str,
+        load: Callable[[str], Awaitable[Optional[OrganizationSnapshot]]]
+    ) -> Optional[OrganizationSnapshot]:
+        """
+        The active organization for an API key, or None if there is none
+
+        Args:
+            api_key: Key presented by the client
+            load: Looks the key up in the database on a miss
+        """
+        key_hash = hash_api_key(api_key)
+        entry = self._entries.get(key_hash)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(key_hash)
+            metrics.increment("auth_cache_hits", outcome="valid" if entry[1] else "invalid")
+            return entry[1]
+
+        metrics.increment("auth_cache_misses")
+        pending = self._loading.get(key_hash)
+        if pending is not None:
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+                # The request doing the lookup was cancelled, not this one
+                return await self.get(api_key, load)
+
+        future = asyncio.get_running_loop().create_future()
+        self._loading[key_hash] = future
+        generation = self._generation
+        try:
+            snapshot = await load(api_key)
+            if generation == self._generation:
+                self._store(key_hash, snapshot)
+            future.set_result(snapshot)
+            return snapshot
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when no other caller is waiting
+            future.exception()
+            raise
+        finally:
+            del self._loading[key_hash]
+
+    def _store(self, key_hash: str, snapshot: Optional[OrganizationSnapshot]) -> None:
+        self._discard(key_hash)
+        ttl = self.ttl_seconds if snapshot is not None else self.negative_ttl_seconds
+        self._entries[key_hash] = (time.monotonic() + ttl, snapshot)
+        if snapshot is not None:
+            self._by_organization.setdefault(str(snapshot.id), set()).add(key_hash)
+        while len(self._entries) > self.max_entries:
+            self._discard(next(iter(self._entries)))
+        metrics.set_gauge("auth_cache_entries", len(self._entries))
+
+    def _discard(self, key_hash: str) -> None:
+        entry = self._entries.pop(key_hash, None)
+        if entry is not None and entry[1] is not None:
+            hashes = self._by_organization.get(str(entry[1].id))
+            if hashes is not None:
+                hashes.discard(key_hash)
+                if not hashes:
+                    del self._by_organization[str(entry[1].id)]
+
+    def _drop_organization(self, organization_id: str) -> None:
+        self._generation += 1
+        for key_hash in list(self._by_organization.get(organization_id, ())):
+            self._discard(key_hash)
+        metrics.set_gauge("auth_cache_entries", len(self._entries))
+
+    def _drop_key(self, key_hash: str) -> None:
+        self._generation += 1
+        self._discard(key_hash)
+        metrics.set_gauge("auth_cache_entries", len(self._entries))
+
+    async def _publish(self, message: str) -> None:
+        if self._redis is None:
+            return
+        try:
+            await self._redis.publish(self.channel, message)
+        except Exception as e:
+            logger.warning(f"Could not publish auth cache invalidation; other workers expire it by TTL: {e}")
+
+    async def invalidate_organization(self, organization_id: Any) -> None:
+        """Drop every cached key of an organization, on every worker, after it changes."""
+        self._drop_organization(str(organization_id))
+        await self._publish(f"organization:{organization_id}")
+
+    async def invalidate_key(self, api_key: str) -> None:
+        key_hash = hash_api_key(api_key)
+        self._drop_key(key_hash)
+        await self._publish(f"key:{key_hash}")
+
+    def _apply(self, message: str) -> None:
+        kind, _, value = message.partition(":")
+        if kind == "organization":
+            self._drop_organization(value)
+        elif kind == "key":
+            self._drop_key(value)
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                async with self._redis.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    # Invalidations published while unsubscribed were missed
+                    self.clear()
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self._apply(message["data"].decode("utf-8"))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Auth cache invalidation channel failed, resubscribing: {e}")
+                await asyncio.sleep(RESUBSCRIBE_DELAY)
+
+    def start(self) -> None:
+        """Follow invalidations published by other workers; no-op without Redis."""
+        if self._redis is not None and self._task is None:
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def clear(self) -> None:
+        self._generation += 1
+        self._entries.clear()
+        self._by_organization.clear()
+        metrics.set_gauge("auth_cache_entries", 0)
+
+auth_cache = AuthCache()
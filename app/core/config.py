@@ -13,14 +13,73 @@ class Settings(BaseSettings):
     POSTGRES_HOST: str
     POSTGRES_PORT: str
     POSTGRES_DB: str
+    POSTGRES_POOL_SIZE: int = 10
+    POSTGRES_MAX_OVERFLOW: int = 20
+    POSTGRES_POOL_RECYCLE_SECONDS: int = 1800
+    POSTGRES_POOL_TIMEOUT_SECONDS: float = 30.0
+    WHATSAPP_IMPORT_BATCH_SIZE: int = 5000
+    WHATSAPP_IMPORT_MAX_ROWS: int = 1000000
+    WHATSAPP_IMPORT_MAX_REPORTED_ISSUES: int = 1000
     
     # DynamoDB
     AWS_ACCESS_KEY_ID: str
     AWS_SECRET_ACCESS_KEY: str
     AWS_REGION: str = "us-east-1"
+    DYNAMODB_ENDPOINT: Optional[str] = None  # e.g. http://localstack:4566 in development
+    DYNAMODB_MAX_POOL_CONNECTIONS: int = 50
+    DYNAMODB_CONNECT_TIMEOUT: float = 2.0
+    DYNAMODB_READ_TIMEOUT: float = 5.0
+    DYNAMODB_MAX_ATTEMPTS: int = 3
+    DYNAMODB_RETRY_MODE: str = "adaptive"
+    DYNAMODB_WRITE_BEHIND: bool = True
+    DYNAMODB_SINGLE_TABLE: bool = False  # run scripts/migrate_single_table.py before enabling
+    DYNAMODB_WRITE_BEHIND_INTERVAL_SECONDS: float = 0.05
+    DYNAMODB_WRITE_BEHIND_MAX_RETRIES: int = 5
+    DYNAMODB_WRITE_BEHIND_MAX_REQUEUES: int = 10  # failed flushes before a buffered write is dropped
+    MESSAGE_CACHE_ENABLED: bool = True
+    MESSAGE_CACHE_MESSAGES: int = 20
+    MESSAGE_CACHE_MAX_CONVERSATIONS: int = 10000
+    MESSAGE_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    MESSAGE_CACHE_IDLE_SECONDS: float = 900.0
+    # Other workers' writes reach this worker's in-process tier only through a reload
+    MESSAGE_CACHE_LOCAL_TTL_SECONDS: float = 2.0
+    MESSAGE_CACHE_REDIS_URL: Optional[str] = None
+    MESSAGE_COMPRESSION_MIN_BYTES: int = 1024  # 0 disables compression
+    MESSAGE_COMPRESSION_CODEC: str = "zlib"  # zlib or zstd
+    MESSAGE_RETENTION_DAYS: int = 90  # 0 keeps messages in DynamoDB forever
+    MESSAGE_ARCHIVE_LEAD_DAYS: int = 2
+    MESSAGE_REHYDRATE_TTL_DAYS: int = 7
+    MESSAGE_ARCHIVE_URL: str = "archive/messages"  # local directory, file:///path or s3://bucket/prefix
+    MESSAGE_ARCHIVE_S3_ENDPOINT: Optional[str] = None
     
     # OpenAI
     OPENAI_API_KEY: str
+    OPENAI_MAX_RETRIES: int = 2
+    OPENAI_REQUEST_TIMEOUT: float = 60.0
+    OPENAI_MAX_IN_FLIGHT: int = 64
+    OPENAI_TENANT_MAX_IN_FLIGHT: int = 16
+    OPENAI_HEDGE_ENABLED: bool = False
+    OPENAI_HEDGE_MIN_DELAY_SECONDS: float = 2.0
+    OPENAI_BREAKER_FAILURE_THRESHOLD: int = 5
+    OPENAI_BREAKER_RESET_SECONDS: float = 30.0
+    LLM_STRONG_MODEL: str = "gpt-4"
+    LLM_FAST_MODEL: str = "gpt-3.5-turbo"
+    LLM_ROUTING_ENABLED: bool = True
+    LLM_ROUTING_MIN_RETRIEVAL_SCORE: float = 0.85
+    LLM_ROUTING_MAX_FAST_QUERY_TOKENS: int = 40
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_MAX_ENTRIES: int = 1024
+    LLM_CACHE_TTL_SECONDS: int = 3600
+    LLM_CACHE_REDIS_URL: Optional[str] = None
+    LLM_CONTEXT_MAX_TOKENS: int = 3000
+    LLM_SUMMARY_MAX_TOKENS: int = 300
+    LLM_BATCH_MAX_TOKENS: int = 2000
+    LLM_BATCH_MAX_ITEMS: int = 40
+    LLM_BATCH_CONCURRENCY: int = 4
+    USAGE_FLUSH_INTERVAL_SECONDS: float = 60.0
+    REPLY_HISTORY_MESSAGES: int = 20
+    REPLY_RETRIEVAL_K: int = 4
+    REPLY_CONTEXT_MAX_TOKENS: int = 1500
     
     # Pinecone
     PINECONE_API_KEY: str
@@ -30,15 +89,45 @@ class Settings(BaseSettings):
     WHATSAPP_API_TOKEN: str
     WHATSAPP_VERIFY_TOKEN: str
     WHATSAPP_PHONE_ID: str
+    WHATSAPP_STREAM_REPLIES: bool = False
+    
+    # Rate limiting
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_BACKEND: str = "memory"  # memory, dynamodb or redis
+    RATE_LIMIT_REDIS_URL: Optional[str] = None
+    RATE_LIMIT_ORGANIZATION_PER_MINUTE: int = 600
+    RATE_LIMIT_ORGANIZATION_BURST: int = 100
+    RATE_LIMIT_PHONE_PER_MINUTE: int = 20
+    RATE_LIMIT_PHONE_BURST: int = 5
+    RATE_LIMIT_MAX_KEYS: int = 100000
     
     # Security
     SECRET_KEY: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    AUTH_CACHE_TTL_SECONDS: float = 60.0
+    AUTH_CACHE_NEGATIVE_TTL_SECONDS: float = 10.0
+    AUTH_CACHE_MAX_ENTRIES: int = 10000
+    AUTH_CACHE_REDIS_URL: Optional[str] = None  # broadcasts invalidations to the other workers
+    
+    # Logging
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json"  # json or text
+    LOG_QUEUE_SIZE: int = 10000  # records beyond this are dropped instead of blocking
+    LOG_SAMPLE_RATES: Optional[str] = None  # e.g. "app.api.v1.conversations=0.1,uvicorn.access=0.01"
+    
+    # Prometheus (set PROMETHEUS_MULTIPROC_DIR in the environment when running several workers)
+    METRICS_ENABLED: bool = True
+    METRICS_TENANT_BUCKETS: int = 32  # tenants outside METRICS_TENANTS share this many hashed labels
+    METRICS_TENANTS: Optional[str] = None  # comma-separated organization ids; only these get their own label
     
     @property
     def SQLALCHEMY_DATABASE_URI(self) -> str:
         return f"postgresql+psycopg2://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_HOST}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
 
+    @property
+    def SQLALCHEMY_ASYNC_DATABASE_URI(self) -> str:
+        return f"postgresql+asyncpg://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_HOST}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
+
     class Config:
         env_file = ".env"
         case_sensitive = True
@@ -1,30 +1,249 @@
+"""
+Queue-based structured logging with request-ID correlation
+"""
+import atexit
+import hashlib
+import json
 import logging
+import queue
+import random
 import sys
-from typing import Any
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+from app.core.config import settings
+from app.core.metrics import metrics
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+REQUEST_ID_HEADER = "x-request-id"
+# Client-supplied request IDs longer than this are replaced
+MAX_REQUEST_ID_LENGTH = 128
+
+# ID of the request being served; set by RequestIdMiddleware
+request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+# Server loggers that write to their own handlers unless routed through the queue
+SERVER_LOGGERS = ("uvicorn", "uvicorn.error", "uvicorn.access")
+
+# Attributes every LogRecord has; anything else came in through extra=
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id"}
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with extra= fields as top-level keys."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+class TextFormatter(logging.Formatter):
+    """Human-readable lines, with extra= fields appended as key=value pairs."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        if not hasattr(record, "request_id"):
+            record.request_id = None
+        return super().format(record)
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        # The line before any traceback, which format() appends
+        extras = [f"{key}={value}" for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES]
+        return " ".join([super().formatMessage(record), *extras])
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps a fraction of INFO and DEBUG records per logger
+
+    rates maps logger names to the fraction kept; a rate applies to the
+    logger and its children, the most specific name winning. Warnings and
+    errors are always kept.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self._resolved: Dict[str, float] = {}
+
+    def _rate(self, name: str) -> float:
+        rate = self._resolved.get(name)
+        if rate is None:
+            rate = 1.0
+            for prefix in sorted(self.rates, key=len, reverse=True):
+                if name == prefix or name.startswith(prefix + "."):
+                    rate = self.rates[prefix]
+                    break
+            self._resolved[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Hands records to the listener thread without formatting them
+
+    The request ID is captured here, on the caller's thread, because the
+    listener runs outside the request's context. Formatting and writing
+    happen on the listener thread. When the queue is full the record is
+    dropped rather than blocking the caller.
+
+    A task copies the context it is created in, so a background task
+    started while serving a request would log with that request's ID for
+    its whole life; such tasks are started in an empty contextvars.Context.
+    """
+
+    def __init__(self, log_queue: "queue.Queue[logging.LogRecord]"):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.request_id = request_id.get()
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            metrics.increment("log_records_dropped")
+
+class DrainingQueueListener(QueueListener):
+    def enqueue_sentinel(self) -> None:
+        # On shutdown, wait for room in a full queue instead of failing
+        self.queue.put(self._sentinel)
+
+def parse_sample_rates(value: Optional[str]) -> Dict[str, float]:
+    """Parse LOG_SAMPLE_RATES ("logger=rate,logger=rate") into a dict."""
+    rates: Dict[str, float] = {}
+    for item in (value or "").split(","):
+        if "=" in item:
+            name, rate = item.split("=", 1)
+            rates[name.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+_listener: Optional[QueueListener] = None
+
+def setup_logging(
+    level: str = settings.LOG_LEVEL,
+    log_format: str = settings.LOG_FORMAT,
+    queue_size: int = settings.LOG_QUEUE_SIZE,
+    sample_rates: Optional[str] = settings.LOG_SAMPLE_RATES
+) -> None:
+    """
+    Route the root logger through a queue to a stdout writer thread
+
+    Safe to call more than once; only the first call configures logging.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter() if log_format == "json" else TextFormatter())
+
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(queue_size)
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    rates = parse_sample_rates(sample_rates)
+    if rates:
+        queue_handler.addFilter(SamplingFilter(rates))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    for name in SERVER_LOGGERS:
+        server_logger = logging.getLogger(name)
+        server_logger.handlers.clear()
+        server_logger.propagate = True
+
+    _listener = DrainingQueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+def shutdown_logging() -> None:
+    """Write out queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+class RequestIdMiddleware:
+    """
+    ASGI middleware that gives every HTTP request an ID
+
+    Uses the client's X-Request-ID when it sends a usable one and otherwise
+    generates one. The ID is available to logging through the request_id
+    context variable and is echoed in the X-Request-ID response header.
+    """
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        value = None
+        for name, header in scope.get("headers", ()):
+            if name == REQUEST_ID_HEADER.encode("latin-1"):
+                value = header.decode("latin-1")
+                break
+        if not value or len(value) > MAX_REQUEST_ID_LENGTH or not value.isprintable():
+            value = uuid.uuid4().hex
+        encoded = value.encode("latin-1")
+
+        async def send_with_request_id(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", ()), (REQUEST_ID_HEADER.encode("latin-1"), encoded)]
+            await send(message)
+
+        token = request_id.set(value)
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id.reset(token)
+
+def phone_number_hash(phone_number: str) -> str:
+    """Stable stand-in for a phone number in logs, which must not carry the number itself."""
+    return hashlib.sha256(phone_number.encode("utf-8")).hexdigest()[:12]
 
 def get_logger(name: str) -> logging.Logger:
     """Get a logger instance with the specified name."""
     return logging.getLogger(name)
 
 def log_api_call(logger: logging.Logger, endpoint: str, method: str, **kwargs: Any) -> None:
-    """Log an API call with relevant details."""
-    logger.info(
-        f"API Call - Endpoint: {endpoint}, Method: {method}, "
-        f"Details: {', '.join(f'{k}={v}' for k, v in kwargs.items())}"
-    )
+    """
+    Log an API call with relevant details
+
+    Nothing is formatted here: the details become structured fields, and
+    the message is only built on the writer thread, and only for records
+    that pass the level check and sampling.
+    """
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("API call %s %s", method, endpoint, extra={"endpoint": endpoint, "method": method, **kwargs})
 
 def log_error(logger: logging.Logger, error: Exception, context: str = None) -> None:
     """Log an error with context if provided."""
     if context:
-        logger.error(f"Error in {context}: {str(error)}", exc_info=True)
+        logger.error("Error in %s: %s", context, error, exc_info=True)
     else:
-        logger.error(str(error), exc_info=True)
+        logger.error("%s", error, exc_info=True)
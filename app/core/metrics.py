@@ -0,0 +1,117 @@
+"""
+In-process metrics registry for latency timings and counters
+"""
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, Optional, Tuple
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+class TimingStats:
+    """Running count/sum/max plus a bounded sample window for percentiles."""
+
+    def __init__(self, window: int = 512):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples: Deque[float] = deque(maxlen=window)
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        self.samples.append(value)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+        return ordered[index]
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "avg": self.total / self.count if self.count else None,
+            "p50": self.percentile(0.50),
+            "p95": self.percentile(0.95),
+            "max": self.max,
+        }
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timings: Dict[str, Dict[LabelKey, TimingStats]] = defaultdict(dict)
+        self._counters: Dict[str, Dict[LabelKey, float]] = defaultdict(lambda: defaultdict(float))
+        self._gauges: Dict[str, Dict[LabelKey, float]] = defaultdict(dict)
+
+    def observe(self, name: str, seconds: float, **labels: Any) -> None:
+        """Record a duration (in seconds) for the named timing."""
+        key = _label_key(labels)
+        with self._lock:
+            stats = self._timings[name].get(key)
+            if stats is None:
+                stats = self._timings[name][key] = TimingStats()
+            stats.observe(seconds)
+
+    def increment(self, name: str, value: float = 1, **labels: Any) -> None:
+        """Add value to the named counter."""
+        key = _label_key(labels)
+        with self._lock:
+            self._counters[name][key] += value
+
+    def set_gauge(self, name: str, value: float, **labels: Any) -> None:
+        """Set the current value of the named gauge."""
+        key = _label_key(labels)
+        with self._lock:
+            self._gauges[name][key] = value
+
+    def percentile(self, name: str, q: float, **labels: Any) -> Optional[float]:
+        """Percentile of the recent samples for a timing, or None when unseen."""
+        key = _label_key(labels)
+        with self._lock:
+            stats = self._timings.get(name, {}).get(key)
+            return stats.percentile(q) if stats else None
+
+    def counter(self, name: str, **labels: Any) -> float:
+        key = _label_key(labels)
+        with self._lock:
+            return self._counters.get(name, {}).get(key, 0)
+
+    @contextmanager
+    def timer(self, name: str, **labels: Any) -> Iterator[None]:
+        """Context manager that records the elapsed wall time of its block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return a JSON-serialisable view of every metric."""
+        def render(key: LabelKey) -> str:
+            return ",".join(f"{k}={v}" for k, v in key) or "_"
+
+        with self._lock:
+            return {
+                "timings": {
+                    name: {render(k): s.as_dict() for k, s in series.items()}
+                    for name, series in self._timings.items()
+                },
+                "counters": {
+                    name: {render(k): v for k, v in series.items()}
+                    for name, series in self._counters.items()
+                },
+                "gauges": {
+                    name: {render(k): v for k, v in series.items()}
+                    for name, series in self._gauges.items()
+                },
+            }
+
+metrics = MetricsRegistry()
@@ -0,0 +1,129 @@
+"""
+Prometheus instrumentation of the request pipeline, served at /metrics
+"""
+import os
+import time
+import zlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, FrozenSet, Iterator, Optional, Tuple
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+)
+from app.core.config import settings
+
+# Pipeline stages timed under whatsapp_ai_stage_seconds
+WEBHOOK_PARSE = "webhook_parse"
+AUTH_LOOKUP = "auth_lookup"
+EMBEDDING = "embedding"
+VECTOR_QUERY = "vector_query"
+LLM_GENERATION = "llm_generation"
+DYNAMODB_READ = "dynamodb_read"
+DYNAMODB_WRITE = "dynamodb_write"
+WHATSAPP_SEND = "whatsapp_send"
+
+# From a cached auth lookup to a slow LLM generation
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float("inf")
+)
+
+STAGE_SECONDS = Histogram(
+    "whatsapp_ai_stage_seconds",
+    "Latency of request pipeline stages",
+    ["stage", "tenant", "outcome"],
+    buckets=LATENCY_BUCKETS
+)
+WEBHOOK_MESSAGES = Counter(
+    "whatsapp_ai_webhook_messages",
+    "Incoming WhatsApp messages by how they were handled",
+    ["tenant", "outcome"]
+)
+LLM_TOKENS = Counter(
+    "whatsapp_ai_llm_tokens",
+    "Tokens used by chat completions",
+    ["tenant", "tier"]
+)
+EMBEDDED_TEXTS = Counter(
+    "whatsapp_ai_embedded_texts",
+    "Texts sent to the embeddings API",
+    ["tenant"]
+)
+
+# Organization of the request being served, for stages that do not know it
+current_tenant: ContextVar[Optional[str]] = ContextVar("current_tenant", default=None)
+
+class TenantLabels:
+    """
+    Bounds the tenant label to a fixed set of values
+
+    Organizations in the allowlist get their own label. Every other
+    organization is hashed into one of `buckets` labels ("bucket-07"), and
+    requests without an organization are labelled "none". The label depends
+    only on the organization id, so every worker gives a tenant the same
+    label and multiprocess aggregation adds up matching series.
+    """
+
+    def __init__(
+        self,
+        buckets: int = settings.METRICS_TENANT_BUCKETS,
+        allowlist: Optional[str] = settings.METRICS_TENANTS
+    ):
+        self.buckets = buckets
+        self.allowlist: FrozenSet[str] = frozenset(
+            tenant.strip() for tenant in (allowlist or "").split(",") if tenant.strip()
+        )
+
+    def __call__(self, tenant: Any = None) -> str:
+        tenant = current_tenant.get() if tenant is None else tenant
+        if not tenant:
+            return "none"
+        tenant = str(tenant)
+        if tenant in self.allowlist:
+            return tenant
+        # crc32 rather than hash(), which is salted per process
+        return f"bucket-{zlib.crc32(tenant.encode('utf-8')) % self.buckets:02d}"
+
+tenant_label = TenantLabels()
+
+def observe_stage(stage: str, seconds: float, tenant: Any = None, outcome: str = "ok") -> None:
+    if settings.METRICS_ENABLED:
+        STAGE_SECONDS.labels(stage, tenant_label(tenant), outcome).observe(seconds)
+
+@contextmanager
+def track_stage(stage: str, tenant: Any = None) -> Iterator[None]:
+    """Time a block as a pipeline stage; outcome is "error" if it raises."""
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        observe_stage(stage, time.perf_counter() - start, tenant, outcome)
+
+def count(counter: Counter, value: float = 1, tenant: Any = None, **labels: str) -> None:
+    if settings.METRICS_ENABLED and value:
+        counter.labels(tenant=tenant_label(tenant), **labels).inc(value)
+
+def render_metrics() -> Tuple[bytes, str]:
+    """
+    The exposition text and its content type
+
+    When PROMETHEUS_MULTIPROC_DIR is set, prometheus-client writes every
+    worker's samples to files in that directory and this aggregates them, so
+    any worker can answer a scrape for all of them. The directory must be
+    empty when the server starts.
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+def mark_process_dead() -> None:
+    """Drop this worker's live series from the multiprocess directory on shutdown."""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(os.getpid())
@@ -0,0 +1,180 @@
+"""
+Per-organization and per-sender rate limiting
+"""
+import logging
+import math
+import time
+from collections import OrderedDict
+from typing import Any, Dict, NamedTuple, Optional
+from app.core.config import settings
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class RateLimit:
+    """
+    A sustained rate with a burst allowance
+
+    Raises ValueError unless rate and period are positive and burst is not
+    negative; the GCRA emission interval is period / rate.
+    """
+
+    __slots__ = ("rate", "burst", "period")
+
+    def __init__(self, rate: int, burst: int, period: float = 60.0):
+        if rate <= 0 or burst < 0 or period <= 0:
+            raise ValueError(f"Invalid rate limit: rate={rate}, burst={burst}, period={period}")
+        # Requests allowed per period, sustained
+        self.rate = rate
+        # Requests allowed back to back on top of the sustained rate
+        self.burst = burst
+        self.period = period
+
+class RateLimitDecision(NamedTuple):
+    allowed: bool
+    # Seconds until the next request would be allowed; 0 when allowed
+    retry_after: float
+
+class GCRALimiter:
+    """
+    In-process rate limiter using the generic cell rate algorithm
+
+    Each key stores only its theoretical arrival time (TAT), so a decision is
+    a dict lookup and a few float operations. Keys whose TAT has passed are
+    equivalent to absent keys and are dropped in LRU order once max_keys is
+    exceeded.
+    """
+
+    def __init__(self, max_keys: int = settings.RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._tats: "OrderedDict[str, float]" = OrderedDict()
+
+    def check(self, key: str, limit: RateLimit, cost: int = 1, now: Optional[float] = None) -> RateLimitDecision:
+        now = time.monotonic() if now is None else now
+        interval = limit.period / limit.rate
+        # One request at the sustained rate plus burst more back to back
+        tolerance = interval * (limit.burst + 1)
+        tat = max(self._tats.get(key, now), now)
+        new_tat = tat + interval * cost
+        allow_at = new_tat - tolerance
+        if allow_at > now:
+            return RateLimitDecision(False, allow_at - now)
+
+        self._tats[key] = new_tat
+        self._tats.move_to_end(key)
+        while len(self._tats) > self.max_keys:
+            self._tats.popitem(last=False)
+        return RateLimitDecision(True, 0.0)
+
+class DynamoDBRateLimitBackend:
+    """Fixed-window counters in the rate_limit_windows table, incremented with UpdateItem ADD."""
+
+    def __init__(self, dynamodb):
+        self.dynamodb = dynamodb
+
+    async def hit(self, key: str, window_start: int, cost: int, ttl: int) -> int:
+        return await self.dynamodb.increment_rate_limit(key, str(window_start), cost, window_start + ttl)
+
+class RedisRateLimitBackend:
+    """Fixed-window counters in Redis, incremented with INCRBY."""
+
+    def __init__(self, redis_url: str, key_prefix: str = "rate-limit:"):
+        import redis.asyncio as aioredis
+        self._redis = aioredis.from_url(redis_url)
+        self.key_prefix = key_prefix
+
+    async def hit(self, key: str, window_start: int, cost: int, ttl: int) -> int:
+        redis_key = f"{self.key_prefix}{key}:{window_start}"
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.incrby(redis_key, cost)
+            pipe.expire(redis_key, ttl)
+            count, _ = await pipe.execute()
+        return int(count)
+
+class RateLimiter:
+    """
+    Rate limits for organizations and for WhatsApp senders within them
+
+    Every decision goes through the in-process GCRA limiter first. A key
+    over its limit in this worker alone is over it globally too, so abusive
+    senders are rejected without a network round trip. With a shared
+    backend, requests that pass locally are then counted in a fixed window
+    shared by all workers. If the shared backend fails, the local decision
+    stands.
+
+    Organizations may override the defaults in settings["rate_limits"] with
+    "organization_per_minute", "organization_burst", "phone_per_minute" and
+    "phone_burst".
+    """
+
+    def __init__(self, backend: Optional[Any] = None, local: Optional[GCRALimiter] = None):
+        self.backend = backend
+        self.local = local or GCRALimiter()
+
+    @staticmethod
+    def limits(organization_settings: Optional[Dict[str, Any]], scope: str) -> RateLimit:
+        """The organization's limit for scope; invalid overrides fall back to the defaults."""
+        if scope == "organization":
+            default = RateLimit(settings.RATE_LIMIT_ORGANIZATION_PER_MINUTE, settings.RATE_LIMIT_ORGANIZATION_BURST)
+        else:
+            default = RateLimit(settings.RATE_LIMIT_PHONE_PER_MINUTE, settings.RATE_LIMIT_PHONE_BURST)
+        overrides = (organization_settings or {}).get("rate_limits") or {}
+        prefix = "organization" if scope == "organization" else "phone"
+        try:
+            return RateLimit(
+                int(overrides.get(f"{prefix}_per_minute", default.rate)),
+                int(overrides.get(f"{prefix}_burst", default.burst))
+            )
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Ignoring {scope} rate limit override: {e}")
+            return default
+
+    async def check(self, key: str, limit: RateLimit, scope: str, cost: int = 1) -> RateLimitDecision:
+        """
+        Decide whether a request for key is allowed
+
+        Args:
+            key: Rate limit key, e.g. "org:<id>" or "phone:<org id>:<number>"
+            limit: Limit to apply
+            scope: Metric label ("organization" or "phone")
+            cost: Units the request consumes
+
+        Returns:
+            The decision and, if rejected, the seconds to wait
+        """
+        start = time.perf_counter()
+        decision = self.local.check(key, limit, cost)
+        if decision.allowed and self.backend is not None:
+            now = time.time()
+            window_start = int(now // limit.period * limit.period)
+            try:
+                count = await self.backend.hit(key, window_start, cost, math.ceil(limit.period) * 2)
+                if count > limit.rate + limit.burst:
+                    decision = RateLimitDecision(False, window_start + limit.period - now)
+            except Exception as e:
+                metrics.increment("rate_limit_backend_errors")
+                logger.warning(f"Shared rate limit check failed for {key}: {e}")
+
+        metrics.observe("rate_limit_decision_seconds", time.perf_counter() - start, scope=scope)
+        if not decision.allowed:
+            metrics.increment("rate_limit_rejections", scope=scope)
+        return decision
+
+    async def check_organization(self, organization: Any) -> RateLimitDecision:
+        limit = self.limits(organization.settings, "organization")
+        return await self.check(f"org:{organization.id}", limit, "organization")
+
+    async def check_phone(self, organization: Any, phone_number: str) -> RateLimitDecision:
+        limit = self.limits(organization.settings, "phone")
+        return await self.check(f"phone:{organization.id}:{phone_number}", limit, "phone")
+
+def create_rate_limiter(dynamodb=None, backend: str = settings.RATE_LIMIT_BACKEND) -> RateLimiter:
+    """RateLimiter with the configured shared backend ("memory", "dynamodb" or "redis")."""
+    if backend == "dynamodb" and dynamodb is not None:
+        return RateLimiter(DynamoDBRateLimitBackend(dynamodb))
+    if backend == "redis" and settings.RATE_LIMIT_REDIS_URL:
+        try:
+            return RateLimiter(RedisRateLimitBackend(settings.RATE_LIMIT_REDIS_URL))
+        except ImportError:
+            logger.warning("redis is not installed; rate limits are per process")
+    return RateLimiter()
@@ -0,0 +1,43 @@
+"""
+Application-scoped resources shared by every request
+"""
+from typing import Dict
+import httpx
+from app.ai.embeddings import PineconeService
+from app.ai.llm import LLMService
+from app.core.rate_limit import create_rate_limiter
+from app.db.dynamodb.service import DynamoDBService
+
+class Resources:
+    """
+    Long-lived clients created once per process in the FastAPI lifespan
+
+    Building these per request (a boto3 resource plus its Table objects, the
+    ChatOpenAI clients, the Pinecone index connection, an HTTP connection
+    pool for the WhatsApp API) costs tens of
+    milliseconds of CPU each, so they are created here and handed out by the
+    dependencies in app/api/deps.py.
+    """
+
+    def __init__(self):
+        self.dynamodb = DynamoDBService()
+        self.llm_service = LLMService()
+        self.rate_limiter = create_rate_limiter(self.dynamodb)
+        self._pinecone_services: Dict[str, PineconeService] = {}
+        self.http_client = httpx.AsyncClient(
+            timeout=30.0,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)
+        )
+
+    def get_pinecone_service(self, namespace: str) -> PineconeService:
+        """Return the vector store service for a namespace, creating it once."""
+        service = self._pinecone_services.get(namespace)
+        if service is None:
+            service = self._pinecone_services[namespace] = PineconeService(namespace=namespace)
+        return service
+
+    async def close(self) -> None:
+        """Release resources at shutdown."""
+        self._pinecone_services.clear()
+        await self.dynamodb.close()
+        await self.http_client.aclose()
@@ -0,0 +1,99 @@
+"""
+Transparent compression of large message attributes
+"""
+import json
+import zlib
+from typing import Any, Dict, Optional
+from app.core.config import settings
+
+try:
+    import zstandard
+except ImportError:  # zlib is used when zstandard is not installed
+    zstandard = None
+
+# Version tags stored in <attribute>_codec; readers accept every tag ever written
+ZLIB_V1 = "zlib/1"
+ZSTD_V1 = "zstd/1"
+
+# Attributes that are compressed, and how they are encoded to bytes first
+COMPRESSED_ATTRIBUTES = ("content", "metadata")
+
+def _to_bytes(attribute: str, value: Any) -> bytes:
+    if attribute == "content":
+        return value.encode("utf-8")
+    return json.dumps(value, default=str, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def _from_bytes(attribute: str, data: bytes) -> Any:
+    text = data.decode("utf-8")
+    return text if attribute == "content" else json.loads(text)
+
+def compress_bytes(data: bytes, codec: str) -> bytes:
+    if codec == ZSTD_V1:
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return zlib.compress(data, 6)
+
+def decompress_bytes(data: bytes, codec: str) -> bytes:
+    if codec == ZSTD_V1:
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd-compressed items")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == ZLIB_V1:
+        return zlib.decompress(data)
+    raise ValueError(f"Unknown compression codec: {codec}")
+
+class ItemCompressor:
+    """
+    Compresses large content and metadata attributes of message items
+
+    A value whose encoded size reaches min_bytes is stored as a Binary
+    attribute "<name>_z" with its codec in "<name>_codec", and the plain
+    attribute is removed. Values that do not shrink are stored as they are.
+    decode() accepts both forms, so compressed and uncompressed items can
+    share a table and the threshold or codec can change at any time.
+    """
+
+    def __init__(
+        self,
+        min_bytes: int = settings.MESSAGE_COMPRESSION_MIN_BYTES,
+        codec: str = settings.MESSAGE_COMPRESSION_CODEC
+    ):
+        self.min_bytes = min_bytes
+        self.codec = ZSTD_V1 if codec == "zstd" and zstandard is not None else ZLIB_V1
+
+    def encode(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        """The item as stored: large attributes replaced by compressed ones."""
+        if not self.min_bytes:
+            return item
+        stored: Optional[Dict[str, Any]] = None
+        for attribute in COMPRESSED_ATTRIBUTES:
+            value = item.get(attribute)
+            if not value:
+                continue
+            data = _to_bytes(attribute, value)
+            if len(data) < self.min_bytes:
+                continue
+            compressed = compress_bytes(data, self.codec)
+            if len(compressed) >= len(data):
+                continue
+            if stored is None:
+                stored = dict(item)
+            del stored[attribute]
+            stored[f"{attribute}_z"] = compressed
+            stored[f"{attribute}_codec"] = self.codec
+        return stored if stored is not None else item
+
+    @staticmethod
+    def decode(item: Dict[str, Any]) -> Dict[str, Any]:
+        """The item as written by callers, whatever its stored form."""
+        if not any(f"{attribute}_codec" in item for attribute in COMPRESSED_ATTRIBUTES):
+            return item
+        decoded = dict(item)
+        for attribute in COMPRESSED_ATTRIBUTES:
+            codec = decoded.pop(f"{attribute}_codec", None)
+            if codec is None:
+                continue
+            data = decoded.pop(f"{attribute}_z")
+            # Deserialized Binary attributes wrap their bytes in .value
+            data = getattr(data, "value", data)
+            decoded[attribute] = _from_bytes(attribute, decompress_bytes(bytes(data), codec))
+        return decoded
@@ -1,6 +1,5 @@
 import boto3
-import os
-from app.db.dynamodb.models import ConversationModel, MessageModel, RateLimitModel
+from app.db.dynamodb.models import ChatModel, ConversationModel, MessageModel, RateLimitModel
 from app.core.config import settings
 
 def create_table(dynamodb, schema):
@@ -13,13 +12,22 @@ def create_table(dynamodb, schema):
     except Exception as e:
         print(f"Error creating table {schema['TableName']}: {str(e)}")
 
+def enable_ttl(dynamodb, table_name, attribute_name):
+    try:
+        dynamodb.meta.client.update_time_to_live(
+            TableName=table_name,
+            TimeToLiveSpecification={'Enabled': True, 'AttributeName': attribute_name}
+        )
+        print(f"Enabled TTL on {table_name}.{attribute_name}")
+    except Exception as e:
+        # Raised as ValidationException when TTL is already enabled
+        print(f"TTL not updated on {table_name}: {str(e)}")
+
 def init_dynamodb():
     # Use LocalStack endpoint in development
-    endpoint_url = os.getenv('DYNAMODB_ENDPOINT', None)
-    
     dynamodb = boto3.resource(
         'dynamodb',
-        endpoint_url=endpoint_url,
+        endpoint_url=settings.DYNAMODB_ENDPOINT,
         region_name=settings.AWS_REGION,
         aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
         aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY
@@ -29,11 +37,17 @@ def init_dynamodb():
     tables = [
         ConversationModel.get_table_schema(),
         MessageModel.get_table_schema(),
+        ChatModel.get_table_schema(),
         RateLimitModel.get_table_schema()
     ]
     
     for table_schema in tables:
         create_table(dynamodb, table_schema)
 
+    # Messages expire per tenant retention policy (see app/db/dynamodb/retention.py)
+    enable_ttl(dynamodb, MessageModel.TABLE_NAME, 'expires_at')
+    enable_ttl(dynamodb, ChatModel.TABLE_NAME, 'expires_at')
+    enable_ttl(dynamodb, RateLimitModel.TABLE_NAME, 'expires_at')
+
 if __name__ == "__main__":
     init_dynamodb()
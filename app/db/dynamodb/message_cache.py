@@ -0,0 +1,206 @@
+"""
+Bounded cache of the most recent messages of active conversations
+"""
+import json
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional
+from app.core.config import settings
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Rough fixed cost of a cached message (dict, keys, timestamp, role)
+MESSAGE_OVERHEAD_BYTES = 256
+
+def _message_size(message: Dict[str, Any]) -> int:
+    return MESSAGE_OVERHEAD_BYTES + len(message.get('content') or '') + len(str(message.get('metadata') or ''))
+
+class _Entry:
+    __slots__ = ("messages", "size", "last_access", "loaded_at")
+
+    def __init__(self, messages: Deque[Dict[str, Any]]):
+        self.messages = messages
+        self.size = sum(_message_size(m) for m in messages)
+        self.last_access = self.loaded_at = time.monotonic()
+
+class RecentMessageCache:
+    """
+    Last N messages per active conversation, in process with an optional Redis tier
+
+    An entry is only created from a read of the conversation's latest
+    messages, so it always holds the true tail of the conversation;
+    create_message then writes through with append(). Entries are evicted
+    when idle for idle_seconds and in LRU order when the number of
+    conversations or the estimated memory use exceeds its limit.
+
+    Writes made by other workers never reach this process's entries, so an
+    entry is only served for local_ttl seconds after it was loaded; after
+    that it is reloaded from Redis (or the caller reads DynamoDB), which
+    bounds how stale a worker's view of a conversation can be.
+    """
+
+    def __init__(
+        self,
+        messages_per_conversation: int = settings.MESSAGE_CACHE_MESSAGES,
+        max_conversations: int = settings.MESSAGE_CACHE_MAX_CONVERSATIONS,
+        max_bytes: int = settings.MESSAGE_CACHE_MAX_BYTES,
+        idle_seconds: float = settings.MESSAGE_CACHE_IDLE_SECONDS,
+        local_ttl: float = settings.MESSAGE_CACHE_LOCAL_TTL_SECONDS,
+        redis_url: Optional[str] = settings.MESSAGE_CACHE_REDIS_URL,
+        key_prefix: str = "recent-messages:"
+    ):
+        self.messages_per_conversation = messages_per_conversation
+        self.max_conversations = max_conversations
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self.local_ttl = local_ttl
+        self.key_prefix = key_prefix
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._redis = None
+
+        if redis_url:
+            try:
+                import redis.asyncio as aioredis
+                self._redis = aioredis.from_url(redis_url)
+            except ImportError:
+                logger.warning("redis is not installed; message cache is memory-only")
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def _report(self) -> None:
+        metrics.set_gauge("message_cache_hit_ratio", self.hit_ratio)
+        metrics.set_gauge("message_cache_bytes", self.size)
+        metrics.set_gauge("message_cache_conversations", len(self._entries))
+
+    def _drop(self, conversation_id: str) -> None:
+        entry = self._entries.pop(conversation_id)
+        self.size -= entry.size
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        # Entries are kept in access order, so idle ones are at the front
+        while self._entries:
+            conversation_id, entry = next(iter(self._entries.items()))
+            over_limit = len(self._entries) > self.max_conversations or self.size > self.max_bytes
+            if not over_limit and now - entry.last_access < self.idle_seconds:
+                break
+            self._drop(conversation_id)
+            metrics.increment("message_cache_evictions")
+
+    def _store_local(self, conversation_id: str, messages: List[Dict[str, Any]]) -> None:
+        if conversation_id in self._entries:
+            self._drop(conversation_id)
+        entry = _Entry(deque(messages[-self.messages_per_conversation:], maxlen=self.messages_per_conversation))
+        self._entries[conversation_id] = entry
+        self.size += entry.size
+        self._evict()
+
+    async def get(self, conversation_id: str, count: int) -> Optional[List[Dict[str, Any]]]:
+        """The last `count` messages (oldest first), or None if not cached."""
+        if count > self.messages_per_conversation:
+            return None
+
+        entry = self._entries.get(conversation_id)
+        now = time.monotonic()
+        if entry is not None and now - entry.loaded_at >= self.local_ttl:
+            self._drop(conversation_id)
+            entry = None
+        if entry is not None:
+            entry.last_access = now
+            self._entries.move_to_end(conversation_id)
+            messages = list(entry.messages)
+        else:
+            messages = await self._get_shared(conversation_id)
+            if messages is not None:
+                self._store_local(conversation_id, messages)
+
+        if messages is None:
+            self.misses += 1
+            metrics.increment("message_cache_misses")
+        else:
+            self.hits += 1
+            metrics.increment("message_cache_hits")
+            messages = messages[-count:] if count else []
+        self._report()
+        return messages
+
+    async def put(self, conversation_id: str, messages: List[Dict[str, Any]]) -> None:
+        """Cache the latest messages of a conversation (oldest first)."""
+        self._store_local(conversation_id, messages)
+        self._report()
+        # Empty conversations are only cached locally; Redis drops empty lists
+        if self._redis is not None and messages:
+            key = self.key_prefix + conversation_id
+            try:
+                async with self._redis.pipeline(transaction=True) as pipe:
+                    pipe.delete(key)
+                    pipe.rpush(key, *(json.dumps(m, default=str) for m in messages[-self.messages_per_conversation:]))
+                    pipe.expire(key, int(self.idle_seconds))
+                    await pipe.execute()
+            except Exception as e:
+                logger.warning(f"Message cache write to Redis failed: {e}")
+
+    async def append(self, conversation_id: str, message: Dict[str, Any]) -> None:
+        """Write-through for a new message; ignored for uncached conversations."""
+        entry = self._entries.get(conversation_id)
+        if entry is not None:
+            if len(entry.messages) == entry.messages.maxlen:
+                entry.size -= _message_size(entry.messages[0])
+                self.size -= _message_size(entry.messages[0])
+            entry.messages.append(message)
+            entry.size += _message_size(message)
+            self.size += _message_size(message)
+            self._evict()
+            self._report()
+
+        if self._redis is not None:
+            key = self.key_prefix + conversation_id
+            try:
+                async with self._redis.pipeline(transaction=True) as pipe:
+                    # RPUSHX only appends when the conversation is already cached
+                    pipe.rpushx(key, json.dumps(message, default=str))
+                    pipe.ltrim(key, -self.messages_per_conversation, -1)
+                    pipe.expire(key, int(self.idle_seconds))
+                    await pipe.execute()
+            except Exception as e:
+                logger.warning(f"Message cache append to Redis failed: {e}")
+
+    async def invalidate(self, conversation_id: str) -> None:
+        """Forget a conversation, e.g. after older messages were restored."""
+        if conversation_id in self._entries:
+            self._drop(conversation_id)
+            self._report()
+        if self._redis is not None:
+            try:
+                await self._redis.delete(self.key_prefix + conversation_id)
+            except Exception as e:
+                logger.warning(f"Message cache invalidation in Redis failed: {e}")
+
+    async def _get_shared(self, conversation_id: str) -> Optional[List[Dict[str, Any]]]:
+        if self._redis is None:
+            return None
+        try:
+            raw = await self._redis.lrange(self.key_prefix + conversation_id, 0, -1)
+        except Exception as e:
+            logger.warning(f"Message cache read from Redis failed: {e}")
+            return None
+        if not raw:
+            return None
+        return [json.loads(m) for m in raw]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "conversations": len(self._entries),
+            "bytes": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hit_ratio,
+        }
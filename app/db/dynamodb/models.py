@@ -1,23 +1,153 @@
-from typing import Dict, Optional
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Dict, Optional
 from datetime import datetime
 import boto3
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+from botocore.config import Config
+from botocore.exceptions import ClientError, ConnectionError as BotocoreConnectionError, HTTPClientError
 from app.core.config import settings
+from app.core.prometheus import DYNAMODB_READ, DYNAMODB_WRITE, observe_stage
+
+# Operations timed as dynamodb_read/dynamodb_write; table administration is not timed
+OPERATION_STAGES = {
+    **dict.fromkeys(("get_item", "batch_get_item", "query", "scan"), DYNAMODB_READ),
+    **dict.fromkeys(("put_item", "update_item", "delete_item", "batch_write_item", "transact_write_items"), DYNAMODB_WRITE),
+}
+THROTTLING_ERRORS = {"ProvisionedThroughputExceededException", "ThrottlingException", "RequestLimitExceeded"}
+# Error codes worth repeating a call for; anything else fails the same way again
+RETRYABLE_ERRORS = THROTTLING_ERRORS | {"InternalServerError", "ServiceUnavailable"}
+
+_serializer = TypeSerializer()
+_deserializer = TypeDeserializer()
+
+def serialize(item: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: _serializer.serialize(v) for k, v in item.items()}
+
+def deserialize(item: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: _deserializer.deserialize(v) for k, v in item.items()}
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether a failed call may succeed if repeated: throttling, 5xx and connection errors."""
+    if isinstance(error, ClientError):
+        response = error.response
+        return (
+            response.get("Error", {}).get("Code") in RETRYABLE_ERRORS
+            or response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0) >= 500
+        )
+    return isinstance(error, (BotocoreConnectionError, HTTPClientError))
 
 class DynamoDBClient:
+    """
+    Shared low-level DynamoDB client and the thread pool its calls run on
+
+    botocore clients are thread-safe, so one client (and its HTTP connection
+    pool) serves every table. Calls run on a dedicated executor sized to the
+    connection pool so they never block the event loop.
+    """
+
     def __init__(self):
-        self.client = boto3.resource(
+        self.config = Config(
+            max_pool_connections=settings.DYNAMODB_MAX_POOL_CONNECTIONS,
+            connect_timeout=settings.DYNAMODB_CONNECT_TIMEOUT,
+            read_timeout=settings.DYNAMODB_READ_TIMEOUT,
+            retries={
+                "max_attempts": settings.DYNAMODB_MAX_ATTEMPTS,
+                "mode": settings.DYNAMODB_RETRY_MODE
+            },
+            tcp_keepalive=True
+        )
+        self.client = boto3.client(
             'dynamodb',
             aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
             aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
             region_name=settings.AWS_REGION,
-            endpoint_url='http://localstack:4566'
+            endpoint_url=settings.DYNAMODB_ENDPOINT,
+            config=self.config
         )
+        self.executor = ThreadPoolExecutor(
+            max_workers=settings.DYNAMODB_MAX_POOL_CONNECTIONS,
+            thread_name_prefix="dynamodb"
+        )
+
+    async def call(self, operation: str, tenant: Any = None, **kwargs: Any) -> Dict[str, Any]:
+        """
+        Run a client operation on the DynamoDB thread pool
+
+        The call is timed against tenant, or the request's organization when
+        tenant is None.
+        """
+        loop = asyncio.get_running_loop()
+        stage = OPERATION_STAGES.get(operation)
+        start = time.perf_counter()
+        outcome = "ok"
+        try:
+            return await loop.run_in_executor(
+                self.executor,
+                partial(getattr(self.client, operation), **kwargs)
+            )
+        except ClientError as e:
+            outcome = "throttled" if e.response.get("Error", {}).get("Code") in THROTTLING_ERRORS else "error"
+            raise
+        except BaseException:
+            outcome = "error"
+            raise
+        finally:
+            if stage is not None:
+                observe_stage(stage, time.perf_counter() - start, tenant, outcome)
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=True)
+
+class AsyncTable:
+    """
+    Awaitable subset of the boto3 Table API
+
+    Accepts and returns plain Python values like boto3.resource tables do,
+    converting to and from DynamoDB attribute values around each call.
+    """
+
+    def __init__(self, dynamo_client: DynamoDBClient, table_name: str):
+        self.dynamo_client = dynamo_client
+        self.name = table_name
+
+    async def _call(self, operation: str, **kwargs: Any) -> Dict[str, Any]:
+        for key in ("Item", "Key", "ExpressionAttributeValues", "ExclusiveStartKey"):
+            if key in kwargs:
+                kwargs[key] = serialize(kwargs[key])
+        response = await self.dynamo_client.call(operation, TableName=self.name, **kwargs)
+        for key in ("Item", "Attributes", "LastEvaluatedKey"):
+            if key in response:
+                response[key] = deserialize(response[key])
+        if "Items" in response:
+            response["Items"] = [deserialize(item) for item in response["Items"]]
+        return response
+
+    async def put_item(self, **kwargs: Any) -> Dict[str, Any]:
+        return await self._call("put_item", **kwargs)
+
+    async def get_item(self, **kwargs: Any) -> Dict[str, Any]:
+        return await self._call("get_item", **kwargs)
+
+    async def update_item(self, **kwargs: Any) -> Dict[str, Any]:
+        return await self._call("update_item", **kwargs)
+
+    async def delete_item(self, **kwargs: Any) -> Dict[str, Any]:
+        return await self._call("delete_item", **kwargs)
+
+    async def query(self, **kwargs: Any) -> Dict[str, Any]:
+        return await self._call("query", **kwargs)
+
+    async def scan(self, **kwargs: Any) -> Dict[str, Any]:
+        return await self._call("scan", **kwargs)
 
 class ConversationModel:
     TABLE_NAME = "conversations"
     
     def __init__(self, dynamo_client: DynamoDBClient):
-        self.table = dynamo_client.client.Table(self.TABLE_NAME)
+        self.table = AsyncTable(dynamo_client, self.TABLE_NAME)
     
     @classmethod
     def get_table_schema(cls) -> Dict:
@@ -38,7 +168,7 @@ class MessageModel:
     TABLE_NAME = "messages"
     
     def __init__(self, dynamo_client: DynamoDBClient):
-        self.table = dynamo_client.client.Table(self.TABLE_NAME)
+        self.table = AsyncTable(dynamo_client, self.TABLE_NAME)
     
     @classmethod
     def get_table_schema(cls) -> Dict:
@@ -66,21 +196,68 @@ class MessageModel:
             'BillingMode': 'PAY_PER_REQUEST'
         }
 
+class ChatModel:
+    """
+    Single-table layout: a conversation's header and messages share a partition
+
+        pk = "CONV#<conversation_id>"
+        sk = "MSG#<timestamp>" for messages, "~HEADER" for the header
+
+    "~" sorts after every "MSG#" key, so one newest-first Query on the
+    partition returns the header followed by the latest messages.
+    """
+    TABLE_NAME = "chat"
+    PARTITION_PREFIX = "CONV#"
+    MESSAGE_PREFIX = "MSG#"
+    # Upper bound of the message key range ("$" follows "#")
+    MESSAGE_PREFIX_END = "MSG$"
+    HEADER_SORT_KEY = "~HEADER"
+    
+    def __init__(self, dynamo_client: DynamoDBClient):
+        self.table = AsyncTable(dynamo_client, self.TABLE_NAME)
+    
+    @classmethod
+    def partition_key(cls, conversation_id: str) -> str:
+        return cls.PARTITION_PREFIX + conversation_id
+    
+    @classmethod
+    def message_sort_key(cls, timestamp: str) -> str:
+        return cls.MESSAGE_PREFIX + timestamp
+    
+    @classmethod
+    def get_table_schema(cls) -> Dict:
+        return {
+            'TableName': cls.TABLE_NAME,
+            'KeySchema': [
+                {'AttributeName': 'pk', 'KeyType': 'HASH'},
+                {'AttributeName': 'sk', 'KeyType': 'RANGE'}
+            ],
+            'AttributeDefinitions': [
+                {'AttributeName': 'pk', 'AttributeType': 'S'},
+                {'AttributeName': 'sk', 'AttributeType': 'S'}
+            ],
+            'BillingMode': 'PAY_PER_REQUEST'
+        }
+
 class RateLimitModel:
-    TABLE_NAME = "rate_limits"
+    # Not "rate_limits": that table was keyed on key alone, and init_tables
+    # leaves existing tables as they are
+    TABLE_NAME = "rate_limit_windows"
     
     def __init__(self, dynamo_client: DynamoDBClient):
-        self.table = dynamo_client.client.Table(self.TABLE_NAME)
+        self.table = AsyncTable(dynamo_client, self.TABLE_NAME)
     
     @classmethod
     def get_table_schema(cls) -> Dict:
         return {
             'TableName': cls.TABLE_NAME,
             'KeySchema': [
-                {'AttributeName': 'key', 'KeyType': 'HASH'}  # phone_number or org_id
+                {'AttributeName': 'key', 'KeyType': 'HASH'},  # org:<id> or phone:<org id>:<number>
+                {'AttributeName': 'window_start', 'KeyType': 'RANGE'}
             ],
             'AttributeDefinitions': [
-                {'AttributeName': 'key', 'AttributeType': 'S'}
+                {'AttributeName': 'key', 'AttributeType': 'S'},
+                {'AttributeName': 'window_start', 'AttributeType': 'S'}
             ],
             'BillingMode': 'PAY_PER_REQUEST'
         }
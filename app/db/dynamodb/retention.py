@@ -0,0 +1,266 @@
+"""
+Message retention: TTL expiry in DynamoDB plus a compressed cold archive
+"""
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+import boto3
+from botocore.exceptions import ClientError
+from app.core.config import settings
+from app.db.dynamodb.compression import ItemCompressor
+from app.db.dynamodb.write_buffer import batch_write_items
+
+try:
+    import zstandard
+except ImportError:  # gzip is used when zstandard is not installed
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_EXTENSION = ".jsonl.zst" if zstandard is not None else ".jsonl.gz"
+
+TTL_ATTRIBUTE = "expires_at"
+SECONDS_PER_DAY = 86400
+
+def retention_days(organization_settings: Optional[Dict[str, Any]]) -> int:
+    """
+    Days a tenant's messages stay in the hot table; 0 keeps them forever
+
+    Configured per organization as settings["retention"]["hot_days"].
+    """
+    policy = (organization_settings or {}).get("retention") or {}
+    return int(policy.get("hot_days", settings.MESSAGE_RETENTION_DAYS))
+
+def expires_at(ttl_days: Optional[int], now: Optional[float] = None) -> Optional[int]:
+    """TTL attribute value (epoch seconds) for an item written now."""
+    if not ttl_days:
+        return None
+    return int((now or time.time()) + ttl_days * SECONDS_PER_DAY)
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f"Cannot serialise {type(value).__name__}")
+
+def compress(lines: List[str]) -> Tuple[bytes, str]:
+    """Compress JSONL lines; returns the payload and its file extension."""
+    payload = ("\n".join(lines) + "\n").encode("utf-8")
+    if zstandard is not None:
+        return zstandard.ZstdCompressor(level=10).compress(payload), ARCHIVE_EXTENSION
+    return gzip.compress(payload, compresslevel=6), ARCHIVE_EXTENSION
+
+def decompress(data: bytes, name: str) -> List[Dict[str, Any]]:
+    if name.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read .zst archives")
+        payload = zstandard.ZstdDecompressor().decompress(data)
+    else:
+        payload = gzip.decompress(data)
+    # DynamoDB rejects floats, so fractional numbers come back as the Decimals they were
+    return [json.loads(line, parse_float=Decimal) for line in payload.decode("utf-8").splitlines() if line]
+
+class LocalArchiveStore:
+    """Archive files under a local directory."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def put(self, key: str, data: bytes) -> None:
+        path = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def list(self, prefix: str) -> List[str]:
+        directory = os.path.join(self.root, prefix)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(
+            os.path.join(prefix, name) for name in os.listdir(directory)
+            if not name.endswith(".tmp")
+        )
+
+    def get(self, key: str) -> bytes:
+        with open(os.path.join(self.root, key), "rb") as f:
+            return f.read()
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(os.path.join(self.root, key))
+
+class S3ArchiveStore:
+    """Archive objects in an S3-compatible bucket."""
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None):
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=settings.AWS_REGION,
+            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY
+        )
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def put(self, key: str, data: bytes) -> None:
+        self.client.put_object(Bucket=self.bucket, Key=self._key(key), Body=data)
+
+    def list(self, prefix: str) -> List[str]:
+        keys = []
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix) + "/"):
+            keys.extend(obj["Key"][len(self._key("")):] for obj in page.get("Contents", []))
+        return sorted(keys)
+
+    def get(self, key: str) -> bytes:
+        return self.client.get_object(Bucket=self.bucket, Key=self._key(key))["Body"].read()
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey"):
+                return False
+            raise
+        return True
+
+def get_archive_store(url: str = settings.MESSAGE_ARCHIVE_URL):
+    """Archive store for a file:// or s3://bucket/prefix URL."""
+    parsed = urlparse(url)
+    if parsed.scheme == "s3":
+        return S3ArchiveStore(parsed.netloc, parsed.path, settings.MESSAGE_ARCHIVE_S3_ENDPOINT)
+    return LocalArchiveStore(parsed.path if parsed.scheme == "file" else url)
+
+class MessageArchiver:
+    """
+    Exports messages to the archive before DynamoDB expires them
+
+    Archives hold one compressed JSONL file per conversation and day, at
+    <organization_id>/<conversation_id>/<YYYY-MM-DD><ext>. Each run exports
+    the messages expiring on one day. A conversation's day can span more
+    than one expiry day (rehydrated messages, a changed retention policy),
+    so a file that already exists is merged with rather than replaced, and
+    re-running an export never loses archived messages.
+    """
+
+    def __init__(self, dynamodb, store=None):
+        self.dynamodb = dynamodb
+        self.store = store or get_archive_store()
+
+    async def _scan_expiring(self, start: int, end: int, segment: int, total_segments: int) -> List[Dict[str, Any]]:
+        items: List[Dict[str, Any]] = []
+        kwargs: Dict[str, Any] = {
+            "FilterExpression": "#exp >= :start AND #exp < :end",
+            "ExpressionAttributeNames": {"#exp": TTL_ATTRIBUTE},
+            "ExpressionAttributeValues": {":start": start, ":end": end},
+            "Segment": segment,
+            "TotalSegments": total_segments,
+        }
+        while True:
+            response = await self.dynamodb.message_table.scan(**kwargs)
+            items.extend(ItemCompressor.decode(i) for i in response.get("Items", []))
+            if "LastEvaluatedKey" not in response:
+                return items
+            kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    async def archive_expiring(
+        self,
+        lead_days: int = settings.MESSAGE_ARCHIVE_LEAD_DAYS,
+        total_segments: int = 4
+    ) -> int:
+        """
+        Archive the messages that expire on the day lead_days from today
+
+        Only that day is scanned. Items past their expiry are still readable
+        until DynamoDB deletes them, up to two days later; scanning them
+        again on every run would only find what TTL has not removed yet. A
+        day missed by the schedule is exported by running again with a
+        smaller lead_days before it arrives.
+
+        Args:
+            lead_days: How far ahead of expiry messages are exported
+            total_segments: Parallel scan segments
+
+        Returns:
+            Number of archive files written
+        """
+        today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        day_start = today + timedelta(days=lead_days)
+        start = int(day_start.timestamp())
+        end = int((day_start + timedelta(days=1)).timestamp())
+
+        segments = await asyncio.gather(*(
+            self._scan_expiring(start, end, segment, total_segments)
+            for segment in range(total_segments)
+        ))
+
+        groups: Dict[Tuple[str, str, str], List[Dict[str, Any]]] = defaultdict(list)
+        for items in segments:
+            for item in items:
+                organization_id = (item.get("metadata") or {}).get("organization_id", "unknown")
+                groups[(organization_id, item["conversation_id"], item["timestamp"][:10])].append(item)
+
+        for (organization_id, conversation_id, day), items in groups.items():
+            await asyncio.to_thread(self._write, f"{organization_id}/{conversation_id}/{day}", items)
+        logger.info(f"Archived {sum(len(i) for i in groups.values())} messages in {len(groups)} files")
+        return len(groups)
+
+    def _write(self, name: str, items: List[Dict[str, Any]]) -> None:
+        # Runs on a worker thread; the stores' clients are blocking
+        key = name + ARCHIVE_EXTENSION
+        merged = {}
+        if self.store.exists(key):
+            merged = {item["timestamp"]: item for item in decompress(self.store.get(key), key)}
+        merged.update((item["timestamp"], item) for item in items)
+        lines = [json.dumps(merged[t], default=_json_default, ensure_ascii=False) for t in sorted(merged)]
+        self.store.put(key, compress(lines)[0])
+
+    async def load(self, organization_id: str, conversation_id: str) -> List[Dict[str, Any]]:
+        """Read an archived conversation, oldest first."""
+        keys = await asyncio.to_thread(self.store.list, f"{organization_id}/{conversation_id}")
+        messages: List[Dict[str, Any]] = []
+        for key in keys:
+            data = await asyncio.to_thread(self.store.get, key)
+            messages.extend(decompress(data, key))
+        return messages
+
+    async def rehydrate(
+        self,
+        organization_id: str,
+        conversation_id: str,
+        ttl_days: int = settings.MESSAGE_REHYDRATE_TTL_DAYS
+    ) -> int:
+        """
+        Restore an archived conversation into the hot messages table
+
+        Restored items get a fresh, short TTL so the table shrinks again once
+        the conversation goes quiet.
+
+        Returns:
+            Number of messages restored
+        """
+        messages = await self.load(organization_id, conversation_id)
+        expiry = expires_at(ttl_days)
+        for message in messages:
+            if expiry:
+                message[TTL_ATTRIBUTE] = expiry
+            else:
+                message.pop(TTL_ATTRIBUTE, None)
+        await batch_write_items(
+            self.dynamodb.client,
+            self.dynamodb.message_table.name,
+            [self.dynamodb.message_item(m) for m in messages]
+        )
+        return len(messages)
@@ -1,39 +1,248 @@
-from typing import List, Optional, Dict
+import asyncio
+import base64
+import binascii
+from typing import Any, List, NamedTuple, Optional, Dict, Tuple
 from datetime import datetime
 from app.db.dynamodb.models import (
     DynamoDBClient,
+    ChatModel,
     ConversationModel,
     MessageModel,
     RateLimitModel
 )
+from app.db.dynamodb.compression import ItemCompressor
+from app.db.dynamodb.message_cache import RecentMessageCache
+from app.db.dynamodb.retention import TTL_ATTRIBUTE, expires_at
+from app.db.dynamodb.write_buffer import WriteBuffer
+from app.core.config import settings
+
+def encode_cursor(timestamp: str) -> str:
+    """Opaque pagination cursor for a message's sort key."""
+    return base64.urlsafe_b64encode(timestamp.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str) -> str:
+    """Inverse of encode_cursor; raises ValueError for malformed cursors."""
+    try:
+        return base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+    except (binascii.Error, UnicodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+class MessagePage(NamedTuple):
+    items: List[Dict]
+    # Pass as `before` to fetch older messages; None when there are none
+    older_cursor: Optional[str]
+    # Pass as `after` to fetch newer messages; None when there are none
+    newer_cursor: Optional[str]
+
+class ConversationPage(NamedTuple):
+    conversation: Optional[Dict]
+    messages: MessagePage
+
+def split_conversation_id(conversation_id: str) -> Tuple[str, str]:
+    """(phone_number, timestamp) of a "<phone_number>:<timestamp>" conversation id."""
+    phone_number, sep, timestamp = conversation_id.partition(':')
+    if not sep or not phone_number or not timestamp:
+        raise ValueError(f"Invalid conversation id: {conversation_id}")
+    return phone_number, timestamp
 
 class DynamoDBService:
-    def __init__(self):
+    """
+    Conversations, messages and rate limits in DynamoDB
+    
+    With single_table, conversation headers and messages live in one
+    partition per conversation of the chat table (see ChatModel), so a
+    conversation and its latest messages are read with a single Query.
+    Otherwise they are kept in the conversations and messages tables.
+    """
+    
+    def __init__(
+        self,
+        write_behind: bool = settings.DYNAMODB_WRITE_BEHIND,
+        single_table: bool = settings.DYNAMODB_SINGLE_TABLE
+    ):
         self.client = DynamoDBClient()
+        self.single_table = single_table
         self.conversations = ConversationModel(self.client)
         self.messages = MessageModel(self.client)
+        self.chat = ChatModel(self.client)
         self.rate_limits = RateLimitModel(self.client)
+        self.message_table = self.chat.table if single_table else self.messages.table
+        self.message_key = ('pk', 'sk') if single_table else ('conversation_id', 'timestamp')
+        self.message_buffer = WriteBuffer(
+            self.client,
+            self.message_table.name,
+            self.message_key
+        ) if write_behind else None
+        self.message_cache = RecentMessageCache() if settings.MESSAGE_CACHE_ENABLED else None
+        self.compressor = ItemCompressor()
+    
+    async def close(self) -> None:
+        """Flush buffered writes and shut down the DynamoDB thread pool."""
+        if self.message_buffer is not None:
+            await self.message_buffer.close()
+        self.client.close()
+    
+    def _partition(self, conversation_id: str) -> str:
+        """Hash key value holding a conversation's messages."""
+        return ChatModel.partition_key(conversation_id) if self.single_table else conversation_id
     
-    async def create_conversation(self, phone_number: str, metadata: Dict = None) -> Dict:
+    def message_item(self, message: Dict) -> Dict:
+        """
+        A message as stored in the current layout: pk/sk are added for the
+        chat table and large attributes are compressed.
+        """
+        if not self.single_table:
+            return self.compressor.encode({k: v for k, v in message.items() if k not in ('pk', 'sk')})
+        return self.compressor.encode({
+            **message,
+            'pk': ChatModel.partition_key(message['conversation_id']),
+            'sk': ChatModel.message_sort_key(message['timestamp'])
+        })
+    
+    async def create_conversation(
+        self,
+        phone_number: str,
+        metadata: Dict = None,
+        organization_id: Optional[str] = None
+    ) -> Dict:
         timestamp = datetime.utcnow().isoformat()
         item = {
             'phone_number': phone_number,
             'timestamp': timestamp,
+            'conversation_id': f"{phone_number}:{timestamp}",
             'metadata': metadata or {}
         }
-        self.conversations.table.put_item(Item=item)
+        if organization_id:
+            item['organization_id'] = organization_id
+        if self.single_table:
+            await self.chat.table.put_item(Item={
+                **item,
+                'pk': ChatModel.partition_key(item['conversation_id']),
+                'sk': ChatModel.HEADER_SORT_KEY
+            })
+        else:
+            await self.conversations.table.put_item(Item=item)
         return item
     
     async def get_conversation(self, phone_number: str, timestamp: str) -> Optional[Dict]:
-        response = await self.conversations.table.get_item(
-            Key={
-                'phone_number': phone_number,
-                'timestamp': timestamp
-            }
-        )
+        if self.single_table:
+            response = await self.chat.table.get_item(
+                Key={
+                    'pk': ChatModel.partition_key(f"{phone_number}:{timestamp}"),
+                    'sk': ChatModel.HEADER_SORT_KEY
+                }
+            )
+        else:
+            response = await self.conversations.table.get_item(
+                Key={
+                    'phone_number': phone_number,
+                    'timestamp': timestamp
+                }
+            )
         return response.get('Item')
     
-    async def create_message(self, conversation_id: str, content: str, role: str, metadata: Dict = None) -> Dict:
+    async def get_conversation_by_id(self, conversation_id: str) -> Optional[Dict]:
+        """Conversation header for a "<phone_number>:<timestamp>" id; None if malformed or missing."""
+        try:
+            phone_number, timestamp = split_conversation_id(conversation_id)
+        except ValueError:
+            return None
+        return await self.get_conversation(phone_number, timestamp)
+    
+    def _conversation_key(self, conversation_id: str) -> Dict[str, str]:
+        """Key of a conversation's header item."""
+        if self.single_table:
+            return {'pk': ChatModel.partition_key(conversation_id), 'sk': ChatModel.HEADER_SORT_KEY}
+        try:
+            phone_number, timestamp = split_conversation_id(conversation_id)
+        except ValueError:
+            # Conversations not started with create_conversation (a WhatsApp
+            # sender's) get a header keyed by their id
+            phone_number, timestamp = conversation_id, ChatModel.HEADER_SORT_KEY
+        return {'phone_number': phone_number, 'timestamp': timestamp}
+    
+    def _conversation_table(self):
+        return self.chat.table if self.single_table else self.conversations.table
+    
+    async def get_summary_state(self, conversation_id: str) -> Dict[str, Any]:
+        """The conversation's rolling summary state (see ConversationWindow); empty if it has none."""
+        response = await self._conversation_table().get_item(
+            Key=self._conversation_key(conversation_id),
+            ProjectionExpression='summary_state'
+        )
+        state = dict((response.get('Item') or {}).get('summary_state') or {})
+        if 'summarized_count' in state:
+            # Numbers come back from DynamoDB as Decimal
+            state['summarized_count'] = int(state['summarized_count'])
+        return state
+    
+    async def save_summary_state(self, conversation_id: str, state: Dict[str, Any]) -> None:
+        """Store the rolling summary state on the conversation's header item, creating it if needed."""
+        await self._conversation_table().update_item(
+            Key=self._conversation_key(conversation_id),
+            UpdateExpression='SET summary_state = :state',
+            ExpressionAttributeValues={':state': state}
+        )
+    
+    async def get_conversation_page(self, conversation_id: str, limit: int = 50) -> ConversationPage:
+        """
+        A conversation header and its latest page of messages
+        
+        In the single-table layout this is one newest-first Query over the
+        conversation's partition; otherwise the header and the messages are
+        read from their own tables concurrently.
+        
+        Args:
+            conversation_id: "<phone_number>:<timestamp>" conversation id
+            limit: Maximum number of messages in the page
+            
+        Returns:
+            The header (None if the conversation does not exist) and the page
+        """
+        if not self.single_table:
+            conversation, page = await asyncio.gather(
+                self.get_conversation_by_id(conversation_id),
+                self.list_messages(conversation_id, limit=limit)
+            )
+            return ConversationPage(conversation, page)
+        
+        kwargs: Dict[str, Any] = {
+            'KeyConditionExpression': 'pk = :pk',
+            'ExpressionAttributeValues': {':pk': ChatModel.partition_key(conversation_id)},
+            'ScanIndexForward': False
+        }
+        conversation = None
+        items: List[Dict] = []
+        while True:
+            # One extra item for the header, which comes first, and one to
+            # tell whether there are older messages
+            kwargs['Limit'] = limit + 2 - len(items) - (conversation is not None)
+            response = await self.chat.table.query(**kwargs)
+            for item in response.get('Items', []):
+                if item['sk'] == ChatModel.HEADER_SORT_KEY:
+                    conversation = item
+                else:
+                    items.append(ItemCompressor.decode(item))
+            last_key = response.get('LastEvaluatedKey')
+            if not last_key or len(items) > limit:
+                break
+            kwargs['ExclusiveStartKey'] = last_key
+        
+        items, more = self._merge_pending(conversation_id, items, limit, False, newest_first=True)
+        return ConversationPage(conversation, MessagePage(
+            items,
+            encode_cursor(items[-1]['timestamp']) if items and more else None,
+            None
+        ))
+    
+    async def create_message(
+        self,
+        conversation_id: str,
+        content: str,
+        role: str,
+        metadata: Dict = None,
+        ttl_days: Optional[int] = None
+    ) -> Dict:
         timestamp = datetime.utcnow().isoformat()
         item = {
             'conversation_id': conversation_id,
@@ -42,25 +251,195 @@ class DynamoDBService:
             'role': role,
             'metadata': metadata or {}
         }
-        await self.messages.table.put_item(Item=item)
+        expiry = expires_at(ttl_days)
+        if expiry:
+            item[TTL_ATTRIBUTE] = expiry
+        stored = self.message_item(item)
+        if self.message_buffer is not None:
+            self.message_buffer.add(stored)
+        else:
+            await self.message_table.put_item(Item=stored)
+        if self.message_cache is not None:
+            await self.message_cache.append(conversation_id, item)
         return item
     
-    async def get_conversation_messages(self, conversation_id: str) -> List[Dict]:
-        response = await self.messages.table.query(
-            KeyConditionExpression='conversation_id = :cid',
-            ExpressionAttributeValues={
-                ':cid': conversation_id
+    async def _query_messages(
+        self,
+        conversation_id: str,
+        limit: Optional[int],
+        newest_first: bool,
+        before: Optional[str] = None,
+        after: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Query a conversation's messages, following LastEvaluatedKey until
+        limit items have been read (or the partition is exhausted).
+        """
+        if self.single_table:
+            # Bound the range to message keys so the header is never read
+            condition = 'pk = :cid AND #ts BETWEEN :after AND :before'
+            names = {'#ts': 'sk'}
+            values: Dict[str, Any] = {
+                ':cid': self._partition(conversation_id),
+                ':after': ChatModel.message_sort_key(after) if after else ChatModel.MESSAGE_PREFIX,
+                ':before': ChatModel.message_sort_key(before) if before else ChatModel.MESSAGE_PREFIX_END
             }
+            inclusive_bounds = bool(before) + bool(after)
+        else:
+            condition = 'conversation_id = :cid'
+            names = {'#ts': 'timestamp'}
+            values = {':cid': conversation_id}
+            inclusive_bounds = 0
+            if before and after:
+                condition += ' AND #ts BETWEEN :after AND :before'
+                values.update({':after': after, ':before': before})
+                inclusive_bounds = 2
+            elif before:
+                condition += ' AND #ts < :before'
+                values[':before'] = before
+            elif after:
+                condition += ' AND #ts > :after'
+                values[':after'] = after
+        
+        # BETWEEN is inclusive, so read extra items to drop the bounds, and
+        # one more to tell whether the range holds more than limit messages
+        target = limit + 1 + inclusive_bounds if limit else limit
+        kwargs: Dict[str, Any] = {
+            'KeyConditionExpression': condition,
+            'ExpressionAttributeNames': names,
+            'ExpressionAttributeValues': values,
+            'ScanIndexForward': not newest_first
+        }
+        items: List[Dict] = []
+        while True:
+            if target:
+                kwargs['Limit'] = target - len(items)
+            response = await self.message_table.query(**kwargs)
+            items.extend(ItemCompressor.decode(i) for i in response.get('Items', []))
+            last_key = response.get('LastEvaluatedKey')
+            if not last_key or (target and len(items) >= target):
+                break
+            kwargs['ExclusiveStartKey'] = last_key
+        
+        if inclusive_bounds:
+            items = [
+                i for i in items
+                if (not before or i['timestamp'] < before) and (not after or i['timestamp'] > after)
+            ]
+        items, more = self._merge_pending(conversation_id, items, limit, False, newest_first, before, after)
+        return {'items': items, 'more': more}
+    
+    def _merge_pending(
+        self,
+        conversation_id: str,
+        items: List[Dict],
+        limit: Optional[int],
+        more: bool,
+        newest_first: bool,
+        before: Optional[str] = None,
+        after: Optional[str] = None
+    ) -> Tuple[List[Dict], bool]:
+        """Read-your-writes: merge messages still waiting in the write buffer."""
+        if self.message_buffer is not None:
+            pending = [
+                i for i in map(ItemCompressor.decode, self.message_buffer.pending_items(self._partition(conversation_id)))
+                if (not before or i['timestamp'] < before) and (not after or i['timestamp'] > after)
+            ]
+            if pending:
+                merged = {i['timestamp']: i for i in items}
+                merged.update((i['timestamp'], i) for i in pending)
+                items = sorted(merged.values(), key=lambda i: i['timestamp'], reverse=newest_first)
+        
+        if limit and len(items) > limit:
+            items, more = items[:limit], True
+        return items, more
+    
+    async def get_conversation_messages(self, conversation_id: str) -> List[Dict]:
+        """All messages in a conversation, oldest first."""
+        response = await self._query_messages(conversation_id, None, newest_first=False)
+        return response['items']
+    
+    async def get_recent_messages(self, conversation_id: str, count: int) -> List[Dict]:
+        """
+        The last `count` messages of a conversation, oldest first
+        
+        Served from the recent message cache for active conversations;
+        otherwise reads only the items it returns (newest-first query with
+        Limit), so it is the fast path for building AI context.
+        """
+        if self.message_cache is not None:
+            cached = await self.message_cache.get(conversation_id, count)
+            if cached is not None:
+                return cached
+        
+        # Read a full cache entry so later calls with any count up to it hit
+        read_count = count
+        if self.message_cache is not None and count <= self.message_cache.messages_per_conversation:
+            read_count = self.message_cache.messages_per_conversation
+        response = await self._query_messages(conversation_id, read_count, newest_first=True)
+        messages = list(reversed(response['items']))
+        if self.message_cache is not None:
+            await self.message_cache.put(conversation_id, messages)
+        return messages[-count:] if count else []
+    
+    async def list_messages(
+        self,
+        conversation_id: str,
+        limit: int = 50,
+        before: Optional[str] = None,
+        after: Optional[str] = None
+    ) -> MessagePage:
+        """
+        One page of messages, newest first
+        
+        Args:
+            conversation_id: Conversation to read
+            limit: Maximum number of messages in the page
+            before: Cursor; only return messages older than it
+            after: Cursor; only return messages newer than it
+            
+        Returns:
+            The page and the cursors for the adjacent pages
+            
+        Raises:
+            ValueError: A cursor is malformed or before is not later than after
+        """
+        before_ts = decode_cursor(before) if before else None
+        after_ts = decode_cursor(after) if after else None
+        if before_ts and after_ts and before_ts <= after_ts:
+            raise ValueError("before must be later than after")
+        
+        if after_ts and not before_ts:
+            # Read forwards from the cursor so the page starts right after it
+            response = await self._query_messages(conversation_id, limit, False, after=after_ts)
+            items = list(reversed(response['items']))
+            has_older, has_newer = True, response['more']
+        else:
+            response = await self._query_messages(conversation_id, limit, True, before_ts, after_ts)
+            items = response['items']
+            has_older, has_newer = response['more'], before_ts is not None
+        
+        if not items:
+            return MessagePage(items, before if has_older else None, after if has_newer else None)
+        return MessagePage(
+            items,
+            encode_cursor(items[-1]['timestamp']) if has_older else None,
+            encode_cursor(items[0]['timestamp']) if has_newer else None
         )
-        return response.get('Items', [])
     
-    async def update_rate_limit(self, key: str, window_start: str, count: int) -> None:
-        item = {
-            'key': key,
-            'window_start': window_start,
-            'count': count
-        }
-        await self.rate_limits.table.put_item(Item=item)
+    async def increment_rate_limit(self, key: str, window_start: str, amount: int, expires: int) -> int:
+        """Atomically add to a rate limit window's counter; returns the new count."""
+        response = await self.rate_limits.table.update_item(
+            Key={
+                'key': key,
+                'window_start': window_start
+            },
+            UpdateExpression='ADD #count :amount SET expires_at = if_not_exists(expires_at, :expires)',
+            ExpressionAttributeNames={'#count': 'count'},
+            ExpressionAttributeValues={':amount': amount, ':expires': expires},
+            ReturnValues='UPDATED_NEW'
+        )
+        return int(response['Attributes']['count'])
     
     async def get_rate_limit(self, key: str, window_start: str) -> Optional[Dict]:
         response = await self.rate_limits.table.get_item(
@@ -0,0 +1,237 @@
+"""
+Write-behind buffer that groups message writes into BatchWriteItem calls
+"""
+import asyncio
+import contextvars
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.db.dynamodb.models import DynamoDBClient, is_retryable, serialize
+
+logger = logging.getLogger(__name__)
+
+# DynamoDB accepts at most 25 put/delete requests per BatchWriteItem call
+MAX_BATCH_SIZE = 25
+# Upper bound of the backoff before a failed batch is queued again
+MAX_REQUEUE_DELAY = 5.0
+
+ItemKey = Tuple[str, str]
+
+class UnprocessedItemsError(RuntimeError):
+    """DynamoDB kept returning some of a batch as UnprocessedItems."""
+
+async def batch_write_items(
+    dynamo_client: DynamoDBClient,
+    table_name: str,
+    items: List[Dict[str, Any]],
+    max_retries: int = settings.DYNAMODB_WRITE_BEHIND_MAX_RETRIES,
+    tenant: Any = None
+) -> None:
+    """
+    Put items with BatchWriteItem, MAX_BATCH_SIZE at a time
+
+    UnprocessedItems are retried with exponential backoff; raises once a
+    batch still has unprocessed items after max_retries. The calls are
+    timed against tenant (see DynamoDBClient.call).
+    """
+    for start in range(0, len(items), MAX_BATCH_SIZE):
+        requests = [{"PutRequest": {"Item": serialize(item)}} for item in items[start:start + MAX_BATCH_SIZE]]
+        attempt = 0
+        while requests:
+            response = await dynamo_client.call(
+                "batch_write_item",
+                tenant=tenant,
+                RequestItems={table_name: requests}
+            )
+            metrics.increment("dynamodb_batch_writes", table=table_name)
+            metrics.increment("dynamodb_batch_items", len(requests), table=table_name)
+            requests = response.get("UnprocessedItems", {}).get(table_name, [])
+            if not requests:
+                break
+            attempt += 1
+            if attempt > max_retries:
+                raise UnprocessedItemsError(f"{len(requests)} items still unprocessed after {max_retries} retries")
+            metrics.increment("dynamodb_unprocessed_retries", table=table_name)
+            await asyncio.sleep(min(0.05 * 2 ** attempt, 2.0))
+
+class WriteBuffer:
+    """
+    Buffers item writes for one table and flushes them with BatchWriteItem
+
+    A batch is flushed when it reaches MAX_BATCH_SIZE items, after
+    flush_interval seconds, or at shutdown. UnprocessedItems are retried with
+    exponential backoff. Items stay visible through pending_items() until
+    they have been written, so readers can merge them for read-your-writes.
+
+    Writes are acknowledged before DynamoDB has them, so a batch that fails
+    with throttling, a 5xx or a connection error goes back to the front of
+    the queue after a backoff that grows while failures continue. An item
+    is dropped only after max_requeues such failures, or when DynamoDB
+    rejects it outright (a validation error, an oversized item): a rejected
+    batch is split until the item is found, so the rest of it is written.
+    Dropped items (dynamodb_write_buffer_dead_letters) and items still
+    unwritten after the shutdown drain (dynamodb_write_buffer_lost) are
+    logged by key.
+    """
+
+    def __init__(
+        self,
+        dynamo_client: DynamoDBClient,
+        table_name: str,
+        key_attributes: Tuple[str, str],
+        flush_interval: float = settings.DYNAMODB_WRITE_BEHIND_INTERVAL_SECONDS,
+        max_retries: int = settings.DYNAMODB_WRITE_BEHIND_MAX_RETRIES,
+        max_requeues: int = settings.DYNAMODB_WRITE_BEHIND_MAX_REQUEUES
+    ):
+        self.dynamo_client = dynamo_client
+        self.table_name = table_name
+        self.key_attributes = key_attributes
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.max_requeues = max_requeues
+        self._queue: List[Dict[str, Any]] = []
+        self._in_flight: Dict[ItemKey, Dict[str, Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._flushes: set = set()
+        self._wakeup = asyncio.Event()
+        # Batches failed in a row; sets the requeue backoff
+        self._failures = 0
+        # Times each queued item has been put back after a failed flush
+        self._requeues: Dict[ItemKey, int] = {}
+
+    def _key(self, item: Dict[str, Any]) -> ItemKey:
+        hash_key, range_key = self.key_attributes
+        return item[hash_key], item[range_key]
+
+    def add(self, item: Dict[str, Any]) -> None:
+        """Queue an item for writing; returns without waiting for DynamoDB."""
+        if self._task is None:
+            # The flusher outlives the request that starts it; an empty context
+            # keeps that request's tenant and request ID off its metrics and logs
+            self._task = contextvars.Context().run(asyncio.create_task, self._run())
+        key = self._key(item)
+        self._in_flight[key] = item
+        self._requeues.pop(key, None)
+        self._queue.append(item)
+        metrics.set_gauge("dynamodb_write_buffer_depth", len(self._queue), table=self.table_name)
+        if len(self._queue) >= MAX_BATCH_SIZE:
+            self._wakeup.set()
+
+    def pending_items(self, hash_value: str) -> List[Dict[str, Any]]:
+        """Items for a partition that are queued or being written."""
+        return [item for (key, _), item in self._in_flight.items() if key == hash_value]
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            while self._queue:
+                batch = self._take_batch()
+                # Write batches concurrently; the next size trigger need not wait
+                task = asyncio.create_task(self._write_batch(batch))
+                self._flushes.add(task)
+                task.add_done_callback(self._flushes.discard)
+
+    def _take_batch(self) -> List[Dict[str, Any]]:
+        batch: Dict[ItemKey, Dict[str, Any]] = {}
+        while self._queue and len(batch) < MAX_BATCH_SIZE:
+            item = self._queue.pop(0)
+            # A batch may not contain the same key twice; the latest write wins
+            batch[self._key(item)] = item
+        metrics.set_gauge("dynamodb_write_buffer_depth", len(self._queue), table=self.table_name)
+        return list(batch.values())
+
+    @staticmethod
+    def _tenant(batch: List[Dict[str, Any]]) -> Optional[str]:
+        """
+        Organization the batch's writes are timed against
+
+        None (labelled "none" in the flusher's empty context) when the
+        batch mixes organizations or its items do not say.
+        """
+        organizations = {(item.get("metadata") or {}).get("organization_id") for item in batch}
+        return organizations.pop() if len(organizations) == 1 else None
+
+    def _is_latest(self, item: Dict[str, Any]) -> bool:
+        return self._in_flight.get(self._key(item)) is item
+
+    def _dead_letter(self, item: Dict[str, Any], error: Exception) -> None:
+        key = self._key(item)
+        self._requeues.pop(key, None)
+        if self._is_latest(item):
+            del self._in_flight[key]
+        metrics.increment("dynamodb_write_buffer_dead_letters", table=self.table_name)
+        logger.error(f"Dropped buffered write of {key} to {self.table_name}: {error}")
+
+    async def _requeue(self, batch: List[Dict[str, Any]], error: Exception) -> None:
+        self._failures += 1
+        delay = min(0.05 * 2 ** self._failures, MAX_REQUEUE_DELAY)
+        metrics.increment("dynamodb_write_buffer_failures", len(batch), table=self.table_name)
+        logger.error(f"Write-behind batch to {self.table_name} failed, retrying in {delay:.2f}s: {error}")
+        retry = []
+        for item in batch:
+            if not self._is_latest(item):
+                continue
+            key = self._key(item)
+            self._requeues[key] = self._requeues.get(key, 0) + 1
+            if self._requeues[key] > self.max_requeues:
+                self._dead_letter(item, error)
+            else:
+                retry.append(item)
+        await asyncio.sleep(delay)
+        # Items overwritten meanwhile are already queued in their newer version
+        self._queue[:0] = [item for item in retry if self._is_latest(item)]
+        metrics.set_gauge("dynamodb_write_buffer_depth", len(self._queue), table=self.table_name)
+        self._wakeup.set()
+
+    async def _write_batch(self, batch: List[Dict[str, Any]]) -> None:
+        try:
+            await batch_write_items(
+                self.dynamo_client, self.table_name, batch, self.max_retries, self._tenant(batch)
+            )
+        except Exception as e:
+            if isinstance(e, UnprocessedItemsError) or is_retryable(e):
+                await self._requeue(batch, e)
+            elif len(batch) > 1:
+                # DynamoDB rejects the whole batch for one bad item; halve it to find the item
+                middle = len(batch) // 2
+                await asyncio.gather(self._write_batch(batch[:middle]), self._write_batch(batch[middle:]))
+            else:
+                self._dead_letter(batch[0], e)
+            return
+        self._failures = 0
+        for item in batch:
+            if self._is_latest(item):
+                key = self._key(item)
+                del self._in_flight[key]
+                self._requeues.pop(key, None)
+
+    async def flush(self) -> None:
+        """
+        Write everything queued so far and wait for in-progress batches
+
+        Batches that fail are back in the queue when this returns.
+        """
+        batches = []
+        while self._queue:
+            batches.append(self._take_batch())
+        await asyncio.gather(*(self._write_batch(batch) for batch in batches), *list(self._flushes))
+
+    async def close(self) -> None:
+        """Stop the background flusher and drain the buffer, retrying failed batches."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for _ in range(self.max_retries + 1):
+            await self.flush()
+            if not self._queue:
+                return
+        metrics.increment("dynamodb_write_buffer_lost", len(self._queue), table=self.table_name)
+        logger.error(
+            f"{len(self._queue)} buffered writes to {self.table_name} were not written before shutdown: "
+            f"{[self._key(item) for item in self._queue]}"
+        )
@@ -1,6 +1,6 @@
-from sqlalchemy import Column, String, Boolean, DateTime, ForeignKey, JSON, Integer
+from sqlalchemy import Column, String, Boolean, DateTime, ForeignKey, JSON, Integer, BigInteger, Index
 from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.ext.declarative import declarative_base, declared_attr
 from sqlalchemy.sql import func
 import uuid
 
@@ -24,8 +24,14 @@ class WhatsAppUser(Base):
     organization_id = Column(UUID(as_uuid=True), ForeignKey("organizations.id"))
     is_active = Column(Boolean, default=True)
     settings = Column(JSON, nullable=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     last_active = Column(DateTime(timezone=True), onupdate=func.now())
+    
+    # Keyset pages per organization, one index per sort order
+    __table_args__ = (
+        Index("ix_whatsapp_users_org_created", "organization_id", "created_at", "phone_number"),
+        Index("ix_whatsapp_users_org_phone", "organization_id", "phone_number"),
+    )
 
 class KnowledgeBase(Base):
     __tablename__ = "knowledge_bases"
@@ -36,8 +42,13 @@ class KnowledgeBase(Base):
     description = Column(String, nullable=True)
     vector_store_ids = Column(JSON, nullable=True)  # Store Pinecone namespace/ids
     extra_metadata = Column(JSON, nullable=True)  # Renamed from metadata
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    
+    __table_args__ = (
+        Index("ix_knowledge_bases_org_created", "organization_id", "created_at", "id"),
+        Index("ix_knowledge_bases_org_name", "organization_id", "name", "id"),
+    )
 
 class UsageMetrics(Base):
     __tablename__ = "usage_metrics"
@@ -49,3 +60,27 @@ class UsageMetrics(Base):
     token_count = Column(Integer, default=0)
     embedding_count = Column(Integer, default=0)
     extra_metadata = Column(JSON, nullable=True)  # Renamed from metadata
+    
+    __table_args__ = (
+        Index("ix_usage_metrics_org_date", "organization_id", "date", "id"),
+    )
+
+# Usage totals per organization, time bucket and metric type. Rows are only
+# incremented with INSERT ... ON CONFLICT DO UPDATE, so workers never coordinate.
+class UsageRollupMixin:
+    @declared_attr
+    def organization_id(cls):
+        return Column(UUID(as_uuid=True), ForeignKey("organizations.id"), primary_key=True)
+    
+    bucket = Column(DateTime(timezone=True), primary_key=True)  # Start of the hour/day/month (UTC)
+    metric_type = Column(String, primary_key=True)
+    value = Column(BigInteger, nullable=False, default=0)
+
+class UsageRollupHourly(UsageRollupMixin, Base):
+    __tablename__ = "usage_rollups_hourly"
+
+class UsageRollupDaily(UsageRollupMixin, Base):
+    __tablename__ = "usage_rollups_daily"
+
+class UsageRollupMonthly(UsageRollupMixin, Base):
+    __tablename__ = "usage_rollups_monthly"
@@ -0,0 +1,126 @@
+"""
+Keyset (cursor) pagination over column-only queries
+"""
+import base64
+import binascii
+import json
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+from sqlalchemy import DateTime, Select, literal, tuple_
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.ext.asyncio import AsyncSession
+
+class Page(NamedTuple):
+    items: List[Dict[str, Any]]
+    # Pass back as `cursor` for the next page; None on the last page
+    next_cursor: Optional[str]
+
+def _to_json(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+def _from_json(column: Any, value: Any) -> Any:
+    # asyncpg binds parameters by type, so cursor values must be rebuilt as such
+    if value is None:
+        return None
+    if isinstance(column.type, DateTime):
+        return datetime.fromisoformat(value)
+    if isinstance(column.type, UUID):
+        return uuid.UUID(value)
+    return value
+
+def sort_key(*columns: Any) -> Tuple[Any, ...]:
+    """
+    Sort columns for keyset_page, checked where a router defines them
+
+    Raises TypeError for a nullable column: the row comparison keyset_page
+    seeks with is never true for a NULL, so such rows would be skipped.
+    """
+    nullable = [column.key for column in columns if column.nullable]
+    if nullable:
+        raise TypeError(f"Keyset sort columns must be NOT NULL: {', '.join(nullable)}")
+    return columns
+
+def _sort_signature(columns: Sequence[Any], descending: bool) -> List[str]:
+    return [column.key for column in columns] + ["desc" if descending else "asc"]
+
+def encode_cursor(values: Sequence[Any], columns: Sequence[Any], descending: bool = False) -> str:
+    """
+    Cursor for a row's sort key values
+
+    The sort columns and order are recorded with the values, so a cursor
+    cannot be replayed against a different sort.
+    """
+    payload = json.dumps(
+        {"sort": _sort_signature(columns, descending), "values": [_to_json(v) for v in values]},
+        separators=(",", ":")
+    )
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str, columns: Sequence[Any], descending: bool = False) -> List[Any]:
+    """Inverse of encode_cursor; raises ValueError for malformed cursors or another sort's cursor."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        values = payload["values"]
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError
+        sort = payload["sort"]
+    except (binascii.Error, UnicodeError, TypeError, KeyError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    if sort != _sort_signature(columns, descending):
+        raise ValueError("Cursor was issued for a different sort or order")
+    try:
+        return [_from_json(column, value) for column, value in zip(columns, values)]
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+async def keyset_page(
+    db: AsyncSession,
+    query: Select,
+    sort_columns: Sequence[Any],
+    limit: int,
+    cursor: Optional[str] = None,
+    descending: bool = False
+) -> Page:
+    """
+    Fetch one page of a column-only query, ordered by sort_columns
+
+    The last sort column must be unique (the primary key) so the order is
+    total, and none may be nullable (see sort_key). Each page seeks past the previous one with a row comparison,
+    (a, b) > (:a, :b), which an index on the sort columns answers without
+    scanning the skipped rows, unlike OFFSET.
+
+    Args:
+        db: Session to run the query on
+        query: select() of plain columns with the tenant filter applied
+        sort_columns: Columns to order and seek by; must all be selected
+        limit: Maximum number of rows in the page
+        cursor: next_cursor of a previous page with the same sort and order
+        descending: Newest/largest first
+
+    Returns:
+        The rows as dicts and the cursor for the next page
+
+    Raises:
+        ValueError: The cursor is malformed or was issued for another sort
+    """
+    if cursor:
+        key = tuple_(*sort_columns)
+        values = tuple_(*(
+            literal(value, column.type)
+            for column, value in zip(sort_columns, decode_cursor(cursor, sort_columns, descending))
+        ))
+        query = query.where(key < values if descending else key > values)
+    order = [column.desc() if descending else column.asc() for column in sort_columns]
+    result = await db.execute(query.order_by(*order).limit(limit + 1))
+    rows = [dict(row) for row in result.mappings()]
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1][column.key] for column in sort_columns], sort_columns, descending)
+    return Page(rows, next_cursor)
@@ -0,0 +1,287 @@
+"""
+Bulk import of WhatsApp users through COPY and a staging table
+"""
+import codecs
+import csv
+import json
+import re
+import time
+from typing import Any, AsyncIterator, List, NamedTuple, Optional, Tuple
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core.metrics import metrics
+
+STAGING_TABLE = "whatsapp_user_import"
+STAGING_COLUMNS = ("line", "phone_number", "is_active", "settings")
+
+# Formatting people put in phone numbers; stripped before validation
+PHONE_FORMATTING = re.compile(r"[\s\-().]")
+# Numbers are stored as WhatsApp reports senders: country code and number, digits only
+PHONE_NUMBER = re.compile(r"^[1-9][0-9]{7,14}$")
+
+TRUE_VALUES = {"1", "true", "yes", "y", "t"}
+FALSE_VALUES = {"0", "false", "no", "n", "f"}
+
+class ImportIssue(NamedTuple):
+    line: int
+    phone_number: Optional[str]
+    reason: str
+
+class ImportReport(NamedTuple):
+    received: int
+    inserted: int
+    updated: int
+    # Already registered to this organization and left unchanged
+    existing: int
+    invalid: int
+    # Later occurrences of a number that appears more than once in the upload
+    duplicates: int
+    # Registered to another organization
+    conflicts: int
+    issues: List[ImportIssue]
+    issues_truncated: bool
+
+def normalize_phone_number(value: Any) -> str:
+    """The number in stored form; raises ValueError if it is not a phone number."""
+    number = PHONE_FORMATTING.sub("", str(value or ""))
+    if number.startswith("+"):
+        number = number[1:]
+    elif number.startswith("00"):
+        number = number[2:]
+    if not PHONE_NUMBER.match(number):
+        raise ValueError("invalid phone number")
+    return number
+
+def _parse_bool(value: Any) -> bool:
+    if value is None or value == "":
+        return True
+    if isinstance(value, bool):
+        return value
+    lowered = str(value).strip().lower()
+    if lowered in TRUE_VALUES:
+        return True
+    if lowered in FALSE_VALUES:
+        return False
+    raise ValueError("invalid is_active")
+
+def _parse_settings(value: Any) -> Optional[str]:
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            raise ValueError("settings is not valid JSON")
+    if not isinstance(value, dict):
+        raise ValueError("settings must be an object")
+    # asyncpg copies json columns as text
+    return json.dumps(value, separators=(",", ":"))
+
+def validate_row(line: int, row: dict) -> Tuple[int, str, bool, Optional[str]]:
+    """A staging record for a parsed row; raises ValueError naming the first problem."""
+    return (
+        line,
+        normalize_phone_number(row.get("phone_number")),
+        _parse_bool(row.get("is_active")),
+        _parse_settings(row.get("settings"))
+    )
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Decode a UTF-8 byte stream into lines without holding more than one chunk."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer.rstrip("\r")
+
+async def iter_rows(chunks: AsyncIterator[bytes], file_format: str) -> AsyncIterator[Tuple[int, Any]]:
+    """
+    (line number, row) pairs from a CSV or JSONL upload
+
+    CSV uploads need a header row with a phone_number column; is_active and
+    settings (a JSON object) are optional in both formats. A row that cannot
+    be parsed is yielded as its ValueError so it can be reported.
+    """
+    header: Optional[List[str]] = None
+    line_number = 0
+    async for line in iter_lines(chunks):
+        line_number += 1
+        if not line.strip():
+            continue
+        if file_format == "jsonl":
+            try:
+                row = json.loads(line)
+                yield line_number, row if isinstance(row, dict) else ValueError("row is not an object")
+            except ValueError:
+                yield line_number, ValueError("invalid JSON")
+            continue
+
+        # Quoted fields may contain commas but not line breaks
+        values = next(csv.reader([line]), [])
+        if header is None:
+            header = [name.strip().lower() for name in values]
+            if "phone_number" not in header:
+                raise ValueError("CSV header must include phone_number")
+            continue
+        if len(values) > len(header):
+            yield line_number, ValueError("too many fields")
+            continue
+        yield line_number, dict(zip(header, values))
+
+class WhatsAppUserImporter:
+    """
+    Imports an organization's WhatsApp users in one transaction
+
+    Rows are validated as they stream in and copied into a temporary staging
+    table in batches with COPY, which costs one round trip per batch instead
+    of a query per number. Once the upload ends, duplicates within it and
+    numbers registered to other organizations are removed from the staging
+    table and reported, and the rest is merged into whatsapp_users with a
+    single INSERT ... SELECT ... ON CONFLICT. Numbers the organization
+    already has are left as they are, or updated with update_existing.
+    """
+
+    def __init__(
+        self,
+        db: AsyncSession,
+        organization_id: Any,
+        update_existing: bool = False,
+        batch_size: int = settings.WHATSAPP_IMPORT_BATCH_SIZE,
+        max_rows: int = settings.WHATSAPP_IMPORT_MAX_ROWS,
+        max_issues: int = settings.WHATSAPP_IMPORT_MAX_REPORTED_ISSUES
+    ):
+        self.db = db
+        self.organization_id = organization_id
+        self.update_existing = update_existing
+        self.batch_size = batch_size
+        self.max_rows = max_rows
+        self.max_issues = max_issues
+        self._issues: List[ImportIssue] = []
+        self._truncated = False
+
+    def _report(self, issue: ImportIssue) -> None:
+        if len(self._issues) < self.max_issues:
+            self._issues.append(issue)
+        else:
+            self._truncated = True
+
+    async def _copy(self, connection: Any, records: List[Tuple]) -> None:
+        await connection.copy_records_to_table(STAGING_TABLE, records=records, columns=STAGING_COLUMNS)
+
+    async def _prune(self, statement: str, reason: str, **params: Any) -> int:
+        # Each statement deletes rows from the staging table and returns them
+        # with the total count, limited to what can still be reported
+        params["limit"] = self.max_issues - len(self._issues) + 1
+        result = await self.db.execute(text(statement), params)
+        total = 0
+        for line, phone_number, count in result.all():
+            total = count
+            self._report(ImportIssue(line, phone_number, reason))
+        return total
+
+    async def run(self, chunks: AsyncIterator[bytes], file_format: str) -> ImportReport:
+        """
+        Import an uploaded file and commit
+
+        Args:
+            chunks: The request body as it arrives
+            file_format: "csv" or "jsonl"
+
+        Returns:
+            Counts per outcome and the first max_issues rows that were not imported
+        """
+        start = time.perf_counter()
+        connection = (await (await self.db.connection()).get_raw_connection()).driver_connection
+        await self.db.execute(text(
+            f"CREATE TEMPORARY TABLE {STAGING_TABLE} "
+            "(line integer, phone_number text, is_active boolean, settings json) ON COMMIT DROP"
+        ))
+
+        received = invalid = 0
+        batch: List[Tuple] = []
+        async for line, row in iter_rows(chunks, file_format):
+            received += 1
+            if received > self.max_rows:
+                raise ValueError(f"Imports are limited to {self.max_rows} rows")
+            try:
+                if isinstance(row, ValueError):
+                    raise row
+                batch.append(validate_row(line, row))
+            except ValueError as e:
+                invalid += 1
+                phone_number = row.get("phone_number") if isinstance(row, dict) else None
+                self._report(ImportIssue(line, str(phone_number) if phone_number is not None else None, str(e)))
+                continue
+            if len(batch) >= self.batch_size:
+                await self._copy(connection, batch)
+                batch = []
+        if batch:
+            await self._copy(connection, batch)
+        # Temporary tables are never auto-analyzed; the joins below need row estimates
+        await self.db.execute(text(f"ANALYZE {STAGING_TABLE}"))
+
+        duplicates = await self._prune(f"""
+            WITH removed AS (
+                DELETE FROM {STAGING_TABLE} s USING {STAGING_TABLE} f
+                WHERE s.phone_number = f.phone_number AND s.line > f.line
+                RETURNING s.line, s.phone_number
+            )
+            SELECT line, phone_number, count(*) OVER () FROM removed ORDER BY line LIMIT :limit
+        """, "duplicate in upload")
+        conflicts = await self._prune(f"""
+            WITH removed AS (
+                DELETE FROM {STAGING_TABLE} s USING whatsapp_users u
+                WHERE u.phone_number = s.phone_number
+                  AND u.organization_id IS DISTINCT FROM CAST(:organization_id AS uuid)
+                RETURNING s.line, s.phone_number
+            )
+            SELECT line, phone_number, count(*) OVER () FROM removed ORDER BY line LIMIT :limit
+        """, "registered to another organization", organization_id=self.organization_id)
+
+        if self.update_existing:
+            on_conflict = (
+                "DO UPDATE SET is_active = EXCLUDED.is_active, "
+                "settings = COALESCE(EXCLUDED.settings, whatsapp_users.settings) "
+                "WHERE whatsapp_users.organization_id = EXCLUDED.organization_id"
+            )
+        else:
+            on_conflict = "DO NOTHING"
+        # xmax is 0 only for freshly inserted rows, which tells inserts from updates
+        merged = (await self.db.execute(text(f"""
+            WITH merged AS (
+                INSERT INTO whatsapp_users (phone_number, organization_id, is_active, settings, created_at)
+                SELECT phone_number, CAST(:organization_id AS uuid), is_active, settings, now()
+                FROM {STAGING_TABLE}
+                ORDER BY phone_number
+                ON CONFLICT (phone_number) {on_conflict}
+                RETURNING xmax = 0 AS inserted
+            )
+            SELECT
+                (SELECT count(*) FROM {STAGING_TABLE}),
+                count(*) FILTER (WHERE inserted),
+                count(*) FILTER (WHERE NOT inserted)
+            FROM merged
+        """), {"organization_id": self.organization_id})).one()
+        staged, inserted, updated = merged
+        await self.db.commit()
+
+        metrics.observe("whatsapp_import_seconds", time.perf_counter() - start)
+        metrics.increment("whatsapp_import_rows", inserted, outcome="inserted")
+        metrics.increment("whatsapp_import_rows", invalid + duplicates + conflicts, outcome="rejected")
+        return ImportReport(
+            received=received,
+            inserted=inserted,
+            updated=updated,
+            existing=staged - inserted - updated,
+            invalid=invalid,
+            duplicates=duplicates,
+            conflicts=conflicts,
+            issues=sorted(self._issues),
+            issues_truncated=self._truncated
+        )
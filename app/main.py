@@ -1,21 +1,47 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from app.api.v1 import (
     organizations,
     whatsapp_users,
     knowledge_bases,
     usage_metrics,
     conversations,
-    whatsapp_webhook
+    whatsapp_webhook,
+    analysis
 )
+from app.ai.accounting import usage_accountant
+from app.core.auth_cache import auth_cache
 from app.core.config import settings
+from app.core.logging import RequestIdMiddleware, setup_logging
+from app.core.metrics import metrics
+from app.core.prometheus import mark_process_dead, render_metrics
+from app.core.resources import Resources
 from app.db.dynamodb.init_tables import init_dynamodb
+from app.db.postgresql.database import async_engine
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Initialize DynamoDB tables and the shared clients on startup
+    init_dynamodb()
+    app.state.resources = Resources()
+    usage_accountant.start()
+    auth_cache.start()
+    yield
+    await auth_cache.stop()
+    await usage_accountant.stop()
+    await app.state.resources.close()
+    await async_engine.dispose()
+    mark_process_dead()
+
+setup_logging()
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
     description="Multi-tenant WhatsApp AI system with knowledge management",
-    version=settings.VERSION
+    version=settings.VERSION,
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -41,10 +67,8 @@ async def errors_handling(request: Request, call_next):
             }
         )
 
-# Initialize DynamoDB tables on startup
-@app.on_event("startup")
-async def startup_event():
-    init_dynamodb()
+# Added last so it wraps every other middleware and error responses carry the ID too
+app.add_middleware(RequestIdMiddleware)
 
 # Include routers
 app.include_router(
@@ -83,6 +107,22 @@ app.include_router(
     tags=["conversations"]
 )
 
+app.include_router(
+    analysis.router,
+    prefix=f"{settings.API_V1_STR}/analysis",
+    tags=["analysis"]
+)
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
+
+@app.get("/stats")
+async def stats():
+    return metrics.snapshot()
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    # Plain def: FastAPI runs it on the threadpool, off the event loop while multiprocess files are read
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
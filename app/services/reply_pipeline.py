@@ -0,0 +1,216 @@
+"""
+Retrieval-augmented reply pipeline for inbound WhatsApp messages
+"""
+import asyncio
+import logging
+import time
+from typing import Any, AsyncIterator, Awaitable, Dict, List, NamedTuple, Optional
+from app.ai.context import count_tokens
+from app.ai.embeddings import PineconeService
+from app.ai.guard import CircuitOpenError
+from app.ai.llm import DEGRADED_RESPONSE, LLMService
+from app.ai.router import RouteDecision
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.db.dynamodb.retention import retention_days
+from app.db.dynamodb.service import DynamoDBService
+from app.core.auth_cache import OrganizationSnapshot
+
+logger = logging.getLogger(__name__)
+
+KNOWLEDGE_BASE_PROMPT = """
+You are a helpful assistant for a residential building. Answer the resident's
+question using only the information below. If the answer is not there, say so.
+
+{context}
+"""
+
+SUMMARY_SECTION = """
+Summary of the earlier conversation:
+{summary}
+"""
+
+def whatsapp_conversation_id(phone_number: str) -> str:
+    """Conversation id used for a WhatsApp sender's message history."""
+    return f"{phone_number}_conversation"
+
+class PreparedReply(NamedTuple):
+    messages: List[Dict[str, str]]
+    system_prompt: str
+    route: RouteDecision
+    # Rolling summary state to store with the reply; None when unchanged
+    summary_state: Optional[Dict[str, Any]]
+
+class ReplyResult(NamedTuple):
+    text: str
+    timings: Dict[str, float]
+
+class ReplyPipeline:
+    """
+    Builds and generates the reply to one inbound message
+
+    Conversation history (DynamoDB) and knowledge base chunks (Pinecone) are
+    fetched concurrently, along with the conversation's rolling summary
+    state, so end-to-end latency is roughly
+    max(history, retrieval) + generation. Each stage is timed and recorded
+    under the reply_stage_seconds metric.
+    """
+
+    def __init__(
+        self,
+        organization: OrganizationSnapshot,
+        llm_service: LLMService,
+        dynamodb: DynamoDBService,
+        pinecone_service: PineconeService
+    ):
+        self.organization = organization
+        self.organization_id = str(organization.id)
+        self.llm_service = llm_service
+        self.dynamodb = dynamodb
+        self.pinecone_service = pinecone_service
+        self.timings: Dict[str, float] = {}
+
+    def _record(self, stage: str, elapsed: float) -> None:
+        self.timings[stage] = elapsed
+        metrics.observe("reply_stage_seconds", elapsed, stage=stage, organization_id=self.organization_id)
+
+    async def _timed(self, stage: str, awaitable: Awaitable[Any]) -> Any:
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self._record(stage, time.perf_counter() - start)
+
+    async def _fetch_history(self, conversation_id: str) -> List[Dict[str, str]]:
+        messages = await self.dynamodb.get_recent_messages(conversation_id, settings.REPLY_HISTORY_MESSAGES)
+        return [
+            {"role": m["role"], "content": m["content"], "timestamp": m["timestamp"]}
+            for m in messages
+        ]
+
+    def _build_context(self, matches: List[Any]) -> str:
+        """Concatenate retrieved chunks, best first, within the context token budget."""
+        chunks = []
+        used = 0
+        for match in matches:
+            text = (match.get('metadata') or {}).get('text', '')
+            if not text:
+                continue
+            cost = count_tokens(text, self.llm_service.model_name)
+            if chunks and used + cost > settings.REPLY_CONTEXT_MAX_TOKENS:
+                break
+            chunks.append(text)
+            used += cost
+        return "\n\n".join(chunks)
+
+    async def prepare(self, conversation_id: str, message: str) -> PreparedReply:
+        """Fetch history and retrieve context concurrently, then build a bounded prompt."""
+        history, summary_state, matches = await asyncio.gather(
+            self._timed("history", self._fetch_history(conversation_id)),
+            self.dynamodb.get_summary_state(conversation_id),
+            self._timed("retrieval", self.pinecone_service.similarity_search(query=message, k=settings.REPLY_RETRIEVAL_K)),
+            return_exceptions=True
+        )
+        if isinstance(history, BaseException):
+            logger.error(f"Failed to fetch history for {conversation_id}: {history}")
+            history = []
+        # Without the stored state, summarise from scratch but do not overwrite it
+        persist_summary = not isinstance(summary_state, BaseException)
+        if not persist_summary:
+            logger.error(f"Failed to fetch the summary state for {conversation_id}: {summary_state}")
+            summary_state = {}
+        previous_state = dict(summary_state)
+        if isinstance(matches, BaseException):
+            logger.error(f"Knowledge base retrieval failed: {matches}")
+            matches = []
+
+        start = time.perf_counter()
+        messages, summary = await self.llm_service.context_window.build(
+            history + [{"role": "user", "content": message}],
+            summary_state,
+            self.organization_id
+        )
+        system_prompt = KNOWLEDGE_BASE_PROMPT.format(context=self._build_context(matches))
+        if summary:
+            system_prompt += SUMMARY_SECTION.format(summary=summary)
+        route = self.llm_service.route(
+            message,
+            retrieval_score=matches[0].get('score') if matches else None,
+            organization_settings=self.organization.settings
+        )
+        self._record("prompt", time.perf_counter() - start)
+        changed = persist_summary and summary_state != previous_state
+        return PreparedReply(messages, system_prompt, route, summary_state if changed else None)
+
+    async def _persist(
+        self,
+        conversation_id: str,
+        message: str,
+        reply: str,
+        summary_state: Optional[Dict[str, Any]]
+    ) -> None:
+        metadata = {"organization_id": self.organization_id}
+        ttl_days = retention_days(self.organization.settings)
+        await self.dynamodb.create_message(conversation_id, message, "user", metadata, ttl_days)
+        await self.dynamodb.create_message(conversation_id, reply, "assistant", metadata, ttl_days)
+        if summary_state is not None:
+            await self.dynamodb.save_summary_state(conversation_id, summary_state)
+
+    async def reply(self, conversation_id: str, message: str) -> ReplyResult:
+        """
+        Generate and store the reply to an inbound message
+
+        Args:
+            conversation_id: Conversation the message belongs to
+            message: The inbound message text
+
+        Returns:
+            The reply text and the per-stage timings in seconds
+        """
+        start = time.perf_counter()
+        prepared = await self.prepare(conversation_id, message)
+        try:
+            text = await self._timed("generation", self.llm_service.generate_response(
+                prepared.messages,
+                prepared.system_prompt,
+                organization_id=self.organization_id,
+                route=prepared.route
+            ))
+        except CircuitOpenError:
+            text = DEGRADED_RESPONSE
+        await self._timed("persist", self._persist(conversation_id, message, text, prepared.summary_state))
+        self._record_total(start)
+        return ReplyResult(text, dict(self.timings))
+
+    async def stream_reply(self, conversation_id: str, message: str) -> AsyncIterator[str]:
+        """
+        Stream the reply to an inbound message, storing it once complete
+
+        Args:
+            conversation_id: Conversation the message belongs to
+            message: The inbound message text
+
+        Yields:
+            Text deltas of the reply
+        """
+        start = time.perf_counter()
+        prepared = await self.prepare(conversation_id, message)
+        generation_start = time.perf_counter()
+        deltas: List[str] = []
+        async for delta in self.llm_service.stream_response(
+            prepared.messages,
+            prepared.system_prompt,
+            organization_id=self.organization_id,
+            route=prepared.route
+        ):
+            deltas.append(delta)
+            yield delta
+        self._record("generation", time.perf_counter() - generation_start)
+        await self._timed("persist", self._persist(
+            conversation_id, message, "".join(deltas), prepared.summary_state
+        ))
+        self._record_total(start)
+
+    def _record_total(self, start: float) -> None:
+        self.timings["total"] = time.perf_counter() - start
+        metrics.observe("reply_total_seconds", self.timings["total"], organization_id=self.organization_id)
@@ -1,53 +1,84 @@
 """
-WhatsApp message processing service
+WhatsApp message delivery service
 """
-from typing import Optional
+import logging
+import re
+import time
+from typing import AsyncIterator, Optional
 import httpx
-from app.ai.embeddings import PineconeService
-from app.db.postgresql.models import WhatsAppUser, Organization
+from app.core.auth_cache import OrganizationSnapshot
+from app.db.postgresql.models import WhatsAppUser
 from app.core.config import settings
+from app.core.prometheus import WHATSAPP_SEND, observe_stage
+
+logger = logging.getLogger(__name__)
+
+# End of the first complete sentence or paragraph in a partial reply
+SEGMENT_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+
+ERROR_REPLY = "I encountered an error while processing your request. Please try again later."
+# Appended to a reply whose generation failed part way through
+INTERRUPTED_NOTICE = "(Reply interrupted. Please ask again if you need the rest.)"
 
 class WhatsAppService:
-    def __init__(self, organization: Organization):
+    def __init__(
+        self,
+        organization: OrganizationSnapshot,
+        http_client: Optional[httpx.AsyncClient] = None
+    ):
         self.organization = organization
-        self.namespace = f"tenant_{organization.id}"
-        self.pinecone_service = PineconeService(namespace=self.namespace)
+        self.http_client = http_client
         self.whatsapp_api_url = f"https://graph.facebook.com/v17.0/{settings.WHATSAPP_PHONE_ID}/messages"
         self.headers = {
             "Authorization": f"Bearer {settings.WHATSAPP_API_TOKEN}",
             "Content-Type": "application/json",
         }
     
-    async def process_message(self, message: str) -> str:
+    @property
+    def stream_replies(self) -> bool:
+        """Whether replies should be streamed to the user as they are generated."""
+        org_settings = self.organization.settings or {}
+        return org_settings.get("stream_replies", settings.WHATSAPP_STREAM_REPLIES)
+    
+    async def send_streamed_message(self, phone_number: str, deltas: AsyncIterator[str]) -> str:
         """
-        Process incoming WhatsApp message and generate response
+        Send a streamed reply, delivering the first sentence or paragraph early
+        
+        The first complete sentence (or paragraph) is sent as soon as it has
+        been generated; the remainder follows as a second message once the
+        stream is exhausted. If the stream fails part way, the text generated
+        so far is sent with a notice that the reply was interrupted, so a
+        cut-off answer never looks complete.
         
         Args:
-            message: The incoming message text
+            phone_number: The recipient's phone number
+            deltas: Async iterator of reply text deltas
             
         Returns:
-            str: Response message to be sent back to the user
+            str: The full reply text as sent
         """
+        buffer = ""
+        sent = 0
         try:
-            # Query Pinecone for relevant information
-            results = await self.pinecone_service.similarity_search(query=message, k=4)
-            
-            if not results:
-                return "I couldn't find any relevant information. Could you please rephrase your question?"
-            
-            # Extract the most relevant text
-            most_relevant = results[0]
-            response_text = most_relevant['metadata'].get('text', '')
-            
-            if not response_text:
-                return "I found some information but couldn't process it properly. Please try again."
-            
-            return response_text
-            
+            async for delta in deltas:
+                buffer += delta
+                if sent:
+                    continue
+                boundary = SEGMENT_BOUNDARY.search(buffer)
+                if boundary and boundary.start() > 0:
+                    await self.send_message(phone_number, buffer[:boundary.start()])
+                    sent = boundary.end()
         except Exception as e:
-            # Log the error
-            print(f"Error processing message: {str(e)}")
-            return "I encountered an error while processing your request. Please try again later."
+            logger.error(f"Error streaming reply: {e}", exc_info=True)
+            if buffer.strip():
+                buffer = f"{buffer.rstrip()}\n\n{INTERRUPTED_NOTICE}"
+            else:
+                buffer = ERROR_REPLY
+        
+        remainder = buffer[sent:].strip()
+        if remainder:
+            await self.send_message(phone_number, remainder)
+        return buffer
     
     async def send_message(self, phone_number: str, message: str) -> bool:
         """
@@ -60,6 +91,8 @@ class WhatsAppService:
         Returns:
             bool: True if message was sent successfully, False otherwise
         """
+        start = time.perf_counter()
+        outcome = "error"
         try:
             payload = {
                 "messaging_product": "whatsapp",
@@ -69,20 +102,30 @@ class WhatsAppService:
                 "text": {"body": message}
             }
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    self.whatsapp_api_url,
-                    headers=self.headers,
-                    json=payload,
-                    timeout=30.0
-                )
+            if self.http_client is not None:
+                response = await self._post(self.http_client, payload)
+            else:
+                async with httpx.AsyncClient() as client:
+                    response = await self._post(client, payload)
                 
-                if response.status_code == 200:
-                    return True
-                else:
-                    print(f"WhatsApp API error: {response.status_code} - {response.text}")
-                    return False
+            if response.status_code == 200:
+                outcome = "ok"
+                return True
+            else:
+                outcome = "rejected"
+                print(f"WhatsApp API error: {response.status_code} - {response.text}")
+                return False
                     
         except Exception as e:
             print(f"Error sending message: {str(e)}")
             return False
+        finally:
+            observe_stage(WHATSAPP_SEND, time.perf_counter() - start, self.organization.id, outcome)
+    
+    async def _post(self, client: httpx.AsyncClient, payload: dict) -> httpx.Response:
+        return await client.post(
+            self.whatsapp_api_url,
+            headers=self.headers,
+            json=payload,
+            timeout=30.0
+        )
@@ -0,0 +1,26 @@
+"""
+Export messages that are about to expire to the cold archive
+
+Run daily (cron or a scheduled task), ahead of DynamoDB's TTL deletion:
+
+    python -m scripts.archive_messages [lead_days]
+
+Each run exports the messages expiring lead_days from today. To catch up
+on a missed run, run again with a smaller lead_days before that day comes.
+"""
+import asyncio
+import sys
+from app.core.config import settings
+from app.db.dynamodb.retention import MessageArchiver
+from app.db.dynamodb.service import DynamoDBService
+
+async def main(lead_days: int):
+    dynamodb = DynamoDBService()
+    try:
+        files = await MessageArchiver(dynamodb).archive_expiring(lead_days)
+        print(f"Wrote {files} archive files to {settings.MESSAGE_ARCHIVE_URL}")
+    finally:
+        await dynamodb.close()
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else settings.MESSAGE_ARCHIVE_LEAD_DAYS))
@@ -0,0 +1,121 @@
+"""
+Capacity and latency benchmark for message compression
+
+Compares the DynamoDB item sizes, write capacity units (one WCU per started
+KB per item) and read capacity units of a history query (eventually
+consistent, half an RCU per started 4 KB) of a conversation corpus stored
+plain and with ItemCompressor, and times compression and decompression.
+
+The corpus is a JSONL file of message items (for example a message archive
+written by scripts/archive_messages.py) or, by default, a generated
+conversation of short resident questions and long assistant replies.
+
+    python -m scripts.bench_compression [corpus.jsonl[.gz|.zst]] [history_messages]
+"""
+import json
+import math
+import random
+import statistics
+import sys
+import time
+from decimal import Decimal
+from typing import Any, Dict, List
+from app.db.dynamodb.compression import ItemCompressor
+from app.db.dynamodb.retention import decompress
+
+WORDS = (
+    "the building residents parking garage elevator maintenance schedule water "
+    "heating repair request unit floor lobby security access card visitor package "
+    "delivery rent payment due date office hours weekend holiday notice pool gym "
+    "rules pets noise complaint trash recycling pickup laundry room key lock door "
+    "window leak plumber electrician appointment confirm cancel please thank you "
+    "your our will can should must may is are was be have has not and or but if "
+    "when where how what which for from with about at on in to of by a an this that"
+).split()
+
+def generate_corpus(conversations: int = 50, turns: int = 40) -> List[Dict[str, Any]]:
+    rng = random.Random(42)
+    items = []
+    for c in range(conversations):
+        for t in range(turns):
+            role = "user" if t % 2 == 0 else "assistant"
+            words = rng.randint(5, 30) if role == "user" else rng.randint(80, 600)
+            items.append({
+                "conversation_id": f"+1555000{c:04d}_conversation",
+                "timestamp": f"2024-01-01T00:{t // 60:02d}:{t % 60:02d}.000000",
+                "content": " ".join(rng.choice(WORDS) for _ in range(words)),
+                "role": role,
+                "metadata": {"organization_id": "1"},
+            })
+    return items
+
+def load_corpus(path: str) -> List[Dict[str, Any]]:
+    with open(path, "rb") as f:
+        data = f.read()
+    if path.endswith((".gz", ".zst")):
+        return decompress(data, path)
+    return [json.loads(line) for line in data.decode("utf-8").splitlines() if line]
+
+def attribute_size(value: Any) -> int:
+    """Approximate DynamoDB storage size of an attribute value."""
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, bool) or value is None:
+        return 1
+    if isinstance(value, (int, float, Decimal)):
+        return len(str(value).lstrip("-").replace(".", "")) // 2 + 2
+    if isinstance(value, dict):
+        return 3 + sum(len(k.encode("utf-8")) + attribute_size(v) + 1 for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return 3 + sum(attribute_size(v) + 1 for v in value)
+    return len(str(value))
+
+def item_size(item: Dict[str, Any]) -> int:
+    return sum(len(k.encode("utf-8")) + attribute_size(v) for k, v in item.items())
+
+def history_rcu(items: List[Dict[str, Any]], history: int) -> float:
+    """RCUs of reading the last `history` messages of every conversation."""
+    by_conversation: Dict[str, List[int]] = {}
+    for item in items:
+        by_conversation.setdefault(item["conversation_id"], []).append(item_size(item))
+    return sum(math.ceil(sum(sizes[-history:]) / 4096) * 0.5 for sizes in by_conversation.values())
+
+def report(label: str, items: List[Dict[str, Any]], history: int) -> None:
+    sizes = [item_size(i) for i in items]
+    wcu = sum(math.ceil(size / 1024) for size in sizes)
+    print(
+        f"{label:<12} {sum(sizes) / 1024:>10.1f} KB  mean item {statistics.mean(sizes):>7.0f} B  "
+        f"WCU {wcu:>6}  history RCU {history_rcu(items, history):>7.1f}"
+    )
+
+def main(path: str, history: int):
+    items = load_corpus(path) if path else generate_corpus()
+    print(f"{len(items)} messages, history queries of {history} messages")
+    report("plain", items, history)
+
+    for codec in ("zlib", "zstd"):
+        compressor = ItemCompressor(codec=codec)
+        if codec == "zstd" and compressor.codec != "zstd/1":
+            print("zstd        skipped (zstandard is not installed)")
+            continue
+        start = time.perf_counter()
+        stored = [compressor.encode(i) for i in items]
+        encode_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        for i in stored:
+            ItemCompressor.decode(i)
+        decode_seconds = time.perf_counter() - start
+        report(codec, stored, history)
+        print(
+            f"{'':<12} encode {encode_seconds / len(items) * 1e6:.1f} us/item, "
+            f"decode {decode_seconds / len(items) * 1e6:.1f} us/item, "
+            f"{sum('content_codec' in i for i in stored)} items compressed"
+        )
+
+if __name__ == "__main__":
+    main(
+        sys.argv[1] if len(sys.argv) > 1 and not sys.argv[1].isdigit() else "",
+        int(sys.argv[-1]) if len(sys.argv) > 1 and sys.argv[-1].isdigit() else 20
+    )
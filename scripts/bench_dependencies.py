@@ -0,0 +1,37 @@
+"""
+Microbenchmark of per-request dependency overhead
+
+Compares building DynamoDBService and LLMService for every request (the old
+behaviour of get_dynamodb / get_llm_service) with handing out the
+application-scoped instances from Resources.
+
+    python -m scripts.bench_dependencies [iterations]
+"""
+import asyncio
+import sys
+import time
+from app.ai.llm import LLMService
+from app.api.deps import get_dynamodb, get_llm_service
+from app.core.resources import Resources
+from app.db.dynamodb.service import DynamoDBService
+
+def report(label: str, seconds: float, iterations: int) -> None:
+    print(f"{label:<40} {seconds / iterations * 1e6:>12.1f} us/request")
+
+async def main(iterations: int):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        DynamoDBService()
+        LLMService()
+    report("per-request construction", time.perf_counter() - start, iterations)
+
+    resources = Resources()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        get_dynamodb(resources)
+        await get_llm_service(resources)
+    report("application-scoped resources", time.perf_counter() - start, iterations)
+    await resources.close()
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200))
@@ -0,0 +1,45 @@
+"""
+Concurrency benchmark for the async DynamoDB data layer
+
+Writes and reads messages through DynamoDBService at increasing concurrency
+and compares the throughput with issuing the same calls one at a time.
+Point DYNAMODB_ENDPOINT at LocalStack (or DynamoDB Local) and create the
+tables first with `python -m app.db.dynamodb.init_tables`.
+
+    python -m scripts.bench_dynamodb [operations]
+"""
+import asyncio
+import sys
+import time
+import uuid
+from app.db.dynamodb.service import DynamoDBService
+
+CONCURRENCY_LEVELS = [1, 8, 32, 64]
+
+async def run(dynamodb: DynamoDBService, operations: int, concurrency: int) -> float:
+    conversation_id = f"bench_{uuid.uuid4().hex}"
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with semaphore:
+            await dynamodb.create_message(conversation_id, f"benchmark message {i}", "user")
+            await dynamodb.get_conversation_messages(conversation_id)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(operations)))
+    return time.perf_counter() - start
+
+async def main(operations: int):
+    dynamodb = DynamoDBService()
+    try:
+        for concurrency in CONCURRENCY_LEVELS:
+            elapsed = await run(dynamodb, operations, concurrency)
+            print(
+                f"concurrency={concurrency:<4} {operations} write+read pairs in {elapsed:.2f}s "
+                f"({operations / elapsed:.0f} pairs/s)"
+            )
+    finally:
+        await dynamodb.close()
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 500))
@@ -0,0 +1,242 @@
+"""
+Seeded benchmark of the tenant queries: EXPLAIN plans and latencies
+
+Seeds a local database with a fixed random seed, then runs the lookups of
+deps.py and the list queries of the routers (first and later keyset pages)
+under EXPLAIN (ANALYZE, BUFFERS) and times repeated executions. Results are
+written as JSON; passing an earlier result as the baseline fails the run
+when a query falls back to a sequential scan or an explicit sort it did
+not need before, or gets much slower.
+
+    python -m scripts.bench_indexes seed [organizations]
+    python -m scripts.bench_indexes run [output.json] [baseline.json]
+
+Run against a scratch database: seeding inserts organizations named bench-*.
+"""
+import json
+import random
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+from sqlalchemy import insert, select, tuple_
+from app.db.postgresql.database import engine
+from app.db.postgresql.models import (
+    KnowledgeBase, Organization, UsageMetrics, UsageRollupDaily, WhatsAppUser
+)
+
+SEED = 20241219
+EXECUTIONS = 50
+PAGE_SIZE = 50
+# p95 may grow this much over the baseline before the run fails
+SLOWDOWN_TOLERANCE = 2.0
+# Plan nodes that signal a missing index on these queries
+REGRESSION_NODES = {"Seq Scan", "Sort"}
+
+USERS_PER_ORGANIZATION = 2000
+KNOWLEDGE_BASES_PER_ORGANIZATION = 100
+USAGE_ROWS_PER_ORGANIZATION = 3000
+INSERT_CHUNK = 5000
+# Rollup metric types seeded from the usage_metrics columns
+ROLLUP_METRICS = (("queries", "query_count"), ("completion_tokens", "token_count"), ("embedding_tokens", "embedding_count"))
+
+def _chunks(rows: List[Dict[str, Any]]):
+    for i in range(0, len(rows), INSERT_CHUNK):
+        yield rows[i:i + INSERT_CHUNK]
+
+def seed(organizations: int) -> None:
+    rng = random.Random(SEED)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    with engine.begin() as connection:
+        for i in range(organizations):
+            organization_id = uuid.UUID(int=rng.getrandbits(128), version=4)
+            connection.execute(insert(Organization), [{
+                "id": organization_id,
+                "name": f"bench-{i}",
+                "api_key": f"bench-key-{i}",
+                "is_active": i % 10 != 0,
+            }])
+            # Tenants are skewed: a few large ones and a long tail
+            scale = 1.0 if i < organizations // 10 else 0.1
+            users = [
+                {
+                    "phone_number": f"9{i:04d}{n:08d}",
+                    "organization_id": organization_id,
+                    "is_active": rng.random() > 0.2,
+                    "created_at": start + timedelta(minutes=rng.randrange(500000)),
+                }
+                for n in range(int(USERS_PER_ORGANIZATION * scale))
+            ]
+            knowledge_bases = [
+                {
+                    "id": uuid.UUID(int=rng.getrandbits(128), version=4),
+                    "organization_id": organization_id,
+                    "name": f"kb-{rng.randrange(10 ** 6):06d}",
+                    "created_at": start + timedelta(minutes=rng.randrange(500000)),
+                }
+                for _ in range(int(KNOWLEDGE_BASES_PER_ORGANIZATION * scale))
+            ]
+            usage = [
+                {
+                    "id": uuid.UUID(int=rng.getrandbits(128), version=4),
+                    "organization_id": organization_id,
+                    "date": start + timedelta(minutes=rng.randrange(500000)),
+                    "query_count": rng.choice((0, 0, 1)),
+                    "token_count": rng.choice((0, rng.randrange(2000))),
+                    "embedding_count": rng.choice((0, 0, 0, rng.randrange(500))),
+                }
+                for _ in range(int(USAGE_ROWS_PER_ORGANIZATION * scale))
+            ]
+            daily: Dict[Any, int] = {}
+            for row in usage:
+                bucket = row["date"].replace(hour=0, minute=0, second=0, microsecond=0)
+                for metric_type, column in ROLLUP_METRICS:
+                    daily[(bucket, metric_type)] = daily.get((bucket, metric_type), 0) + row[column]
+            rollups = [
+                {"organization_id": organization_id, "bucket": bucket, "metric_type": metric_type, "value": value}
+                for (bucket, metric_type), value in daily.items()
+            ]
+            tables = (
+                (WhatsAppUser, users), (KnowledgeBase, knowledge_bases),
+                (UsageMetrics, usage), (UsageRollupDaily, rollups)
+            )
+            for model, rows in tables:
+                for chunk in _chunks(rows):
+                    connection.execute(insert(model), chunk)
+        connection.exec_driver_sql(
+            "ANALYZE organizations, whatsapp_users, knowledge_bases, usage_metrics, usage_rollups_daily"
+        )
+    print(f"Seeded {organizations} organizations")
+
+def _page_after(query, columns, row):
+    # Second page as keyset_page builds it, seeking past the first page's last row
+    return query.where(tuple_(*columns) < tuple_(*(row[c.key] for c in columns))).order_by(
+        *(c.desc() for c in columns)
+    ).limit(PAGE_SIZE + 1)
+
+def build_queries(connection) -> Dict[str, Any]:
+    """The benchmarked statements, shaped like the ones the API issues."""
+    organization_id = connection.execute(
+        select(Organization.id).where(Organization.api_key == "bench-key-1")
+    ).scalar_one()
+    phone_number = connection.execute(
+        select(WhatsAppUser.phone_number).where(WhatsAppUser.organization_id == organization_id).limit(1)
+    ).scalar_one()
+
+    users = select(
+        WhatsAppUser.phone_number, WhatsAppUser.is_active, WhatsAppUser.created_at, WhatsAppUser.last_active
+    ).where(WhatsAppUser.organization_id == organization_id)
+    users_by_created = (WhatsAppUser.created_at, WhatsAppUser.phone_number)
+    knowledge_bases = select(
+        KnowledgeBase.id, KnowledgeBase.name, KnowledgeBase.created_at
+    ).where(KnowledgeBase.organization_id == organization_id)
+    knowledge_bases_by_name = (KnowledgeBase.name, KnowledgeBase.id)
+    usage = select(
+        UsageMetrics.id, UsageMetrics.date, UsageMetrics.query_count,
+        UsageMetrics.token_count, UsageMetrics.embedding_count
+    ).where(UsageMetrics.organization_id == organization_id)
+    usage_by_date = (UsageMetrics.date, UsageMetrics.id)
+
+    def first_page(query, columns):
+        return query.order_by(*(c.desc() for c in columns)).limit(PAGE_SIZE + 1)
+
+    def second_page(query, columns):
+        rows = connection.execute(first_page(query, columns)).mappings().all()
+        return _page_after(query, columns, rows[PAGE_SIZE - 1])
+
+    return {
+        "organization_by_api_key": select(Organization).where(
+            Organization.api_key == "bench-key-1", Organization.is_active == True
+        ),
+        "whatsapp_user_by_phone": select(WhatsAppUser).where(
+            WhatsAppUser.phone_number == phone_number,
+            WhatsAppUser.organization_id == organization_id,
+            WhatsAppUser.is_active == True
+        ),
+        "whatsapp_users_first_page": first_page(users, users_by_created),
+        "whatsapp_users_next_page": second_page(users, users_by_created),
+        "whatsapp_users_by_phone_page": first_page(users, (WhatsAppUser.phone_number,)),
+        "knowledge_bases_by_name_page": first_page(knowledge_bases, knowledge_bases_by_name),
+        "knowledge_bases_by_name_next_page": second_page(knowledge_bases, knowledge_bases_by_name),
+        "usage_metrics_first_page": first_page(usage, usage_by_date),
+        "usage_metrics_next_page": second_page(usage, usage_by_date),
+        "usage_metrics_embeddings_page": first_page(usage.where(UsageMetrics.embedding_count > 0), usage_by_date),
+        "usage_series_daily": select(
+            UsageRollupDaily.bucket, UsageRollupDaily.metric_type, UsageRollupDaily.value
+        ).where(
+            UsageRollupDaily.organization_id == organization_id,
+            UsageRollupDaily.bucket >= datetime(2024, 3, 1, tzinfo=timezone.utc),
+            UsageRollupDaily.bucket < datetime(2024, 6, 1, tzinfo=timezone.utc)
+        ).order_by(UsageRollupDaily.bucket, UsageRollupDaily.metric_type),
+    }
+
+def _plan_nodes(plan: Dict[str, Any]) -> List[str]:
+    nodes = [plan["Node Type"] + (f" on {plan['Index Name']}" if "Index Name" in plan else "")]
+    for child in plan.get("Plans", ()):
+        nodes.extend(_plan_nodes(child))
+    return nodes
+
+def measure(connection, query) -> Dict[str, Any]:
+    compiled = query.compile(dialect=engine.dialect)
+    explain = connection.exec_driver_sql(
+        f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {compiled}", compiled.params
+    ).scalar_one()
+    plan = (json.loads(explain) if isinstance(explain, str) else explain)[0]
+
+    timings = []
+    for _ in range(EXECUTIONS):
+        start = time.perf_counter()
+        connection.execute(query).all()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        "plan": _plan_nodes(plan["Plan"]),
+        "shared_buffers_hit": plan["Plan"].get("Shared Hit Blocks", 0),
+        "execution_ms": plan["Execution Time"],
+        "p50_ms": statistics.median(timings),
+        "p95_ms": timings[int(len(timings) * 0.95) - 1],
+    }
+
+def regressions(results: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    found = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        before_nodes = {node.split(" on ")[0] for node in before["plan"]}
+        after_nodes = {node.split(" on ")[0] for node in result["plan"]}
+        for node in (after_nodes & REGRESSION_NODES) - before_nodes:
+            found.append(f"{name}: plan now uses {node}")
+        if result["p95_ms"] > before["p95_ms"] * SLOWDOWN_TOLERANCE:
+            found.append(f"{name}: p95 {before['p95_ms']:.2f}ms -> {result['p95_ms']:.2f}ms")
+    return found
+
+def run(output: str, baseline_path: Optional[str] = None) -> int:
+    with engine.connect() as connection:
+        results = {name: measure(connection, query) for name, query in build_queries(connection).items()}
+
+    for name, result in results.items():
+        print(f"{name:<36} p50={result['p50_ms']:>7.2f}ms p95={result['p95_ms']:>7.2f}ms  {' > '.join(result['plan'])}")
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {output}")
+
+    if baseline_path:
+        with open(baseline_path) as f:
+            found = regressions(results, json.load(f))
+        for regression in found:
+            print(f"REGRESSION {regression}")
+        return 1 if found else 0
+    return 0
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "run"
+    if command == "seed":
+        seed(int(sys.argv[2]) if len(sys.argv) > 2 else 50)
+    else:
+        sys.exit(run(
+            sys.argv[2] if len(sys.argv) > 2 else "bench_indexes.json",
+            sys.argv[3] if len(sys.argv) > 3 else None
+        ))
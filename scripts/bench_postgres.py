@@ -0,0 +1,53 @@
+"""
+Concurrency benchmark for Postgres access from async handlers
+
+Runs the API-key lookup of get_current_organization from many concurrent
+coroutines, once with the synchronous psycopg2 session (which blocks the
+event loop, so the lookups run one after another) and once with the asyncpg
+session pool.
+
+    python -m scripts.bench_postgres <api_key> [lookups]
+"""
+import asyncio
+import sys
+import time
+from sqlalchemy import select
+from app.db.postgresql.database import AsyncSessionLocal, SessionLocal, async_engine
+from app.db.postgresql.models import Organization
+
+CONCURRENCY_LEVELS = [1, 8, 32, 64]
+
+def lookup_query(api_key: str):
+    return select(Organization).where(
+        Organization.api_key == api_key,
+        Organization.is_active == True
+    )
+
+async def sync_lookup(api_key: str) -> None:
+    with SessionLocal() as db:
+        db.execute(lookup_query(api_key)).scalars().first()
+
+async def async_lookup(api_key: str) -> None:
+    async with AsyncSessionLocal() as db:
+        (await db.execute(lookup_query(api_key))).scalars().first()
+
+async def run(lookup, api_key: str, lookups: int, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            await lookup(api_key)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(lookups)))
+    return time.perf_counter() - start
+
+async def main(api_key: str, lookups: int):
+    for label, lookup in (("sync psycopg2", sync_lookup), ("asyncpg", async_lookup)):
+        for concurrency in CONCURRENCY_LEVELS:
+            elapsed = await run(lookup, api_key, lookups, concurrency)
+            print(f"{label:<14} concurrency={concurrency:<4} {lookups / elapsed:>8.0f} lookups/s")
+    await async_engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 2000))
@@ -0,0 +1,55 @@
+"""
+Decision latency benchmark for the rate limiter
+
+Times RateLimiter.check for a mix of well-behaved senders and one abusive
+sender, with the in-process limiter alone and with the configured shared
+backend (RATE_LIMIT_BACKEND=dynamodb needs the rate_limit_windows table, see
+`python -m app.db.dynamodb.init_tables`).
+
+    python -m scripts.bench_rate_limit [decisions] [memory|dynamodb|redis]
+"""
+import asyncio
+import statistics
+import sys
+import time
+from app.core.rate_limit import RateLimit, create_rate_limiter
+from app.db.dynamodb.service import DynamoDBService
+
+LIMIT = RateLimit(rate=20, burst=5)
+SENDERS = 1000
+
+async def run(limiter, decisions: int) -> None:
+    latencies = []
+    rejected = 0
+    for i in range(decisions):
+        # Every fourth request comes from the same abusive sender
+        key = "phone:bench:abuser" if i % 4 == 0 else f"phone:bench:{i % SENDERS}"
+        start = time.perf_counter()
+        decision = await limiter.check(key, LIMIT, "phone")
+        latencies.append(time.perf_counter() - start)
+        rejected += not decision.allowed
+
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(
+        f"{decisions} decisions, {rejected} rejected: "
+        f"p50={quantiles[49] * 1e6:.1f}us p99={quantiles[98] * 1e6:.1f}us "
+        f"max={max(latencies) * 1e6:.1f}us"
+    )
+
+async def main(decisions: int, backend: str):
+    print("in-process GCRA:")
+    await run(create_rate_limiter(backend="memory"), decisions)
+
+    if backend != "memory":
+        dynamodb = DynamoDBService()
+        try:
+            print(f"in-process GCRA + {backend} counters:")
+            await run(create_rate_limiter(dynamodb, backend=backend), decisions)
+        finally:
+            await dynamodb.close()
+
+if __name__ == "__main__":
+    asyncio.run(main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 100000,
+        sys.argv[2] if len(sys.argv) > 2 else "memory"
+    ))
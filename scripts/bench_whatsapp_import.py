@@ -0,0 +1,50 @@
+"""
+Benchmark the bulk WhatsApp user import
+
+Generates a CSV of random numbers (with a few invalid and repeated rows) and
+imports it for an organization through WhatsAppUserImporter, the same path
+as POST /whatsapp-users/import. Run it against a scratch database.
+
+    python -m scripts.bench_whatsapp_import <organization_id> [rows]
+"""
+import asyncio
+import random
+import sys
+import time
+import uuid
+from app.db.postgresql.database import AsyncSessionLocal, async_engine
+from app.db.postgresql.whatsapp_import import WhatsAppUserImporter
+
+CHUNK_BYTES = 64 * 1024
+
+def generate_csv(rows: int, seed: int = 7) -> bytes:
+    rng = random.Random(seed)
+    lines = ["phone_number,is_active,settings"]
+    for i in range(rows):
+        if i % 1000 == 999:
+            lines.append("not-a-number,,")
+        elif i % 1000 == 998:
+            lines.append(lines[-1])
+        else:
+            lines.append(f"+9{rng.randrange(10 ** 11):011d},true,")
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+async def stream(data: bytes):
+    for i in range(0, len(data), CHUNK_BYTES):
+        yield data[i:i + CHUNK_BYTES]
+
+async def main(organization_id: str, rows: int):
+    data = generate_csv(rows)
+    async with AsyncSessionLocal() as db:
+        start = time.perf_counter()
+        report = await WhatsAppUserImporter(db, uuid.UUID(organization_id)).run(stream(data), "csv")
+        elapsed = time.perf_counter() - start
+    print(
+        f"{report.received} rows in {elapsed:.2f}s ({report.received / elapsed:.0f} rows/s): "
+        f"{report.inserted} inserted, {report.existing} existing, {report.invalid} invalid, "
+        f"{report.duplicates} duplicates, {report.conflicts} conflicts"
+    )
+    await async_engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 100000))
@@ -0,0 +1,70 @@
+"""
+Copy conversations and messages into the single-table chat layout
+
+Reads the conversations and messages tables with a parallel Scan and writes
+each item into the chat table (see ChatModel) with BatchWriteItem. Items are
+written under their final keys, so the migration can be re-run safely; run
+it once more after switching DYNAMODB_SINGLE_TABLE on to pick up writes that
+landed in the old tables in the meantime. Create the chat table first with
+`python -m app.db.dynamodb.init_tables`.
+
+    python -m scripts.migrate_single_table [segments]
+"""
+import asyncio
+import sys
+from typing import Any, Callable, Dict
+from app.db.dynamodb.models import AsyncTable, ChatModel
+from app.db.dynamodb.service import DynamoDBService
+from app.db.dynamodb.write_buffer import batch_write_items
+
+def conversation_header(item: Dict[str, Any]) -> Dict[str, Any]:
+    conversation_id = f"{item['phone_number']}:{item['timestamp']}"
+    header = {
+        **item,
+        'pk': ChatModel.partition_key(conversation_id),
+        'sk': ChatModel.HEADER_SORT_KEY,
+        'conversation_id': conversation_id
+    }
+    # The organization moves out of the metadata map to a top-level attribute
+    organization_id = (item.get('metadata') or {}).get('organization_id')
+    if organization_id and 'organization_id' not in header:
+        header['organization_id'] = organization_id
+    return header
+
+async def copy_segment(
+    dynamodb: DynamoDBService,
+    source: AsyncTable,
+    transform: Callable[[Dict[str, Any]], Dict[str, Any]],
+    segment: int,
+    total_segments: int
+) -> int:
+    kwargs: Dict[str, Any] = {'Segment': segment, 'TotalSegments': total_segments}
+    copied = 0
+    while True:
+        response = await source.scan(**kwargs)
+        items = [transform(item) for item in response.get('Items', [])]
+        await batch_write_items(dynamodb.client, ChatModel.TABLE_NAME, items)
+        copied += len(items)
+        if 'LastEvaluatedKey' not in response:
+            return copied
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+async def copy_table(dynamodb: DynamoDBService, source: AsyncTable, transform, total_segments: int) -> int:
+    counts = await asyncio.gather(*(
+        copy_segment(dynamodb, source, transform, segment, total_segments)
+        for segment in range(total_segments)
+    ))
+    return sum(counts)
+
+async def main(total_segments: int):
+    dynamodb = DynamoDBService(write_behind=False, single_table=True)
+    try:
+        conversations = await copy_table(dynamodb, dynamodb.conversations.table, conversation_header, total_segments)
+        print(f"Copied {conversations} conversations")
+        messages = await copy_table(dynamodb, dynamodb.messages.table, dynamodb.message_item, total_segments)
+        print(f"Copied {messages} messages")
+    finally:
+        await dynamodb.close()
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 4))
@@ -0,0 +1,24 @@
+"""
+Settings for importing the app in unit tests
+
+The tests exercise pure functions only; nothing connects to these services.
+"""
+import os
+
+for name, value in {
+    "POSTGRES_USER": "test",
+    "POSTGRES_PASSWORD": "test",
+    "POSTGRES_HOST": "localhost",
+    "POSTGRES_PORT": "5432",
+    "POSTGRES_DB": "test",
+    "AWS_ACCESS_KEY_ID": "test",
+    "AWS_SECRET_ACCESS_KEY": "test",
+    "OPENAI_API_KEY": "test",
+    "PINECONE_API_KEY": "test",
+    "PINECONE_ENVIRONMENT": "test",
+    "WHATSAPP_API_TOKEN": "test",
+    "WHATSAPP_VERIFY_TOKEN": "test",
+    "WHATSAPP_PHONE_ID": "test",
+    "SECRET_KEY": "test",
+}.items():
+    os.environ.setdefault(name, value)
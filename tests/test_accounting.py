@@ -0,0 +1,31 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+from app.ai.accounting import PROMPT_TOKENS, QUERIES, bucket_start, client_metric_type
+
+MOMENT = datetime(2024, 3, 17, 14, 45, 12, 345, tzinfo=timezone.utc)
+
+@pytest.mark.parametrize("granularity, expected", [
+    ("hour", datetime(2024, 3, 17, 14, tzinfo=timezone.utc)),
+    ("day", datetime(2024, 3, 17, tzinfo=timezone.utc)),
+    ("month", datetime(2024, 3, 1, tzinfo=timezone.utc)),
+])
+def test_bucket_start(granularity, expected):
+    assert bucket_start(MOMENT, granularity) == expected
+
+def test_bucket_start_treats_naive_datetimes_as_utc():
+    assert bucket_start(MOMENT.replace(tzinfo=None), "hour") == datetime(2024, 3, 17, 14, tzinfo=timezone.utc)
+
+def test_bucket_start_converts_to_utc_first():
+    # 00:30 on the 1st at UTC+2 is still the previous day and month in UTC
+    moment = datetime(2024, 4, 1, 0, 30, tzinfo=timezone(timedelta(hours=2)))
+    assert bucket_start(moment, "day") == datetime(2024, 3, 31, tzinfo=timezone.utc)
+    assert bucket_start(moment, "month") == datetime(2024, 3, 1, tzinfo=timezone.utc)
+
+@pytest.mark.parametrize("posted, stored", [("page_views", "client_page_views"), ("client_page_views", "client_page_views")])
+def test_client_metrics_are_namespaced(posted, stored):
+    assert client_metric_type(posted) == stored
+
+@pytest.mark.parametrize("reserved", [QUERIES, PROMPT_TOKENS])
+def test_clients_cannot_post_server_metrics(reserved):
+    with pytest.raises(ValueError):
+        client_metric_type(reserved)
@@ -0,0 +1,78 @@
+import asyncio
+from types import MappingProxyType
+from app.core.auth_cache import AuthCache, OrganizationSnapshot, hash_api_key
+
+ORGANIZATION = OrganizationSnapshot(id="o1", name="Acme", is_active=True, settings=MappingProxyType({}))
+
+class SlowLoader:
+    def __init__(self, result=ORGANIZATION):
+        self.result = result
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self, api_key):
+        self.calls += 1
+        await self.release.wait()
+        return self.result
+
+def test_concurrent_misses_share_one_lookup():
+    async def run():
+        cache, load = AuthCache(), SlowLoader()
+        lookups = [asyncio.create_task(cache.get("key", load)) for _ in range(5)]
+        await asyncio.sleep(0)
+        load.release.set()
+        return await asyncio.gather(*lookups), load.calls
+
+    results, calls = asyncio.run(run())
+    assert results == [ORGANIZATION] * 5
+    assert calls == 1
+
+def test_waiters_load_the_key_when_the_leader_is_cancelled():
+    async def run():
+        cache, load = AuthCache(), SlowLoader()
+        leader = asyncio.create_task(cache.get("key", load))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(cache.get("key", load))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        load.release.set()
+        return await waiter, load.calls
+
+    result, calls = asyncio.run(run())
+    assert result == ORGANIZATION
+    assert calls == 2
+
+def test_invalidation_drops_the_organizations_keys():
+    async def run():
+        cache, load = AuthCache(), SlowLoader()
+        load.release.set()
+        await cache.get("key", load)
+        await cache.get("key", load)
+        await cache.invalidate_organization("o1")
+        await cache.get("key", load)
+        return load.calls
+
+    assert asyncio.run(run()) == 2
+
+def test_lookup_that_started_before_an_invalidation_is_not_cached():
+    async def run():
+        cache, load = AuthCache(), SlowLoader()
+        lookup = asyncio.create_task(cache.get("key", load))
+        await asyncio.sleep(0)
+        await cache.invalidate_organization("o1")
+        load.release.set()
+        await lookup
+        return cache._entries
+
+    assert not asyncio.run(run())
+
+def test_published_invalidations_are_applied():
+    async def run():
+        cache, load = AuthCache(), SlowLoader()
+        load.release.set()
+        await cache.get("key", load)
+        cache._apply(f"key:{hash_api_key('key')}")
+        return cache._entries
+
+    assert not asyncio.run(run())
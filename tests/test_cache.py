@@ -0,0 +1,89 @@
+import asyncio
+import json
+from app.ai.cache import ResponseCache, make_cache_key
+
+class FakeRedis:
+    def __init__(self):
+        self.values = {}
+
+    async def get(self, key):
+        return self.values.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.values[key] = value
+
+class FailingRedis:
+    async def get(self, key):
+        raise ConnectionError("down")
+
+    async def set(self, key, value, ex=None):
+        raise ConnectionError("down")
+
+def test_key_ignores_whitespace_and_non_chat_messages():
+    messages = [{"role": "user", "content": "Hi there"}]
+    noisy = [{"role": "system", "content": "ignored"}, {"role": "user", "content": "  Hi there\n", "id": 7}]
+    assert make_cache_key("gpt-4", 0.0, "Be brief", messages) == make_cache_key("gpt-4", 0, " Be brief ", noisy)
+    assert make_cache_key("gpt-4", 0.0, "Be brief", messages) != make_cache_key("gpt-4", 0.7, "Be brief", messages)
+
+def test_hits_report_saved_tokens_and_misses_are_counted():
+    cache = ResponseCache()
+
+    async def run():
+        missed = await cache.get("k")
+        await cache.set("k", "answer", tokens=42)
+        return missed, await cache.get("k")
+
+    assert asyncio.run(run()) == (None, "answer")
+    assert (cache.hits, cache.misses, cache.hit_ratio) == (1, 1, 0.5)
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(max_entries=2)
+
+    async def run():
+        await cache.set("a", "A")
+        await cache.set("b", "B")
+        await cache.get("a")
+        await cache.set("c", "C")
+        return [await cache.get(key) for key in ("a", "b", "c")]
+
+    assert asyncio.run(run()) == ["A", None, "C"]
+
+def test_entries_expire_after_their_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.ai.cache.time.monotonic", lambda: now[0])
+    cache = ResponseCache(ttl_seconds=60)
+
+    async def run():
+        await cache.set("default", "D")
+        await cache.set("short", "S", ttl=10)
+        now[0] += 30
+        first = [await cache.get("default"), await cache.get("short")]
+        now[0] += 31
+        return first, await cache.get("default")
+
+    assert asyncio.run(run()) == (["D", None], None)
+    assert cache.stats()["entries"] == 0
+
+def test_redis_tier_is_shared_and_fills_the_local_tier():
+    redis = FakeRedis()
+    writer, reader = ResponseCache(), ResponseCache()
+    writer._redis = reader._redis = redis
+
+    async def run():
+        await writer.set("k", "shared", tokens=5)
+        found = await reader.get("k")
+        reader._redis = None
+        return found, await reader.get("k")
+
+    assert asyncio.run(run()) == ("shared", "shared")
+    assert json.loads(redis.values["llm-cache:k"]) == {"text": "shared", "tokens": 5}
+
+def test_redis_failures_fall_back_to_memory():
+    cache = ResponseCache()
+    cache._redis = FailingRedis()
+
+    async def run():
+        await cache.set("k", "local")
+        return await cache.get("k"), await cache.get("other")
+
+    assert asyncio.run(run()) == ("local", None)
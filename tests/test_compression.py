@@ -0,0 +1,48 @@
+import pytest
+from boto3.dynamodb.types import Binary
+from app.db.dynamodb.compression import ZLIB_V1, ZSTD_V1, ItemCompressor, decompress_bytes
+
+ITEM = {
+    "conversation_id": "c1",
+    "timestamp": "2024-01-01T00:00:00",
+    "content": "The lift in block B is out of service until Friday. " * 20,
+    "metadata": {"sources": [{"id": f"doc-{i}", "score": 0.9} for i in range(20)]},
+}
+
+def test_large_attributes_round_trip_compressed():
+    compressor = ItemCompressor(min_bytes=256, codec="zlib")
+    stored = compressor.encode(ITEM)
+
+    assert "content" not in stored and "metadata" not in stored
+    assert stored["content_codec"] == stored["metadata_codec"] == ZLIB_V1
+    assert len(stored["content_z"]) < len(ITEM["content"])
+    assert ItemCompressor.decode(stored) == ITEM
+    assert "content_z" not in ITEM
+
+def test_small_and_incompressible_values_are_stored_as_they_are():
+    compressor = ItemCompressor(min_bytes=256, codec="zlib")
+    small = {**ITEM, "content": "Thanks!", "metadata": None}
+    assert compressor.encode(small) is small
+
+    # Too short and varied for zlib's framing to pay off
+    incompressible = {"content": "abcdefghijklmnopqrstuvwxyz0123456789"}
+    assert ItemCompressor(min_bytes=16, codec="zlib").encode(incompressible) is incompressible
+
+def test_disabled_compression_passes_items_through():
+    assert ItemCompressor(min_bytes=0).encode(ITEM) is ITEM
+
+def test_decode_accepts_deserialized_binary_attributes():
+    stored = ItemCompressor(min_bytes=256, codec="zlib").encode(ITEM)
+    stored["content_z"] = Binary(stored["content_z"])
+    assert ItemCompressor.decode(stored)["content"] == ITEM["content"]
+
+def test_unknown_codec_is_rejected():
+    with pytest.raises(ValueError, match="Unknown compression codec"):
+        decompress_bytes(b"", "lz4/1")
+
+def test_zstd_round_trip():
+    pytest.importorskip("zstandard")
+    compressor = ItemCompressor(min_bytes=256, codec="zstd")
+    stored = compressor.encode(ITEM)
+    assert stored["content_codec"] == ZSTD_V1
+    assert ItemCompressor.decode(stored) == ITEM
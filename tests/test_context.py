@@ -0,0 +1,87 @@
+import asyncio
+import pytest
+from app.ai.context import MESSAGE_TOKEN_OVERHEAD, ConversationWindow
+
+class FakeLLMService:
+    def __init__(self):
+        self.prompts = []
+
+    async def generate_response(self, messages, system_prompt=None, organization_id=None, use_cache=True):
+        self.prompts.append(messages[0]["content"])
+        return f"summary {len(self.prompts)}"
+
+@pytest.fixture(autouse=True)
+def word_tokens(monkeypatch):
+    # One token per word, so each message below costs 1 + MESSAGE_TOKEN_OVERHEAD
+    monkeypatch.setattr("app.ai.context.count_tokens", lambda text, model: len(text.split()))
+
+def _messages(count, timestamps=False):
+    messages = [{"role": "user" if i % 2 == 0 else "assistant", "content": f"m{i}"} for i in range(count)]
+    if timestamps:
+        for i, message in enumerate(messages):
+            message["timestamp"] = f"2024-01-01T00:00:{i:02d}"
+    return messages
+
+COST = 1 + MESSAGE_TOKEN_OVERHEAD
+
+def test_history_within_budget_is_sent_verbatim():
+    llm = FakeLLMService()
+    window = ConversationWindow(llm, max_tokens=4 * COST)
+    state = {}
+
+    recent, summary = asyncio.run(window.build(_messages(4), state))
+    assert len(recent) == 4
+    assert summary is None and state == {} and llm.prompts == []
+
+def test_over_budget_trims_to_the_low_water_mark_and_summarizes_the_rest():
+    llm = FakeLLMService()
+    window = ConversationWindow(llm, max_tokens=4 * COST, low_water_ratio=0.5)
+    state = {}
+    messages = _messages(5)
+
+    recent, summary = asyncio.run(window.build(messages, state))
+    assert recent == messages[3:]
+    assert summary == "summary 1"
+    assert state["summarized_count"] == 3
+    assert "user: m0\nassistant: m1\nuser: m2" in llm.prompts[0]
+
+    # The next turn fits again, so the summary is not refreshed
+    messages.append({"role": "assistant", "content": "m5"})
+    recent, summary = asyncio.run(window.build(messages, state))
+    assert recent == messages[3:]
+    assert summary == "summary 1"
+    assert len(llm.prompts) == 1
+
+def test_refresh_folds_only_newly_evicted_turns_into_the_summary():
+    llm = FakeLLMService()
+    window = ConversationWindow(llm, max_tokens=4 * COST, low_water_ratio=0.5)
+    state = {}
+    messages = _messages(5)
+    asyncio.run(window.build(messages, state))
+
+    messages.extend(_messages(8)[5:])
+    recent, summary = asyncio.run(window.build(messages, state))
+    assert recent == messages[6:]
+    assert summary == "summary 2"
+    assert "Existing summary:\nsummary 1" in llm.prompts[1]
+    assert "m2" not in llm.prompts[1] and "assistant: m3\nuser: m4\nassistant: m5" in llm.prompts[1]
+
+def test_timestamps_let_callers_pass_a_recent_slice():
+    llm = FakeLLMService()
+    window = ConversationWindow(llm, max_tokens=4 * COST, low_water_ratio=0.5)
+    state = {}
+    history = _messages(5, timestamps=True)
+    asyncio.run(window.build(history, state))
+    assert state["summarized_until"] == history[2]["timestamp"]
+
+    recent, summary = asyncio.run(window.build(history[1:], state))
+    assert recent == history[3:]
+    assert len(llm.prompts) == 1
+
+def test_newest_message_is_kept_even_if_it_alone_exceeds_the_budget():
+    llm = FakeLLMService()
+    window = ConversationWindow(llm, max_tokens=COST)
+    messages = _messages(1) + [{"role": "assistant", "content": "a long reply " * 5}]
+
+    recent, _ = asyncio.run(window.build(messages, {}))
+    assert recent == messages[1:]
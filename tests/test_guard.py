@@ -0,0 +1,79 @@
+import asyncio
+import pytest
+from app.ai.guard import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, OpenAIGuard
+
+def test_circuit_opens_after_consecutive_failures(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr("app.ai.guard.time.monotonic", lambda: clock[0])
+    breaker = CircuitBreaker("chat", failure_threshold=2, reset_timeout=30.0)
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+    clock[0] += 30.0
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    # Only one trial call is let through while half-open
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED and breaker.allow()
+
+def test_failed_trial_reopens_the_circuit(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr("app.ai.guard.time.monotonic", lambda: clock[0])
+    breaker = CircuitBreaker("chat", failure_threshold=1, reset_timeout=10.0)
+    breaker.record_failure()
+    clock[0] = 10.0
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+def test_open_circuit_fails_fast():
+    guard = OpenAIGuard(failure_threshold=1, reset_timeout=60.0, hedge_enabled=False)
+
+    async def fail():
+        raise RuntimeError("upstream down")
+
+    async def run():
+        with pytest.raises(RuntimeError):
+            await guard.call("chat", fail)
+        with pytest.raises(CircuitOpenError):
+            await guard.call("chat", fail)
+
+    asyncio.run(run())
+
+def test_tenant_limit_applies_and_idle_tenants_are_dropped():
+    guard = OpenAIGuard(tenant_max_in_flight=1, hedge_enabled=False)
+    active = []
+    peak = []
+
+    async def work():
+        active.append(1)
+        peak.append(len(active))
+        await asyncio.sleep(0)
+        active.pop()
+        return "ok"
+
+    async def run():
+        return await asyncio.gather(*(guard.call("chat", work, organization_id="o1") for _ in range(3)))
+
+    assert asyncio.run(run()) == ["ok"] * 3
+    assert max(peak) == 1
+    assert guard._tenant_limits == {} and guard._tenant_users == {}
+
+def test_slow_call_is_hedged():
+    guard = OpenAIGuard(hedge_enabled=True, hedge_min_delay=0.01)
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        # The first attempt hangs; the hedge answers
+        await asyncio.sleep(10 if len(attempts) == 1 else 0)
+        return len(attempts)
+
+    result = asyncio.run(asyncio.wait_for(guard.call("embeddings", call), timeout=5))
+    assert result == 2
+    assert len(attempts) == 2
@@ -0,0 +1,108 @@
+import asyncio
+import json
+from app.ai.guard import CircuitOpenError
+from app.ai.llm import LLMService, parse_analysis
+
+class FakeGenerator:
+    """generate_response stand-in that garbles batches larger than max_items."""
+
+    def __init__(self, max_items: int):
+        self.max_items = max_items
+        self.calls = []
+        self.in_flight = 0
+        self.peak = 0
+
+    async def __call__(self, messages, system_prompt=None, organization_id=None, validate=None, **kwargs):
+        items = json.loads(messages[0]["content"])
+        self.calls.append([item["index"] for item in items])
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(0)
+            if len(items) > self.max_items:
+                text = "not json"
+            else:
+                text = json.dumps([{"index": item["index"], "sentiment": "neutral"} for item in items])
+            if validate is not None:
+                validate(text)
+            return text
+        finally:
+            self.in_flight -= 1
+
+def _service(generate_response) -> LLMService:
+    # Only generate_response is used by _analyze_packed; skip the clients
+    service = LLMService.__new__(LLMService)
+    service.generate_response = generate_response
+    return service
+
+def test_malformed_batches_are_split_until_they_succeed():
+    generator = FakeGenerator(max_items=2)
+    texts = [f"message {i}" for i in range(8)]
+
+    async def run():
+        return await _service(generator)._analyze_packed(texts, list(range(8)), asyncio.Semaphore(1))
+
+    results = asyncio.run(run())
+    assert sorted(results) == list(range(8))
+    assert all(result["sentiment"] == "neutral" for result in results.values())
+    assert generator.calls[0] == list(range(8))
+    assert len(generator.calls) == 7  # 8, then 4 + 4, then four batches of 2
+
+def test_split_retries_stay_within_the_semaphore():
+    generator = FakeGenerator(max_items=1)
+    texts = [f"message {i}" for i in range(16)]
+
+    async def run():
+        semaphore = asyncio.Semaphore(2)
+        return await asyncio.gather(
+            _service(generator)._analyze_packed(texts, list(range(8)), semaphore),
+            _service(generator)._analyze_packed(texts, list(range(8, 16)), semaphore)
+        )
+
+    asyncio.run(run())
+    assert generator.peak <= 2
+
+def test_single_message_that_keeps_failing_gets_an_error():
+    generator = FakeGenerator(max_items=0)
+
+    results = asyncio.run(_service(generator)._analyze_packed(["hello"], [0], asyncio.Semaphore(1)))
+    assert results == {0: {"index": 0, "error": "analysis failed"}}
+
+def test_open_circuit_becomes_per_message_errors():
+    async def circuit_open(*args, **kwargs):
+        raise CircuitOpenError("OpenAI chat circuit is open")
+
+    results = asyncio.run(_service(circuit_open)._analyze_packed(["a", "b"], [0, 1], asyncio.Semaphore(1)))
+    assert results == {
+        0: {"index": 0, "error": "analysis unavailable"},
+        1: {"index": 1, "error": "analysis unavailable"},
+    }
+
+def test_malformed_item_fails_only_its_own_message():
+    calls = []
+
+    async def generator(messages, system_prompt=None, organization_id=None, validate=None, **kwargs):
+        items = json.loads(messages[0]["content"])
+        calls.append(len(items))
+        return json.dumps([
+            {"index": item["index"], "sentiment": "positive", "confidence": 1,
+             "entities": [{"type": "person"}] if item["index"] == 2 else [{"type": "person", "value": "Ana"}]}
+            for item in items
+        ])
+
+    results = asyncio.run(_service(generator)._analyze_packed(list("abcd"), [0, 1, 2, 3], asyncio.Semaphore(1)))
+    assert results[2] == {"index": 2, "error": "analysis failed"}
+    assert results[0] == {
+        "index": 0, "sentiment": "positive", "confidence": 1.0,
+        "key_emotions": [], "entities": [{"type": "person", "value": "Ana"}]
+    }
+    assert sorted(results) == [0, 1, 2, 3]
+    assert calls == [4, 2, 2, 1, 1]
+
+def test_parse_analysis_rejects_wrong_types():
+    for item in ({"index": 0, "sentiment": 3}, {"index": 0, "confidence": "high"}, {"index": 0, "key_emotions": "joy"}):
+        try:
+            parse_analysis(item)
+        except TypeError:
+            continue
+        raise AssertionError(f"{item} was accepted")
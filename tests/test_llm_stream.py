@@ -0,0 +1,70 @@
+import asyncio
+from types import SimpleNamespace
+from app.ai.guard import OpenAIGuard
+from app.ai.llm import LLMService
+from app.ai.router import RouteDecision
+
+class FakeChatModel:
+    def __init__(self, deltas, error=None):
+        self.deltas = deltas
+        self.error = error
+
+    async def astream(self, messages):
+        for delta in self.deltas:
+            await asyncio.sleep(0)
+            yield SimpleNamespace(content=delta)
+        if self.error is not None:
+            raise self.error
+
+class FakeAccountant:
+    def count_prompt_tokens(self, messages, system_prompt, model):
+        return 0
+
+    def record_completion(self, organization_id, prompt_tokens, completion_tokens):
+        pass
+
+def _service(chat_model, guard) -> LLMService:
+    service = LLMService.__new__(LLMService)
+    service.guard = guard
+    service.accountant = FakeAccountant()
+    service._get_llm = lambda model: chat_model
+    service._format_messages = lambda messages, system_prompt: messages
+    return service
+
+ROUTE = RouteDecision(model="gpt-3.5-turbo", tier="fast", reason="test")
+
+def test_slot_is_released_while_the_caller_is_still_consuming(monkeypatch):
+    monkeypatch.setattr("app.ai.llm.count_tokens", lambda text, model: len(text.split()))
+    guard = OpenAIGuard(max_in_flight=1, hedge_enabled=False)
+    service = _service(FakeChatModel(["Hello", " there", "."]), guard)
+
+    async def run():
+        stream = service.stream_response([{"role": "user", "content": "hi"}], route=ROUTE)
+        first = await stream.__anext__()
+        # The caller is busy delivering the first delta; OpenAI keeps being read
+        for _ in range(10):
+            await asyncio.sleep(0)
+        in_flight = guard.in_flight
+        rest = [delta async for delta in stream]
+        return first, in_flight, rest
+
+    first, in_flight, rest = asyncio.run(run())
+    assert first == "Hello"
+    assert in_flight == 0
+    assert rest == [" there", "."]
+
+def test_stream_errors_reach_the_caller_after_the_delivered_deltas(monkeypatch):
+    monkeypatch.setattr("app.ai.llm.count_tokens", lambda text, model: len(text.split()))
+    guard = OpenAIGuard(hedge_enabled=False)
+    service = _service(FakeChatModel(["Hello"], error=RuntimeError("reset")), guard)
+
+    async def run():
+        received = []
+        try:
+            async for delta in service.stream_response([{"role": "user", "content": "hi"}], route=ROUTE):
+                received.append(delta)
+        except RuntimeError as e:
+            return received, str(e)
+
+    assert asyncio.run(run()) == (["Hello"], "reset")
+    assert guard.breaker("chat").failures == 1
@@ -0,0 +1,39 @@
+import logging
+import pytest
+from app.core.logging import SamplingFilter, TextFormatter, parse_sample_rates
+
+def _record(name: str, level: int = logging.INFO) -> logging.LogRecord:
+    return logging.LogRecord(name, level, __file__, 1, "message", None, None)
+
+def test_parse_sample_rates_clamps_and_skips_malformed_items():
+    assert parse_sample_rates("uvicorn.access=0.1, app.api = 2 ,bad,") == {"uvicorn.access": 0.1, "app.api": 1.0}
+    assert parse_sample_rates(None) == {}
+
+def test_most_specific_logger_rate_wins(monkeypatch):
+    monkeypatch.setattr("app.core.logging.random.random", lambda: 0.5)
+    sampling = SamplingFilter({"app": 0.0, "app.api": 1.0})
+    assert sampling.filter(_record("app.api.v1.conversations"))
+    assert not sampling.filter(_record("app.db"))
+    assert not sampling.filter(_record("app"))
+    # A shared prefix that is not a parent logger does not match
+    assert sampling.filter(_record("application"))
+
+@pytest.mark.parametrize("random_value, kept", [(0.24, True), (0.25, False)])
+def test_records_are_kept_at_the_configured_rate(monkeypatch, random_value, kept):
+    monkeypatch.setattr("app.core.logging.random.random", lambda: random_value)
+    assert SamplingFilter({"uvicorn.access": 0.25}).filter(_record("uvicorn.access")) is kept
+
+def test_warnings_are_never_sampled(monkeypatch):
+    monkeypatch.setattr("app.core.logging.random.random", lambda: 0.99)
+    sampling = SamplingFilter({"app": 0.0})
+    assert sampling.filter(_record("app", logging.WARNING))
+    assert sampling.filter(_record("app", logging.ERROR))
+    assert not sampling.filter(_record("app", logging.DEBUG))
+
+def test_text_format_keeps_extra_fields():
+    record = _record("app.api")
+    record.request_id = "r1"
+    record.org_id = "o1"
+    line = TextFormatter().format(record)
+    assert "[r1] message" in line
+    assert line.endswith("org_id=o1")
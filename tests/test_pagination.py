@@ -0,0 +1,34 @@
+import uuid
+from datetime import datetime, timezone
+import pytest
+from app.db.postgresql.models import KnowledgeBase
+from app.db.postgresql.pagination import decode_cursor, encode_cursor, sort_key
+
+BY_CREATED = (KnowledgeBase.created_at, KnowledgeBase.id)
+BY_NAME = (KnowledgeBase.name, KnowledgeBase.id)
+
+def test_cursor_round_trip_restores_column_types():
+    values = [datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc), uuid.uuid4()]
+    cursor = encode_cursor(values, BY_CREATED, descending=True)
+    assert decode_cursor(cursor, BY_CREATED, descending=True) == values
+
+def test_cursor_keeps_null_values():
+    values = [None, uuid.uuid4()]
+    cursor = encode_cursor(values, BY_CREATED)
+    assert decode_cursor(cursor, BY_CREATED) == values
+
+@pytest.mark.parametrize("columns, descending", [(BY_NAME, True), (BY_CREATED, False)])
+def test_cursor_from_another_sort_is_rejected(columns, descending):
+    cursor = encode_cursor([datetime(2024, 5, 1, tzinfo=timezone.utc), uuid.uuid4()], BY_CREATED, descending=True)
+    with pytest.raises(ValueError, match="different sort"):
+        decode_cursor(cursor, columns, descending=descending)
+
+@pytest.mark.parametrize("cursor", ["", "not base64!", "W10=", "eyJzb3J0IjpbXX0="])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        decode_cursor(cursor, BY_CREATED)
+
+def test_sort_key_rejects_nullable_columns():
+    assert sort_key(*BY_CREATED) == BY_CREATED
+    with pytest.raises(TypeError, match="description"):
+        sort_key(KnowledgeBase.description, KnowledgeBase.id)
@@ -0,0 +1,32 @@
+import zlib
+from app.core.prometheus import TenantLabels, current_tenant
+
+def test_missing_tenant_is_labelled_none():
+    labels = TenantLabels(buckets=4)
+    assert labels() == "none"
+    assert labels("") == "none"
+
+def test_tenants_are_hashed_into_a_fixed_set_of_buckets():
+    labels = TenantLabels(buckets=4)
+    assignments = {labels(f"org-{i}") for i in range(200)}
+    assert assignments == {"bucket-00", "bucket-01", "bucket-02", "bucket-03"}
+
+def test_bucket_depends_only_on_the_tenant():
+    # Independent of which tenants were seen before, and of the process
+    assert TenantLabels(buckets=8)("org-1") == f"bucket-{zlib.crc32(b'org-1') % 8:02d}"
+    assert TenantLabels(buckets=8)("org-1") == TenantLabels(buckets=8)("org-1")
+
+def test_allowlisted_tenants_keep_their_own_label():
+    labels = TenantLabels(buckets=4, allowlist=" a, b ,")
+    assert labels("a") == "a"
+    assert labels("b") == "b"
+    assert labels("c").startswith("bucket-")
+
+def test_tenant_falls_back_to_the_request_context():
+    labels = TenantLabels(buckets=4, allowlist="a,b")
+    token = current_tenant.set("a")
+    try:
+        assert labels() == "a"
+        assert labels("b") == "b"
+    finally:
+        current_tenant.reset(token)
@@ -0,0 +1,36 @@
+import pytest
+from app.core.rate_limit import GCRALimiter, RateLimit, RateLimiter
+
+def test_burst_then_sustained_rate():
+    limiter = GCRALimiter()
+    limit = RateLimit(rate=60, burst=2)  # one request per second, two extra back to back
+    decisions = [limiter.check("k", limit, now=100.0) for _ in range(4)]
+    assert [d.allowed for d in decisions] == [True, True, True, False]
+    assert decisions[3].retry_after == pytest.approx(1.0)
+    assert limiter.check("k", limit, now=101.0).allowed
+    assert not limiter.check("k", limit, now=101.0).allowed
+
+def test_keys_are_limited_independently():
+    limiter = GCRALimiter()
+    limit = RateLimit(rate=60, burst=0)
+    assert limiter.check("a", limit, now=0.0).allowed
+    assert not limiter.check("a", limit, now=0.5).allowed
+    assert limiter.check("b", limit, now=0.5).allowed
+
+def test_least_recently_used_keys_are_dropped():
+    limiter = GCRALimiter(max_keys=2)
+    limit = RateLimit(rate=60, burst=0)
+    for key in ("a", "b", "c"):
+        limiter.check(key, limit, now=0.0)
+    assert list(limiter._tats) == ["b", "c"]
+
+@pytest.mark.parametrize("rate, burst, period", [(0, 1, 60.0), (-5, 1, 60.0), (10, -1, 60.0), (10, 1, 0.0)])
+def test_invalid_limits_are_rejected(rate, burst, period):
+    with pytest.raises(ValueError):
+        RateLimit(rate, burst, period)
+
+def test_invalid_organization_override_falls_back_to_the_default():
+    default = RateLimiter.limits(None, "phone")
+    limit = RateLimiter.limits({"rate_limits": {"phone_per_minute": 0}}, "phone")
+    assert (limit.rate, limit.burst) == (default.rate, default.burst)
+    assert RateLimiter.limits({"rate_limits": {"phone_per_minute": 7}}, "phone").rate == 7
@@ -0,0 +1,47 @@
+import asyncio
+import time
+from app.db.dynamodb.retention import LocalArchiveStore, MessageArchiver
+
+class FakeMessageTable:
+    """Scan stand-in that applies the archiver's expiry window."""
+
+    def __init__(self, items):
+        self.items = items
+
+    async def scan(self, **kwargs):
+        values = kwargs["ExpressionAttributeValues"]
+        return {"Items": [item for item in self.items if values[":start"] <= item["expires_at"] < values[":end"]]}
+
+class FakeDynamoDB:
+    def __init__(self, items):
+        self.message_table = FakeMessageTable(items)
+
+def _message(second: int, expires_at: int):
+    return {
+        "conversation_id": "c1",
+        "timestamp": f"2026-01-01T00:00:{second:02d}",
+        "content": "hello",
+        "expires_at": expires_at,
+        "metadata": {"organization_id": "o1"},
+    }
+
+def test_only_the_target_expiry_day_is_archived(tmp_path):
+    in_two_days = int(time.time()) + 2 * 86400
+    items = [_message(1, in_two_days), _message(2, int(time.time()) - 3600), _message(3, in_two_days + 3 * 86400)]
+    archiver = MessageArchiver(FakeDynamoDB(items), LocalArchiveStore(str(tmp_path)))
+
+    assert asyncio.run(archiver.archive_expiring(lead_days=2, total_segments=1)) == 1
+    archived = asyncio.run(archiver.load("o1", "c1"))
+    assert [message["timestamp"] for message in archived] == ["2026-01-01T00:00:01"]
+
+def test_a_later_partial_export_does_not_replace_the_archive(tmp_path):
+    in_one_day = int(time.time()) + 86400
+    items = [_message(second, in_one_day) for second in range(3)]
+    store = LocalArchiveStore(str(tmp_path))
+    asyncio.run(MessageArchiver(FakeDynamoDB(items), store).archive_expiring(lead_days=1, total_segments=1))
+
+    # Only one of the day's messages is left when the export runs again
+    archiver = MessageArchiver(FakeDynamoDB(items[1:2]), store)
+    asyncio.run(archiver.archive_expiring(lead_days=1, total_segments=1))
+    archived = asyncio.run(archiver.load("o1", "c1"))
+    assert [message["timestamp"] for message in archived] == [f"2026-01-01T00:00:0{n}" for n in range(3)]
@@ -0,0 +1,37 @@
+import pytest
+from app.ai.router import FAST_TIER, STRONG_TIER, ModelRouter, RoutingRules
+
+RULES = RoutingRules({
+    "enabled": True,
+    "fast_model": "fast-model",
+    "strong_model": "strong-model",
+    "min_retrieval_score": 0.8,
+    "max_fast_query_tokens": 10,
+})
+
+@pytest.fixture(autouse=True)
+def word_tokens(monkeypatch):
+    monkeypatch.setattr("app.ai.router.count_tokens", lambda text, model: len(text.split()))
+
+@pytest.mark.parametrize("query, score, expected", [
+    ("Hi!", None, (FAST_TIER, "fast-model", "small talk")),
+    ("thank you so much", None, (FAST_TIER, "fast-model", "small talk")),
+    ("When is the gym open?", 0.9, (FAST_TIER, "fast-model", "answer in retrieved context")),
+    ("When is the gym open?", 0.5, (STRONG_TIER, "strong-model", "default")),
+    ("When is the gym open?", None, (STRONG_TIER, "strong-model", "default")),
+    ("Why was I charged twice?", 0.95, (STRONG_TIER, "strong-model", "reasoning keyword")),
+    ("one two three four five six seven eight nine ten eleven", 0.95, (STRONG_TIER, "strong-model", "long query")),
+])
+def test_route(query, score, expected):
+    assert tuple(ModelRouter().route(query, score, RULES)) == expected
+
+def test_disabled_routing_always_uses_the_strong_model():
+    rules = RoutingRules({"enabled": False, "strong_model": "strong-model"})
+    assert ModelRouter().route("hi", 1.0, rules) == (STRONG_TIER, "strong-model", "routing disabled")
+
+def test_organization_overrides_apply_on_top_of_the_defaults():
+    rules = RoutingRules.for_organization({"model_routing": {"strong_keywords": ["parking"], "enabled": True}})
+    assert rules.strong_keywords == ["parking"]
+    assert rules.max_fast_query_tokens == RoutingRules().max_fast_query_tokens
+    assert ModelRouter().route("Where is parking?", 1.0, rules).reason == "reasoning keyword"
+    assert RoutingRules.for_organization(None).strong_keywords == RoutingRules().strong_keywords
@@ -0,0 +1,38 @@
+import pytest
+from app.db.postgresql.whatsapp_import import normalize_phone_number, validate_row
+
+@pytest.mark.parametrize("value, expected", [
+    ("+44 7700 900123", "447700900123"),
+    ("0044 7700-900123", "447700900123"),
+    ("(212) 555.0100 1", "21255501001"),
+    ("447700900123", "447700900123"),
+    (447700900123, "447700900123"),
+])
+def test_normalize_phone_number(value, expected):
+    assert normalize_phone_number(value) == expected
+
+@pytest.mark.parametrize("value", [None, "", "+", "07700900123", "1234567", "1234567890123456", "+44 7700 9001x3"])
+def test_normalize_phone_number_rejects_invalid(value):
+    with pytest.raises(ValueError, match="invalid phone number"):
+        normalize_phone_number(value)
+
+def test_validate_row_defaults():
+    assert validate_row(2, {"phone_number": "+447700900123"}) == (2, "447700900123", True, None)
+
+def test_validate_row_parses_flags_and_settings():
+    row = {"phone_number": "447700900123", "is_active": " No ", "settings": '{"language": "en"}'}
+    assert validate_row(3, row) == (3, "447700900123", False, '{"language":"en"}')
+
+def test_validate_row_accepts_json_values():
+    row = {"phone_number": "447700900123", "is_active": False, "settings": {"language": "en"}}
+    assert validate_row(4, row) == (4, "447700900123", False, '{"language":"en"}')
+
+@pytest.mark.parametrize("row, reason", [
+    ({"phone_number": "447700900123", "is_active": "maybe"}, "invalid is_active"),
+    ({"phone_number": "447700900123", "settings": "{"}, "settings is not valid JSON"),
+    ({"phone_number": "447700900123", "settings": "[1]"}, "settings must be an object"),
+    ({"is_active": "true"}, "invalid phone number"),
+])
+def test_validate_row_reports_the_problem(row, reason):
+    with pytest.raises(ValueError, match=reason):
+        validate_row(5, row)
@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import queue
+from botocore.exceptions import ClientError
+from app.core.logging import NonBlockingQueueHandler, request_id
+from app.core.prometheus import current_tenant
+from app.db.dynamodb.write_buffer import WriteBuffer
+
+def _client_error(code: str) -> ClientError:
+    return ClientError({"Error": {"Code": code, "Message": code}}, "BatchWriteItem")
+
+class FakeDynamoClient:
+    """Fails the first batch_write_item, then accepts everything."""
+
+    def __init__(self):
+        self.calls = []
+
+    async def call(self, operation, tenant=None, **kwargs):
+        self.calls.append((request_id.get(), current_tenant.get(), tenant))
+        if len(self.calls) == 1:
+            raise _client_error("ThrottlingException")
+        return {}
+
+def _item(n: int, organization_id: str = "o1"):
+    return {"conversation_id": "c1", "timestamp": f"{n:04d}", "metadata": {"organization_id": organization_id}}
+
+def test_flusher_does_not_inherit_the_starting_requests_context():
+    records: "queue.Queue[logging.LogRecord]" = queue.Queue()
+    handler = NonBlockingQueueHandler(records)
+    buffer_logger = logging.getLogger("app.db.dynamodb.write_buffer")
+    buffer_logger.addHandler(handler)
+    client = FakeDynamoClient()
+
+    async def run():
+        buffer = WriteBuffer(client, "messages", ("conversation_id", "timestamp"), flush_interval=0.01)
+        # The first write of a worker's lifetime starts the flusher from a request
+        request_id.set("first-request")
+        current_tenant.set("o2")
+        for n in range(3):
+            buffer.add(_item(n))
+        while len(client.calls) < 2:
+            await asyncio.sleep(0.01)
+        await buffer.close()
+
+    try:
+        asyncio.run(run())
+    finally:
+        buffer_logger.removeHandler(handler)
+
+    assert client.calls[0] == (None, None, "o1")
+    # The failure was logged from the flusher, not as part of the first request
+    failure = records.get_nowait()
+    assert failure.levelno == logging.ERROR
+    assert failure.request_id is None
+
+def test_mixed_organization_batches_are_not_attributed_to_either():
+    assert WriteBuffer._tenant([_item(1, "o1"), _item(2, "o2")]) is None
+    assert WriteBuffer._tenant([_item(1, "o1"), _item(2, "o1")]) == "o1"
+
+class RejectingDynamoClient:
+    """Rejects any batch containing a timestamp in bad; throttles the first throttled calls."""
+
+    def __init__(self, bad=(), throttled=0):
+        self.bad = set(bad)
+        self.throttled = throttled
+        self.written = []
+
+    async def call(self, operation, tenant=None, **kwargs):
+        requests = next(iter(kwargs["RequestItems"].values()))
+        timestamps = [request["PutRequest"]["Item"]["timestamp"]["S"] for request in requests]
+        if self.throttled:
+            self.throttled -= 1
+            raise _client_error("ProvisionedThroughputExceededException")
+        if self.bad & set(timestamps):
+            raise _client_error("ValidationException")
+        self.written.extend(timestamps)
+        return {}
+
+def _buffer(client, **kwargs) -> WriteBuffer:
+    return WriteBuffer(client, "messages", ("conversation_id", "timestamp"), flush_interval=60, **kwargs)
+
+def test_rejected_item_is_split_out_and_dropped():
+    client = RejectingDynamoClient(bad={"0005"})
+
+    async def run():
+        buffer = _buffer(client)
+        for n in range(8):
+            buffer.add(_item(n))
+        await buffer.flush()
+        return buffer
+
+    buffer = asyncio.run(run())
+    assert sorted(client.written) == [f"{n:04d}" for n in range(8) if n != 5]
+    assert not buffer._queue and not buffer.pending_items("c1")
+
+def test_throttled_item_is_dropped_after_max_requeues(monkeypatch):
+    monkeypatch.setattr("app.db.dynamodb.write_buffer.MAX_REQUEUE_DELAY", 0)
+    client = RejectingDynamoClient(throttled=10)
+
+    async def run():
+        buffer = _buffer(client, max_requeues=2)
+        buffer.add(_item(1))
+        for _ in range(3):
+            await buffer.flush()
+        return buffer
+
+    buffer = asyncio.run(run())
+    assert client.throttled == 7
+    assert client.written == []
+    assert not buffer._queue and not buffer.pending_items("c1")
+
+def test_throttled_batch_is_written_once_throttling_stops(monkeypatch):
+    monkeypatch.setattr("app.db.dynamodb.write_buffer.MAX_REQUEUE_DELAY", 0)
+    client = RejectingDynamoClient(throttled=2)
+
+    async def run():
+        buffer = _buffer(client)
+        buffer.add(_item(1))
+        for _ in range(3):
+            await buffer.flush()
+
+    asyncio.run(run())
+    assert client.written == ["0001"]